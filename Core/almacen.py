@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import datetime
+import threading
+
+from Core.instrumentacion import registrar_cache
+
+# Incrementar para invalidar todos los resultados guardados con versiones
+# anteriores (p. ej. al cambiar fórmulas, filtros o reductores).
+VERSION = 2
+
+RUTA_ALMACEN = os.getenv("LANDSAT_ALMACEN") or os.path.join(
+    os.path.expanduser("~"), ".cache", "landsat_uchumayo", "resultados.sqlite"
+)
+
+# Los resultados del año en curso cambian al llegar nuevas escenas
+TTL_ANIO_ACTUAL = 6 * 3600
+
+_local = threading.local()
+
+
+def _conexion():
+    """Conexión SQLite por hilo; el archivo se comparte entre procesos"""
+    con = getattr(_local, "con", None)
+    if con is None:
+        os.makedirs(os.path.dirname(RUTA_ALMACEN), exist_ok=True)
+        con = sqlite3.connect(RUTA_ALMACEN, timeout=30)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS resultados (
+                tipo TEXT NOT NULL,
+                indice TEXT NOT NULL,
+                anio INTEGER NOT NULL,
+                coleccion TEXT NOT NULL,
+                nubes REAL NOT NULL,
+                escala REAL NOT NULL,
+                geometria TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                valor TEXT NOT NULL,
+                creado REAL NOT NULL,
+                expira REAL,
+                PRIMARY KEY (tipo, indice, anio, coleccion, nubes, escala,
+                             geometria, version)
+            )
+            """
+        )
+        _local.con = con
+    return con
+
+
+def coleccion_anio(anio):
+    """Colección Landsat usada para un año dado"""
+    if anio <= 2011:
+        return "LANDSAT/LE07/C02/T1_L2"
+    return "LANDSAT/LC08/C02/T1_L2"
+
+
+def huella_geometria(geojson):
+    """
+    Hash estable de las coordenadas de la zona de estudio (GeoJSON): si se
+    edita el asset, cambian la huella y todas las claves del almacén
+    """
+    return hashlib.sha256(
+        json.dumps(geojson, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+def es_historico(anio):
+    return anio < datetime.date.today().year
+
+
+def leer(tipo, indice, anio, geometria, nubes=20, escala=30):
+    """Devuelve el resultado guardado o None si no existe o ha expirado"""
+    fila = _conexion().execute(
+        """
+        SELECT valor, expira FROM resultados
+        WHERE tipo = ? AND indice = ? AND anio = ? AND coleccion = ?
+          AND nubes = ? AND escala = ? AND geometria = ? AND version = ?
+        """,
+        (tipo, indice, anio, coleccion_anio(anio), nubes, escala,
+         geometria, VERSION),
+    ).fetchone()
+
+    if fila is None:
+        registrar_cache(f"almacen:{tipo}", False)
+        return None
+    valor, expira = fila
+    if expira is not None and expira < time.time():
+        registrar_cache(f"almacen:{tipo}", False)
+        return None
+    registrar_cache(f"almacen:{tipo}", True)
+    return json.loads(valor)
+
+
+def guardar(tipo, indice, anio, geometria, valor, nubes=20, escala=30, ttl=None):
+    """Guarda un resultado; los años históricos no expiran salvo ttl explícito"""
+    ahora = time.time()
+    if ttl is not None:
+        expira = ahora + ttl
+    else:
+        expira = None if es_historico(anio) else ahora + TTL_ANIO_ACTUAL
+    con = _conexion()
+    with con:
+        con.execute(
+            """
+            INSERT OR REPLACE INTO resultados
+            (tipo, indice, anio, coleccion, nubes, escala, geometria,
+             version, valor, creado, expira)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (tipo, indice, anio, coleccion_anio(anio), nubes, escala,
+             geometria, VERSION, json.dumps(valor), ahora, expira),
+        )
+
+
+def invalidar(tipo=None):
+    """Elimina resultados de versiones antiguas (o todos los de un tipo)"""
+    con = _conexion()
+    with con:
+        if tipo is None:
+            con.execute("DELETE FROM resultados WHERE version != ?", (VERSION,))
+        else:
+            con.execute("DELETE FROM resultados WHERE tipo = ?", (tipo,))
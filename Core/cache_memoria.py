@@ -0,0 +1,152 @@
+"""
+Caché en memoria acotado para los resultados de Core.datos.
+
+Sustituye a st.cache_data, que no tiene límite: las entradas de todas las
+funciones comparten un presupuesto de bytes (LANDSAT_CACHE_MB) y, al
+superarlo, se expulsan las usadas hace más tiempo (LRU). El tamaño de
+cada entrada se mide al guardarla (pickle). Las entradas caducan según
+los años que cubren: los históricos duran TTL_HISTORICO y las que
+incluyen el año en curso, cuyo compuesto cambia al llegar nuevas
+escenas, solo TTL_ANIO_ACTUAL.
+
+Los valores se comparten entre sesiones (no se copian): no deben
+modificarse.
+"""
+import os
+import time
+import pickle
+import inspect
+import functools
+import threading
+from collections import OrderedDict, defaultdict
+
+from Core import almacen, vuelo_unico
+from Core.instrumentacion import registrar_cache
+
+PRESUPUESTO = int(float(os.getenv("LANDSAT_CACHE_MB", "256")) * 2 ** 20)
+TTL_HISTORICO = 24 * 3600
+TTL_ANIO_ACTUAL = 15 * 60
+
+_cerrojo = threading.Lock()
+_entradas = OrderedDict()
+_ocupado = {"bytes": 0}
+# Aciertos y fallos se registran en Core.instrumentacion
+_contadores = defaultdict(lambda: {"expulsiones": 0, "caducadas": 0})
+
+
+def tamano(valor):
+    """Bytes aproximados de un valor (tamaño serializado)"""
+    try:
+        return len(pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+def ttl_anios(anios):
+    """TTL corto si alguno de los años es el año en curso"""
+    if any(not almacen.es_historico(anio) for anio in anios):
+        return TTL_ANIO_ACTUAL
+    return TTL_HISTORICO
+
+
+def _quitar(clave):
+    _, nbytes, _ = _entradas.pop(clave)
+    _ocupado["bytes"] -= nbytes
+
+
+def _leer(clave):
+    """(encontrado, valor)"""
+    nombre = clave[0]
+    with _cerrojo:
+        entrada = _entradas.get(clave)
+        if entrada is not None and entrada[2] < time.time():
+            _quitar(clave)
+            _contadores[nombre]["caducadas"] += 1
+            entrada = None
+
+        if entrada is None:
+            return False, None
+
+        _entradas.move_to_end(clave)
+        return True, entrada[0]
+
+
+def _guardar(clave, valor, ttl):
+    nbytes = tamano(valor)
+    # Una entrada mayor que todo el presupuesto no se guarda
+    if nbytes > PRESUPUESTO:
+        return
+
+    with _cerrojo:
+        if clave in _entradas:
+            _quitar(clave)
+        _entradas[clave] = (valor, nbytes, time.time() + ttl)
+        _ocupado["bytes"] += nbytes
+
+        while _ocupado["bytes"] > PRESUPUESTO:
+            antigua = next(iter(_entradas))
+            _quitar(antigua)
+            _contadores[antigua[0]]["expulsiones"] += 1
+
+
+def cacheado(anios=None):
+    """
+    Decorador de caché acotado.
+
+    anios: función que recibe los argumentos de la llamada (dict nombre ->
+    valor, con los valores por defecto aplicados) y devuelve los años que
+    cubre el resultado, para elegir su TTL.
+    """
+    def decorador(fn):
+        firma = inspect.signature(fn)
+        nombre = fn.__name__
+
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            ligados = firma.bind(*args, **kwargs)
+            ligados.apply_defaults()
+            clave = (nombre, tuple(ligados.arguments.items()))
+
+            encontrado, valor = _leer(clave)
+            registrar_cache(f"memoria:{nombre}", encontrado)
+            if encontrado:
+                return valor
+
+            # Sesiones simultáneas con la misma clave calculan una sola vez
+            valor = vuelo_unico.compartir(("memoria",) + clave, fn, *args, **kwargs)
+            ttl = ttl_anios(anios(ligados.arguments)) if anios else TTL_HISTORICO
+            _guardar(clave, valor, ttl)
+            return valor
+
+        envoltura.clear = lambda: limpiar(nombre)
+        return envoltura
+
+    return decorador
+
+
+def limpiar(nombre=None):
+    """Vacía la caché (toda, o solo la de una función)"""
+    with _cerrojo:
+        for clave in list(_entradas):
+            if nombre is None or clave[0] == nombre:
+                _quitar(clave)
+
+
+def estado():
+    """Bytes ocupados, presupuesto, entradas y expulsiones por función"""
+    with _cerrojo:
+        por_funcion = {
+            k: {"entradas": 0, "bytes": 0, **v} for k, v in _contadores.items()
+        }
+        for clave, (_, nbytes, _) in _entradas.items():
+            funcion = por_funcion.setdefault(
+                clave[0], {"entradas": 0, "bytes": 0, "expulsiones": 0, "caducadas": 0}
+            )
+            funcion["entradas"] += 1
+            funcion["bytes"] += nbytes
+        return {
+            "bytes": _ocupado["bytes"],
+            "presupuesto": PRESUPUESTO,
+            "entradas": len(_entradas),
+            "funciones": por_funcion,
+        }
@@ -0,0 +1,281 @@
+"""
+Catálogo local de las escenas Landsat de la zona de estudio.
+
+Guarda en SQLite los metadatos de cada escena que cubre la zona (ID,
+fecha, sensor, nubosidad y huella) para responder sin GEE qué años tienen
+escenas, qué escenas entran en el compuesto de un año y cuántas hay.
+
+La sincronización es incremental: por colección solo se piden las
+escenas adquiridas desde la última sincronización, con un margen de
+SOLAPE_DIAS porque GEE publica escenas con fecha de adquisición anterior
+a su ingesta. Las peticiones van por ventanas de VENTANA_ANIOS años para
+no superar el límite de elementos de un getInfo.
+
+Uso:
+    python -m Core.catalogo
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import datetime
+import threading
+
+import ee
+
+from Core import almacen
+from Core.instrumentacion import llamada_ee
+
+RUTA_CATALOGO = os.getenv("LANDSAT_CATALOGO") or os.path.join(
+    os.path.dirname(almacen.RUTA_ALMACEN), "catalogo.sqlite"
+)
+NUBES = 20
+SOLAPE_DIAS = 30
+VENTANA_ANIOS = 5
+# Antigüedad tras la que el año en curso deja de considerarse al día
+ANTIGUEDAD_MAXIMA = 24 * 3600
+
+_local = threading.local()
+
+
+def _conexion():
+    """Conexión SQLite por hilo, como en Core.almacen"""
+    con = getattr(_local, "con", None)
+    if con is None:
+        os.makedirs(os.path.dirname(RUTA_CATALOGO), exist_ok=True)
+        con = sqlite3.connect(RUTA_CATALOGO, timeout=30)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS escenas (
+                id TEXT NOT NULL,
+                zona TEXT NOT NULL,
+                coleccion TEXT NOT NULL,
+                sensor TEXT NOT NULL,
+                fecha TEXT NOT NULL,
+                anio INTEGER NOT NULL,
+                nubes REAL,
+                huella TEXT,
+                PRIMARY KEY (id, zona)
+            )
+            """
+        )
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS escenas_anio ON escenas (zona, coleccion, anio)"
+        )
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sincronizaciones (
+                coleccion TEXT NOT NULL,
+                zona TEXT NOT NULL,
+                desde REAL NOT NULL,
+                hasta REAL NOT NULL,
+                actualizado REAL NOT NULL,
+                PRIMARY KEY (coleccion, zona)
+            )
+            """
+        )
+        _local.con = con
+    return con
+
+
+def _segundos(fecha):
+    return datetime.datetime(
+        fecha.year, fecha.month, fecha.day, tzinfo=datetime.timezone.utc
+    ).timestamp()
+
+
+def _fecha(segundos):
+    return datetime.datetime.fromtimestamp(segundos, datetime.timezone.utc).date()
+
+
+# ===============================
+# SINCRONIZACIÓN
+# ===============================
+def _pedir_escenas(coleccion, inicio, fin, geometria):
+    """Metadatos de las escenas adquiridas en [inicio, fin) sobre la geometría"""
+    escenas = ee.ImageCollection(coleccion).filterDate(
+        inicio.isoformat(), fin.isoformat()
+    ).filterBounds(geometria)
+
+    fc = ee.FeatureCollection(escenas.map(
+        lambda img: ee.Feature(img.geometry(), {
+            "id": img.get("system:index"),
+            "fecha": img.get("system:time_start"),
+            "nubes": img.get("CLOUD_COVER"),
+        })
+    ))
+    return llamada_ee(
+        "catalogo", (coleccion, inicio.isoformat(), fin.isoformat()), fc.getInfo
+    )["features"]
+
+
+def sincronizar(sensores, geometria, zona, hoy=None):
+    """
+    Trae las escenas nuevas de cada colección.
+
+    sensores: (colección, primer año, último año) de cada sensor.
+    geometria: geometría de filtrado (ee.Geometry); zona: su huella.
+    Devuelve {colección: escenas recibidas}.
+    """
+    hoy = hoy or datetime.datetime.now(datetime.timezone.utc).date()
+    manana = hoy + datetime.timedelta(days=1)
+    con = _conexion()
+    recibidas = {}
+
+    for coleccion, primero, ultimo in sensores:
+        inicio = datetime.date(primero, 1, 1)
+        fin = min(manana, datetime.date(min(ultimo, 9998) + 1, 1, 1))
+        if inicio >= fin:
+            continue
+
+        fila = con.execute(
+            "SELECT desde, hasta FROM sincronizaciones WHERE coleccion = ? AND zona = ?",
+            (coleccion, zona),
+        ).fetchone()
+        if fila is not None and _fecha(fila[0]) <= inicio:
+            # Ya sincronizada hasta el final del periodo del sensor
+            if _fecha(fila[1]) >= fin:
+                with con:
+                    con.execute(
+                        "UPDATE sincronizaciones SET actualizado = ? WHERE coleccion = ? AND zona = ?",
+                        (time.time(), coleccion, zona),
+                    )
+                recibidas[coleccion] = 0
+                continue
+            inicio = max(inicio, _fecha(fila[1]) - datetime.timedelta(days=SOLAPE_DIAS))
+
+        sensor = coleccion.split("/")[1]
+        recibidas[coleccion] = 0
+        ventana = inicio
+        while ventana < fin:
+            siguiente = min(fin, datetime.date(ventana.year + VENTANA_ANIOS, 1, 1))
+            features = _pedir_escenas(coleccion, ventana, siguiente, geometria)
+
+            filas = []
+            for f in features:
+                props = f["properties"]
+                adquirida = datetime.datetime.fromtimestamp(
+                    props["fecha"] / 1000, datetime.timezone.utc
+                )
+                filas.append((
+                    f"{coleccion}/{props['id']}", zona, coleccion, sensor,
+                    adquirida.date().isoformat(), adquirida.year,
+                    props.get("nubes"), json.dumps(f.get("geometry")),
+                ))
+
+            # Cada ventana se confirma por separado: una sincronización
+            # interrumpida se reanuda desde la última ventana completa
+            with con:
+                con.executemany(
+                    "INSERT OR REPLACE INTO escenas VALUES (?, ?, ?, ?, ?, ?, ?, ?)", filas
+                )
+                desde = min(_segundos(datetime.date(primero, 1, 1)),
+                            fila[0] if fila is not None else float("inf"))
+                con.execute(
+                    "INSERT OR REPLACE INTO sincronizaciones VALUES (?, ?, ?, ?, ?)",
+                    (coleccion, zona, desde, _segundos(siguiente), time.time()),
+                )
+            recibidas[coleccion] += len(filas)
+            ventana = siguiente
+
+    return recibidas
+
+
+def necesita_sincronizar(zona):
+    """Nunca sincronizado o más antiguo que ANTIGUEDAD_MAXIMA"""
+    fila = _conexion().execute(
+        "SELECT MIN(actualizado) FROM sincronizaciones WHERE zona = ?", (zona,)
+    ).fetchone()
+    return fila[0] is None or fila[0] < time.time() - ANTIGUEDAD_MAXIMA
+
+
+def vaciar():
+    con = _conexion()
+    with con:
+        con.execute("DELETE FROM escenas")
+        con.execute("DELETE FROM sincronizaciones")
+
+
+# ===============================
+# CONSULTAS
+# ===============================
+def cubierto(anio, zona):
+    """Si el catálogo conoce todas las escenas del año (colección del año)"""
+    fila = _conexion().execute(
+        "SELECT desde, hasta, actualizado FROM sincronizaciones WHERE coleccion = ? AND zona = ?",
+        (almacen.coleccion_anio(anio), zona),
+    ).fetchone()
+    if fila is None:
+        return False
+    desde, hasta, actualizado = fila
+    if _fecha(desde) > datetime.date(anio, 1, 1):
+        return False
+    if _fecha(hasta) > datetime.date(anio, 12, 31):
+        return True
+    # Año en curso: vale mientras la sincronización sea reciente
+    return (not almacen.es_historico(anio)
+            and actualizado >= time.time() - ANTIGUEDAD_MAXIMA)
+
+
+def escenas(anio, zona, nubes=NUBES):
+    """
+    IDs (ordenados) de las escenas del año bajo el umbral de nubes, o
+    None si el catálogo no cubre el año
+    """
+    if not cubierto(anio, zona):
+        return None
+    filas = _conexion().execute(
+        """
+        SELECT id FROM escenas
+        WHERE zona = ? AND coleccion = ? AND anio = ? AND nubes < ?
+        ORDER BY id
+        """,
+        (zona, almacen.coleccion_anio(anio), anio, nubes),
+    ).fetchall()
+    return tuple(f[0] for f in filas)
+
+
+def sin_escenas(anio, zona, nubes=NUBES):
+    """True solo si el catálogo cubre el año y no tiene escenas útiles"""
+    return escenas(anio, zona, nubes) == ()
+
+
+def disponibilidad(zona, inicio, fin, nubes=NUBES):
+    """
+    {año: {"escenas", "utiles", "sensor"}} de los años cubiertos por el
+    catálogo (los no cubiertos no aparecen).
+    """
+    resultado = {}
+    for anio in range(inicio, fin + 1):
+        if not cubierto(anio, zona):
+            continue
+        coleccion = almacen.coleccion_anio(anio)
+        total, utiles = _conexion().execute(
+            """
+            SELECT COUNT(*), COALESCE(SUM(nubes < ?), 0) FROM escenas
+            WHERE zona = ? AND coleccion = ? AND anio = ?
+            """,
+            (nubes, zona, coleccion, anio),
+        ).fetchone()
+        resultado[anio] = {
+            "escenas": total,
+            "utiles": utiles,
+            "sensor": coleccion.split("/")[1],
+        }
+    return resultado
+
+
+def main(argv=None):
+    # Core.datos se importa aquí: define los sensores y la zona de estudio
+    from Core import datos
+    from Core.gee_init import inicializar_gee
+
+    inicializar_gee()
+    print(json.dumps(datos.sincronizar_catalogo(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
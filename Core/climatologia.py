@@ -0,0 +1,153 @@
+"""
+Climatología por píxel de los índices a partir de los compuestos locales.
+
+Para cada índice se calculan, una sola vez, la media y la desviación
+estándar (poblacional, como ee.Reducer.stdDev) de cada píxel a lo largo
+de los años INICIO–FIN. El cálculo recorre los compuestos por bloques de
+filas acumulando con Welford, de modo que nunca hay más de un bloque por
+año en memoria. El resultado se guarda como memmap [2, filas, columnas]
+(media, desviación) junto a un JSON con los años usados.
+
+Con la climatología en disco, la anomalía z de cualquier año es una sola
+operación sobre el ráster del índice: (x - media) / desviación.
+"""
+import os
+import json
+import tempfile
+
+import numpy as np
+
+from Core import almacen, compuestos_locales
+from Core.indices_np import FILAS_BLOQUE, calcular_indice_np
+
+INICIO = 2000
+FIN = 2025
+MIN_ANIOS = 10
+
+DIRECTORIO = os.path.join(compuestos_locales.DIRECTORIO, "climatologia")
+
+
+def _rutas(indice):
+    base = os.path.join(DIRECTORIO, indice)
+    return base + ".npy", base + ".json"
+
+
+def _leer_meta(indice):
+    _, ruta_meta = _rutas(indice)
+    if not os.path.exists(ruta_meta):
+        return None
+    with open(ruta_meta) as f:
+        return json.load(f)
+
+
+def _temporal(ruta, sufijo):
+    """Temporal único junto a `ruta`: varios procesos pueden calcular a la vez"""
+    descriptor, temporal = tempfile.mkstemp(
+        dir=os.path.dirname(ruta), prefix=os.path.basename(ruta) + ".", suffix=sufijo
+    )
+    os.close(descriptor)
+    return temporal
+
+
+def _calcular(compuestos, indice, temporal, filas, columnas, filas_bloque):
+    salida = np.lib.format.open_memmap(
+        temporal, mode="w+", dtype=np.float32, shape=(2, filas, columnas)
+    )
+
+    for f0 in range(0, filas, filas_bloque):
+        f1 = min(f0 + filas_bloque, filas)
+        n = np.zeros((f1 - f0, columnas), dtype=np.int32)
+        media = np.zeros((f1 - f0, columnas), dtype=np.float64)
+        m2 = np.zeros((f1 - f0, columnas), dtype=np.float64)
+
+        for datos, meta in compuestos.values():
+            bloque = {b: datos[i, f0:f1] for i, b in enumerate(meta["bandas"])}
+            x = calcular_indice_np(bloque, indice).astype(np.float64)
+            validos = ~np.isnan(x)
+            x = np.where(validos, x, 0.0)
+
+            n += validos
+            delta = np.where(validos, x - media, 0.0)
+            media += delta / np.maximum(n, 1)
+            m2 += delta * np.where(validos, x - media, 0.0)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            salida[0, f0:f1] = np.where(n > 0, media, np.nan)
+            salida[1, f0:f1] = np.where(n > 1, np.sqrt(m2 / n), np.nan)
+
+    salida.flush()
+    del salida
+
+
+def calcular_climatologia(indice, inicio=INICIO, fin=FIN, filas_bloque=FILAS_BLOQUE):
+    """
+    Calcula y guarda la climatología de un índice con los compuestos
+    locales disponibles. Devuelve los metadatos, o None si hay menos de
+    MIN_ANIOS compuestos.
+    """
+    compuestos = {}
+    for anio in range(inicio, fin + 1):
+        abierto = compuestos_locales.abrir_compuesto(anio)
+        if abierto is not None:
+            compuestos[anio] = abierto
+
+    # Todos los compuestos comparten la rejilla de la zona de estudio; se
+    # descartan los que no coincidan con la del compuesto más reciente
+    if compuestos:
+        forma = compuestos[max(compuestos)][0].shape[1:]
+        compuestos = {a: c for a, c in compuestos.items() if c[0].shape[1:] == forma}
+
+    if len(compuestos) < MIN_ANIOS:
+        return None
+
+    os.makedirs(DIRECTORIO, exist_ok=True)
+    ruta_npy, ruta_meta = _rutas(indice)
+    temporal = _temporal(ruta_npy, ".tmp.npy")
+    filas, columnas = forma
+    try:
+        _calcular(compuestos, indice, temporal, filas, columnas, filas_bloque)
+        os.replace(temporal, ruta_npy)
+    except BaseException:
+        os.remove(temporal)
+        raise
+
+    meta_compuesto = compuestos[max(compuestos)][1]
+    meta = {
+        "indice": indice,
+        "version": almacen.VERSION,
+        "anios": sorted(compuestos),
+        "transformada": meta_compuesto["transformada"],
+        "limites": meta_compuesto["limites"],
+        "filas": filas,
+        "columnas": columnas,
+    }
+    temporal = _temporal(ruta_meta, ".tmp")
+    try:
+        with open(temporal, "w") as f:
+            json.dump(meta, f)
+        os.replace(temporal, ruta_meta)
+    except BaseException:
+        os.remove(temporal)
+        raise
+    return meta
+
+
+def climatologia_disponible(indice):
+    meta = _leer_meta(indice)
+    return meta is not None and meta.get("version") == almacen.VERSION
+
+
+def abrir_climatologia(indice):
+    """(memmap de solo lectura [media/desviación, fila, columna], metadatos) o None"""
+    if not climatologia_disponible(indice):
+        return None
+    ruta_npy, _ = _rutas(indice)
+    return np.load(ruta_npy, mmap_mode="r"), _leer_meta(indice)
+
+
+def anomalia_np(valores, media, desviacion):
+    """Anomalía estandarizada z; NaN donde no hay datos o la desviación es 0"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (valores - media) / desviacion
+    z[~np.isfinite(z)] = np.nan
+    return z.astype(np.float32, copy=False)
@@ -0,0 +1,271 @@
+"""
+Caché local de compuestos anuales Landsat.
+
+Cada compuesto (6 bandas) se descarga una sola vez desde GEE mediante
+peticiones de píxeles por teselas (ee.data.computePixels) y se guarda
+como arreglo NumPy mapeado en memoria (.npy, float32, NaN = sin datos)
+junto a un JSON con la georreferenciación. Las lecturas posteriores son
+vistas sobre el memmap: sin copia y sin acceso a la red.
+"""
+import os
+import json
+import uuid
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import ee
+import numpy as np
+
+from Core import almacen, planificador
+from Core.instrumentacion import llamada_ee
+from Core.indices_np import BANDAS
+
+DIRECTORIO = os.getenv("LANDSAT_COMPUESTOS") or os.path.join(
+    os.path.dirname(almacen.RUTA_ALMACEN), "compuestos"
+)
+
+CRS = "EPSG:4326"
+RESOLUCION = 30 / 111320  # ~30 m expresados en grados
+TESELA = 512
+NODATA = -9999
+HILOS_DESCARGA = 4
+
+_descargas = {}
+_sellos = {}
+_cerrojo = threading.Lock()
+_ejecutor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="compuestos")
+
+
+def _rutas(anio):
+    base = os.path.join(DIRECTORIO, str(anio))
+    return base + ".npy", base + ".json"
+
+
+def _leer_meta(anio):
+    _, ruta_meta = _rutas(anio)
+    if not os.path.exists(ruta_meta):
+        return None
+    with open(ruta_meta) as f:
+        return json.load(f)
+
+
+def _escribir_meta(anio, meta):
+    # Temporal único: varios procesos (o hilos) pueden escribir el mismo año
+    _, ruta_meta = _rutas(anio)
+    descriptor, temporal = tempfile.mkstemp(
+        dir=os.path.dirname(ruta_meta), prefix=os.path.basename(ruta_meta) + ".",
+        suffix=".tmp"
+    )
+    try:
+        with os.fdopen(descriptor, "w") as f:
+            json.dump(meta, f)
+        os.replace(temporal, ruta_meta)
+    except BaseException:
+        os.remove(temporal)
+        raise
+
+
+def rejilla(limites, resolucion=RESOLUCION, tesela=TESELA):
+    """
+    Rejilla de píxeles que cubre unos límites [oeste, sur, este, norte].
+
+    Devuelve (transformada afín, filas, columnas, lista de teselas), donde
+    cada tesela es (fila, columna, alto, ancho) en píxeles.
+    """
+    oeste, sur, este, norte = limites
+    columnas = int(np.ceil((este - oeste) / resolucion))
+    filas = int(np.ceil((norte - sur) / resolucion))
+    transformada = [resolucion, 0, oeste, 0, -resolucion, norte]
+
+    teselas = [
+        (f, c, min(tesela, filas - f), min(tesela, columnas - c))
+        for f in range(0, filas, tesela)
+        for c in range(0, columnas, tesela)
+    ]
+    return transformada, filas, columnas, teselas
+
+
+def grid_tesela(transformada, fila, columna, alto, ancho, crs=CRS):
+    """Parámetro 'grid' de computePixels para una tesela"""
+    sx, _, x0, _, sy, y0 = transformada
+    return {
+        "dimensions": {"width": ancho, "height": alto},
+        "affineTransform": {
+            "scaleX": sx,
+            "shearX": 0,
+            "translateX": x0 + columna * sx,
+            "shearY": 0,
+            "scaleY": sy,
+            "translateY": y0 + fila * sy,
+        },
+        "crsCode": crs,
+    }
+
+
+def limites_geometria(geometria):
+    """[oeste, sur, este, norte] de una geometría de GEE"""
+    anillo = llamada_ee(
+        "limites_geometria", None, geometria.bounds().getInfo
+    )["coordinates"][0]
+    xs = [p[0] for p in anillo]
+    ys = [p[1] for p in anillo]
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+def descargar_compuesto(anio, imagen, geometria, limites=None):
+    """
+    Descarga el compuesto de un año al caché local.
+
+    imagen: compuesto de 6 bandas (BLUE ... SWIR2) sin recortar.
+    La descarga es reanudable: las teselas ya escritas no se repiten.
+    """
+    os.makedirs(DIRECTORIO, exist_ok=True)
+    ruta_npy, _ = _rutas(anio)
+
+    meta = _leer_meta(anio)
+    if meta is not None and meta.get("version") != almacen.VERSION:
+        meta = None
+
+    if meta is None:
+        if limites is None:
+            limites = limites_geometria(geometria)
+        transformada, filas, columnas, _ = rejilla(limites)
+        meta = {
+            "anio": anio,
+            "version": almacen.VERSION,
+            # Distingue cada descarga: los derivados (rásteres de índices,
+            # teselas PNG) se guardan con él y caducan al reescribirse
+            "sello": uuid.uuid4().hex[:12],
+            "crs": CRS,
+            "transformada": transformada,
+            "limites": limites,
+            "filas": filas,
+            "columnas": columnas,
+            "bandas": BANDAS,
+            "coleccion": almacen.coleccion_anio(anio),
+            "teselas_completas": [],
+            "completo": False,
+        }
+        np.lib.format.open_memmap(
+            ruta_npy, mode="w+", dtype=np.float32,
+            shape=(len(BANDAS), filas, columnas)
+        ).flush()
+        _escribir_meta(anio, meta)
+
+    if meta["completo"]:
+        return meta
+
+    _, _, _, teselas = rejilla(meta["limites"])
+    hechas = {tuple(t) for t in meta["teselas_completas"]}
+    pendientes = [t for t in teselas if (t[0], t[1]) not in hechas]
+
+    expresion = (
+        imagen.select(BANDAS)
+        .toFloat()
+        .clip(geometria)
+        .unmask(NODATA)
+    )
+    destino = np.load(ruta_npy, mmap_mode="r+")
+    cerrojo_meta = threading.Lock()
+
+    def descargar(tesela):
+        fila, columna, alto, ancho = tesela
+        # Las descargas ceden el paso a las peticiones de las páginas
+        with planificador.carril(planificador.FONDO):
+            pixeles = llamada_ee("computePixels", (anio, fila, columna), ee.data.computePixels, {
+                "expression": expresion,
+                "fileFormat": "NUMPY_NDARRAY",
+                "grid": grid_tesela(meta["transformada"], fila, columna, alto, ancho),
+                "bandIds": BANDAS,
+            })
+        for i, banda in enumerate(BANDAS):
+            valores = pixeles[banda].astype(np.float32)
+            valores[valores == NODATA] = np.nan
+            destino[i, fila:fila + alto, columna:columna + ancho] = valores
+        with cerrojo_meta:
+            destino.flush()
+            meta["teselas_completas"].append([fila, columna])
+            _escribir_meta(anio, meta)
+
+    with ThreadPoolExecutor(max_workers=HILOS_DESCARGA) as pool:
+        list(pool.map(descargar, pendientes))
+
+    meta["completo"] = True
+    _escribir_meta(anio, meta)
+    return meta
+
+
+def descargar_en_segundo_plano(anio, imagen, geometria, limites=None):
+    """Lanza (una sola vez por proceso y año) la descarga del compuesto"""
+    with _cerrojo:
+        futuro = _descargas.get(anio)
+        if futuro is None or (futuro.done() and futuro.exception() is not None):
+            futuro = _ejecutor.submit(
+                descargar_compuesto, anio, imagen, geometria, limites
+            )
+            _descargas[anio] = futuro
+        return futuro
+
+
+def compuesto_disponible(anio):
+    meta = _leer_meta(anio)
+    return (
+        meta is not None
+        and meta["completo"]
+        and meta.get("version") == almacen.VERSION
+    )
+
+
+def sello_compuesto(anio):
+    """Identificador de la descarga actual del compuesto, o None"""
+    _, ruta_meta = _rutas(anio)
+    try:
+        mtime = os.stat(ruta_meta).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    with _cerrojo:
+        guardado = _sellos.get(anio)
+    if guardado is not None and guardado[0] == mtime:
+        return guardado[1]
+
+    meta = _leer_meta(anio)
+    if meta is None:
+        return None
+    sello = f"v{meta['version']}-{meta.get('sello', '0')}"
+    with _cerrojo:
+        _sellos[anio] = (mtime, sello)
+    return sello
+
+
+def abrir_compuesto(anio):
+    """(memmap de solo lectura [banda, fila, columna], metadatos) o None"""
+    if not compuesto_disponible(anio):
+        return None
+    ruta_npy, _ = _rutas(anio)
+    return np.load(ruta_npy, mmap_mode="r"), _leer_meta(anio)
+
+
+def bandas_compuesto(anio):
+    """dict banda -> vista 2D sin copia, lista para Core.indices_np"""
+    abierto = abrir_compuesto(anio)
+    if abierto is None:
+        return None
+    datos, meta = abierto
+    return {banda: datos[i] for i, banda in enumerate(meta["bandas"])}
+
+
+def leer_ventana(anio, fila_ini, fila_fin, col_ini, col_fin, bandas=None):
+    """Ventana [bandas, filas, columnas] del compuesto, sin copia"""
+    abierto = abrir_compuesto(anio)
+    if abierto is None:
+        return None
+    datos, meta = abierto
+    if bandas is None:
+        return datos[:, fila_ini:fila_fin, col_ini:col_fin]
+    idx = [meta["bandas"].index(b) for b in bandas]
+    # Bandas contiguas -> slice (vista); si no, indexado (copia mínima)
+    if idx == list(range(idx[0], idx[0] + len(idx))):
+        return datos[idx[0]:idx[-1] + 1, fila_ini:fila_fin, col_ini:col_fin]
+    return datos[idx, fila_ini:fila_fin, col_ini:col_fin]
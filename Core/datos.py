@@ -1,107 +1,946 @@
-import ee
-import streamlit as st
-from Core.gee_init import zona_estudio
-from Core.indices import INDICES
-
-
-@st.cache_data(show_spinner=False)
-def obtener_indice(anio, indice):
-
-    if anio <= 2011:
-        coleccion = ee.ImageCollection("LANDSAT/LE07/C02/T1_L2")
-        bandas_origen = ["SR_B1","SR_B2","SR_B3","SR_B4","SR_B5","SR_B7"]
-    else:
-        coleccion = ee.ImageCollection("LANDSAT/LC08/C02/T1_L2")
-        bandas_origen = ["SR_B2","SR_B3","SR_B4","SR_B5","SR_B6","SR_B7"]
-
-    imagen = (
-        coleccion
-        .filterDate(f"{anio}-01-01", f"{anio}-12-31")
-        .filterBounds(zona_estudio)
-        .filter(ee.Filter.lt("CLOUD_COVER", 20))
-        .median()
-        .select(bandas_origen)
-        .rename(["BLUE","GREEN","RED","NIR","SWIR1","SWIR2"])
-        .clip(zona_estudio)
-    )
-
-    # 👉 aquí ya están GARANTIZADAS todas las bandas
-    img_indice = INDICES[indice](imagen).rename(indice)
-
-    return img_indice
-
-
-@st.cache_data(show_spinner=False)
-def estadisticas_indice(anio, indice):
-
-    img = obtener_indice(anio, indice)
-
-    stats = img.reduceRegion(
-        reducer=ee.Reducer.mean()
-            .combine(ee.Reducer.min(), "", True)
-            .combine(ee.Reducer.max(), "", True),
-        geometry=zona_estudio,
-        scale=30,
-        maxPixels=1e9
-    )
-
-    return stats.getInfo()
-
-
-@st.cache_data(show_spinner=False)
-def serie_temporal(indice, inicio=2000, fin=2025):
-
-    def calcular_valor(anio):
-        img = obtener_indice(anio, indice)
-
-        reduccion = img.reduceRegion(
-            reducer=ee.Reducer.mean(),
-            geometry=zona_estudio,
-            scale=30,
-            maxPixels=1e9
-        )
-
-        return ee.Feature(
-            None,
-            {
-                "Año": anio,
-                "Valor": ee.Algorithms.If(
-                    reduccion.contains(indice),
-                    reduccion.get(indice),
-                    None
-                )
-            }
-        )
-
-    fc = ee.FeatureCollection(
-        ee.List.sequence(inicio, fin).map(calcular_valor)
-    )
-
-    datos = fc.getInfo()
-
-    return [
-        {
-            "Año": int(f["properties"]["Año"]),
-            "Valor": f["properties"].get("Valor")
-        }
-        for f in datos["features"]
-    ]
-
-
-def grafico_rango_anios(serie, anios_sel, titulo):
-
-    a_ini, a_fin = min(anios_sel), max(anios_sel)
-
-    anios = []
-    valores = []
-
-    for d in serie:
-        if d["Valor"] is not None and a_ini <= d["Año"] <= a_fin:
-            anios.append(d["Año"])
-            valores.append(d["Valor"])
-
-    if valores:
-        st.subheader(titulo)
-        st.line_chart({str(a): v for a, v in zip(anios, valores)})
-    else:
-        st.warning("No hay datos suficientes para generar el gráfico.")
+import ee
+import time
+import threading
+import numpy as np
+import streamlit as st
+from functools import lru_cache
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from Core import (
+    almacen, catalogo, climatologia, compuestos_locales, mapas, planificador, teselas,
+    vuelo_unico, zonas
+)
+from Core.cache_memoria import cacheado
+from Core.gee_init import zona_estudio_proceso
+from Core.indices import (
+    HISTOGRAMA, INDICES, PERCENTILES, SUFIJO_ANOMALIA, VIS_ANOMALIA, VIS_PARAMS
+)
+from Core.indices_np import calcular_indice_np, distribucion_np, estadisticas_np
+from Core.instrumentacion import llamada_ee
+
+
+ESCALA = 30
+ESCALA_APROXIMADA = 300
+
+
+def _parametros_reduccion(escala):
+
+    # A escala gruesa se permite a GEE relajar la escala si hace falta
+    if escala > ESCALA:
+        return {"scale": escala, "maxPixels": 1e9, "bestEffort": True}
+
+    return {"scale": escala, "maxPixels": 1e9}
+
+
+def zona_estudio():
+
+    # Geometría exacta: recortes y reducciones
+    return zona_estudio_proceso()["exacta"]
+
+
+def zona_filtro():
+
+    # Geometría simplificada: filterBounds con un grafo mínimo
+    return zona_estudio_proceso()["simplificada"]
+
+
+def huella_zona():
+
+    # Hash de las coordenadas de la instantánea, no de la referencia al asset
+    return zona_estudio_proceso()["huella"]
+
+
+BANDAS = ["BLUE","GREEN","RED","NIR","SWIR1","SWIR2"]
+
+# (colección, bandas de origen, primer año, último año)
+SENSORES = [
+    ("LANDSAT/LE07/C02/T1_L2", ["SR_B1","SR_B2","SR_B3","SR_B4","SR_B5","SR_B7"], 2000, 2011),
+    ("LANDSAT/LC08/C02/T1_L2", ["SR_B2","SR_B3","SR_B4","SR_B5","SR_B6","SR_B7"], 2012, 9999),
+]
+
+
+def coleccion_armonizada(inicio, fin):
+
+    # LE07 (hasta 2011) y LC08 (desde 2012) en una sola colección con las
+    # mismas bandas y las propiedades "anio", "mes", "estacion" y
+    # "anio_estacion"
+    partes = []
+
+    for coleccion, bandas_origen, primero, ultimo in SENSORES:
+        a_ini, a_fin = max(inicio, primero), min(fin, ultimo)
+        if a_ini > a_fin:
+            continue
+        partes.append(
+            ee.ImageCollection(coleccion)
+            .filterDate(f"{a_ini}-01-01", f"{a_fin + 1}-01-01")
+            .filterBounds(zona_filtro())
+            .filter(ee.Filter.lt("CLOUD_COVER", catalogo.NUBES))
+            .select(bandas_origen, BANDAS)
+        )
+
+    if not partes:
+        return ee.ImageCollection([])
+
+    armonizada = partes[0]
+    for parte in partes[1:]:
+        armonizada = armonizada.merge(parte)
+
+    def etiquetar(img):
+        fecha = ee.Date(img.get("system:time_start"))
+        mes = fecha.get("month")
+        return img.set({
+            "anio": fecha.get("year"),
+            "mes": mes,
+            # 1 = dic-feb, 2 = mar-may, 3 = jun-ago, 4 = sep-nov
+            "estacion": ee.Number(mes).mod(12).divide(3).floor().add(1),
+            # Diciembre abre el verano (dic-feb) del año siguiente
+            "anio_estacion": ee.Number(fecha.get("year")).add(ee.Number(mes).eq(12)),
+        })
+
+    return armonizada.map(etiquetar)
+
+
+# ===============================
+# CATÁLOGO DE ESCENAS
+# ===============================
+_ejecutor_catalogo = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalogo")
+_sincronizacion = {}
+_cerrojo_catalogo = threading.Lock()
+
+
+def sincronizar_catalogo():
+
+    # Solo las escenas nuevas de cada sensor desde la última sincronización
+    return catalogo.sincronizar(
+        [(coleccion, primero, ultimo) for coleccion, _, primero, ultimo in SENSORES],
+        zona_filtro(), huella_zona()
+    )
+
+
+def sincronizar_catalogo_en_segundo_plano():
+
+    # Como mucho una sincronización a la vez, y solo si el catálogo es viejo
+    def tarea():
+        with planificador.carril(planificador.FONDO):
+            return sincronizar_catalogo()
+
+    with _cerrojo_catalogo:
+        futuro = _sincronizacion.get("futuro")
+        if (futuro is None or futuro.done()) and catalogo.necesita_sincronizar(huella_zona()):
+            futuro = _ejecutor_catalogo.submit(tarea)
+            _sincronizacion["futuro"] = futuro
+        return futuro
+
+
+def escenas_anio(anio):
+
+    # IDs de las escenas del compuesto según el catálogo local; None si el
+    # catálogo aún no cubre el año
+    return catalogo.escenas(anio, huella_zona())
+
+
+def sin_escenas(anio):
+
+    # Año sin escenas útiles según el catálogo: no hace falta preguntar a GEE
+    return catalogo.sin_escenas(anio, huella_zona())
+
+
+def disponibilidad_escenas(inicio=2000, fin=2025):
+
+    return catalogo.disponibilidad(huella_zona(), inicio, fin)
+
+
+# Los grafos de GEE se construyen localmente y sin coste de red: se
+# guardan una sola vez por proceso (sin copias por página ni pickling),
+# con un máximo de entradas para que la memoria no crezca sin límite.
+# La clave incluye las escenas del catálogo: al llegar escenas nuevas el
+# grafo se reconstruye.
+def obtener_compuesto(anio):
+
+    return _compuesto(anio, escenas_anio(anio))
+
+
+@lru_cache(maxsize=64)
+def _compuesto(anio, escenas):
+
+    if not escenas:
+        return coleccion_armonizada(anio, anio).median()
+
+    # Con catálogo, el compuesto se construye con la lista explícita de
+    # escenas: sin filterDate, filterBounds ni filtro de nubes en GEE
+    coleccion = almacen.coleccion_anio(anio)
+    bandas_origen = next(b for c, b, _, _ in SENSORES if c == coleccion)
+    return ee.ImageCollection(
+        [ee.Image(ident) for ident in escenas]
+    ).select(bandas_origen, BANDAS).median()
+
+
+def obtener_indice(anio, indice):
+
+    return _indice(anio, indice, escenas_anio(anio))
+
+
+@lru_cache(maxsize=256)
+def _indice(anio, indice, escenas):
+
+    imagen = _compuesto(anio, escenas)
+
+    # 👉 aquí ya están GARANTIZADAS todas las bandas
+    img_indice = INDICES[indice](imagen).rename(indice).clip(zona_estudio())
+
+    return img_indice
+
+
+def _reduccion_compuesto(imagen, indices, escala):
+
+    # Todos los índices como bandas: una sola reducción por año
+    multi = ee.Image.cat(
+        [INDICES[nombre](imagen).rename(nombre) for nombre in indices]
+    ).clip(zona_estudio())
+
+    return multi.reduceRegion(
+        reducer=ee.Reducer.mean()
+            .combine(ee.Reducer.min(), "", True)
+            .combine(ee.Reducer.max(), "", True)
+            .combine(ee.Reducer.stdDev(), "", True),
+        geometry=zona_estudio(),
+        **_parametros_reduccion(escala)
+    )
+
+
+def _por_anio(anios, calcular):
+    """
+    ee.List con calcular(compuesto, anio) para cada año con escenas.
+
+    Los años con escenas en el catálogo usan obtener_compuesto (por IDs,
+    como las capas); el resto solo entra si tiene escenas en GEE: un año
+    vacío daría un compuesto sin bandas y haría fallar todo el lote.
+    """
+    con_catalogo = [a for a in anios if escenas_anio(a)]
+    resto = [a for a in anios if a not in con_catalogo]
+
+    resultados = ee.List([calcular(obtener_compuesto(a), a) for a in con_catalogo])
+    if not resto:
+        return resultados
+
+    coleccion = coleccion_armonizada(min(resto), max(resto)).filter(
+        ee.Filter.inList("anio", resto)
+    )
+    anios_con_escenas = ee.List(coleccion.aggregate_array("anio")).distinct()
+    return resultados.cat(anios_con_escenas.map(
+        lambda anio: calcular(coleccion.filter(ee.Filter.eq("anio", anio)).median(), anio)
+    ))
+
+
+def _lote_estadisticas(anios, indices, escala):
+
+    def calcular(compuesto, anio):
+        return ee.Feature(
+            None, _reduccion_compuesto(compuesto, indices, escala)
+        ).set("Año", anio)
+
+    return ee.FeatureCollection(_por_anio(anios, calcular))
+
+
+def estadisticas_locales(anio, indices=tuple(INDICES)):
+
+    # Desde el compuesto cacheado en disco, sin acceso a GEE
+    bandas = compuestos_locales.bandas_compuesto(anio)
+
+    if bandas is None:
+        return None
+
+    stats = {}
+    for nombre in indices:
+        stats.update(estadisticas_np(calcular_indice_np(bandas, nombre), nombre))
+
+    return stats
+
+
+@cacheado(anios=lambda a: [a["anio"]])
+def estadisticas_anio(anio):
+
+    return estadisticas_anios((anio,))[anio]
+
+
+@cacheado(anios=lambda a: a["anios"])
+def estadisticas_anios(anios, indices=tuple(INDICES), escala=ESCALA):
+
+    # Un Feature por año con la reducción de todos los índices; los años
+    # sin escenas se guardan vacíos
+    return _lote_anual(
+        "estadisticas", ",".join(indices), anios, escala,
+        lote=lambda anios: _lote_estadisticas(anios, indices, escala),
+        local=lambda anio: estadisticas_locales(anio, indices),
+    )
+
+
+def _propiedades(filas):
+
+    # Un Feature por año: sus propiedades tal cual
+    return filas[0] if filas else {}
+
+
+def _lote_anual(tipo, clave, anios, escala, lote, local, compactar=_propiedades,
+                anios_por_lote=None):
+    """
+    Resultados por año de una reducción: almacén, compuesto local o GEE.
+
+    lote(anios) construye la FeatureCollection (Features con la propiedad
+    "Año") que se pide a GEE con un único getInfo, local(anio) calcula el
+    año sobre el compuesto en disco (o None) y compactar(filas) da la forma
+    en que se guardan las propiedades de los Features de cada año. Con
+    anios_por_lote, los años se piden en varios lotes de ese tamaño.
+    """
+    resultado = {}
+    faltantes = []
+
+    for anio in anios:
+        guardado = almacen.leer(tipo, clave, anio, huella_zona(), escala=escala)
+        if guardado is None:
+            guardado = local(anio)
+        if guardado is None and sin_escenas(anio):
+            # Sin escenas según el catálogo: resultado vacío sin ir a GEE
+            guardado = compactar([])
+        if guardado is None:
+            faltantes.append(anio)
+        else:
+            resultado[anio] = guardado
+
+    if not faltantes:
+        return resultado
+
+    # Cada año pendiente es un vuelo compartido entre sesiones: los que ya
+    # está calculando otra sesión se esperan y el resto va en un solo lote
+    def clave_vuelo(anio):
+        return (tipo, clave, anio, escala, huella_zona())
+
+    propios = []
+    ajenos = {}
+    for anio in faltantes:
+        futuro, lider = vuelo_unico.iniciar(clave_vuelo(anio))
+        if lider:
+            propios.append(anio)
+        else:
+            ajenos[anio] = futuro
+
+    if propios:
+        paso = anios_por_lote or len(propios)
+        try:
+            calculado = {}
+            for i in range(0, len(propios), paso):
+                calculado.update(
+                    _lote_gee(tipo, clave, propios[i:i + paso], escala, lote, compactar)
+                )
+        except BaseException as e:
+            for anio in propios:
+                vuelo_unico.terminar(clave_vuelo(anio), error=e)
+            raise
+        for anio in propios:
+            vuelo_unico.terminar(clave_vuelo(anio), calculado.get(anio))
+        resultado.update(calculado)
+
+    for anio, futuro in ajenos.items():
+        resultado[anio] = vuelo_unico.esperar(futuro)
+
+    return resultado
+
+
+def _lote_gee(tipo, clave, anios, escala, lote, compactar):
+
+    datos = llamada_ee(
+        f"{tipo}_anios", (clave, tuple(anios), escala), lote(anios).getInfo
+    )
+
+    devueltos = defaultdict(list)
+    for f in datos["features"]:
+        props = dict(f["properties"])
+        devueltos[int(props.pop("Año"))].append(props)
+
+    # Los años sin escenas no vienen en la respuesta: se guardan vacíos
+    # para no volver a pedirlos
+    resultado = {}
+    for anio in anios:
+        valor = compactar(devueltos.get(anio, []))
+        almacen.guardar(tipo, clave, anio, huella_zona(), valor, escala=escala)
+        resultado[anio] = valor
+
+    return resultado
+
+
+def estadisticas_indice(anio, indice, stats_anio=None):
+
+    # Servido desde el diccionario cacheado del año, sin nueva petición
+    stats = stats_anio if stats_anio is not None else estadisticas_anio(anio)
+
+    return {k: v for k, v in stats.items() if k.startswith(indice + "_")}
+
+
+# ===============================
+# DISTRIBUCIÓN POR AÑO
+# ===============================
+
+def reductor_distribucion():
+
+    # Percentiles, media, desviación, píxeles válidos e histograma fijo en
+    # una sola pasada
+    return (
+        ee.Reducer.percentile(PERCENTILES)
+            .combine(ee.Reducer.mean(), "", True)
+            .combine(ee.Reducer.stdDev(), "", True)
+            .combine(ee.Reducer.count(), "", True)
+            .combine(
+                ee.Reducer.fixedHistogram(
+                    HISTOGRAMA["min"], HISTOGRAMA["max"], HISTOGRAMA["bins"]
+                ),
+                "", True
+            )
+    )
+
+
+def _lote_distribucion(indice, anios, escala):
+
+    zona = zona_estudio()
+
+    def calcular(compuesto, anio):
+        red = INDICES[indice](compuesto).rename(indice).clip(zona).reduceRegion(
+            reducer=reductor_distribucion(),
+            geometry=zona,
+            **_parametros_reduccion(escala)
+        )
+        return ee.Feature(None, red).set("Año", anio)
+
+    return ee.FeatureCollection(_por_anio(anios, calcular))
+
+
+def compactar_distribucion(props, indice):
+
+    # Del diccionario de GEE solo se guardan los valores, sin los límites
+    # de cada bin (son fijos, HISTOGRAMA). Los conteos quedan como float:
+    # reduceRegion pondera los píxeles del borde y truncarlos haría que el
+    # histograma no sumara el total
+    histograma = props.get(f"{indice}_histogram")
+    distribucion = {
+        "count": int(props.get(f"{indice}_count") or 0),
+        "mean": props.get(f"{indice}_mean"),
+        "stdDev": props.get(f"{indice}_stdDev"),
+        "hist": [float(fila[1]) for fila in histograma] if histograma else None,
+    }
+    for p in PERCENTILES:
+        distribucion[f"p{p}"] = props.get(f"{indice}_p{p}")
+    return distribucion
+
+
+def distribucion_local(anio, indice):
+
+    # Desde el compuesto cacheado en disco, sin acceso a GEE
+    bandas = compuestos_locales.bandas_compuesto(anio)
+
+    if bandas is None:
+        return None
+
+    return distribucion_np(
+        calcular_indice_np(bandas, indice),
+        HISTOGRAMA["min"], HISTOGRAMA["max"], HISTOGRAMA["bins"], PERCENTILES
+    )
+
+
+@cacheado(anios=lambda a: a["anios"])
+def distribucion_anios(indice, anios, escala=ESCALA):
+
+    return _lote_anual(
+        "distribucion", indice, anios, escala,
+        lote=lambda anios: _lote_distribucion(indice, anios, escala),
+        local=lambda anio: distribucion_local(anio, indice),
+        compactar=lambda filas: compactar_distribucion(_propiedades(filas), indice),
+    )
+
+
+def bordes_histograma():
+    """Límites de los bins de HISTOGRAMA (bins + 1 valores)"""
+    ancho = (HISTOGRAMA["max"] - HISTOGRAMA["min"]) / HISTOGRAMA["bins"]
+    return [HISTOGRAMA["min"] + i * ancho for i in range(HISTOGRAMA["bins"] + 1)]
+
+
+# ===============================
+# ESTADÍSTICAS POR ZONA
+# ===============================
+# Límite de elementos de una colección en un getInfo de GEE
+MAX_FEATURES_LOTE = 5000
+
+
+def reductor_zonas():
+
+    return (
+        ee.Reducer.mean()
+            .combine(ee.Reducer.min(), "", True)
+            .combine(ee.Reducer.max(), "", True)
+            .combine(ee.Reducer.stdDev(), "", True)
+            .combine(ee.Reducer.count(), "", True)
+    )
+
+
+def _lote_zonas(conjunto, indice, anios, escala):
+
+    # Un reduceRegions por año con todas las zonas; los resultados de
+    # todos los años se aplanan en una sola colección, sin geometrías
+    zona = zona_estudio()
+    fc_zonas = ee.FeatureCollection([
+        ee.Feature(ee.Geometry(z["geometry"]), {"zona": z["nombre"]})
+        for z in conjunto["zonas"]
+    ])
+
+    def calcular(compuesto, anio):
+        reducidas = INDICES[indice](compuesto).rename(indice).clip(zona).reduceRegions(
+            collection=fc_zonas,
+            reducer=reductor_zonas(),
+            scale=escala,
+        )
+        return reducidas.map(
+            lambda f: ee.Feature(None, f.toDictionary()).set("Año", anio)
+        )
+
+    return ee.FeatureCollection(_por_anio(anios, calcular)).flatten()
+
+
+def compactar_zonas(filas):
+
+    # zona -> estadísticas; las zonas sin píxeles válidos quedan con None
+    return {
+        props["zona"]: {
+            "mean": props.get("mean"),
+            "min": props.get("min"),
+            "max": props.get("max"),
+            "stdDev": props.get("stdDev"),
+            "count": int(props.get("count") or 0),
+        }
+        for props in filas
+    }
+
+
+def estadisticas_zonas_locales(anio, indice, conjunto):
+
+    # Desde el compuesto cacheado en disco, sin acceso a GEE
+    bandas = compuestos_locales.bandas_compuesto(anio)
+
+    if bandas is None:
+        return None
+
+    _, meta = compuestos_locales.abrir_compuesto(anio)
+    resultado = {}
+    for zona, (f0, f1, c0, c1), mascara in zonas.mascaras(conjunto, meta):
+        ventana = {b: v[f0:f1, c0:c1] for b, v in bandas.items()}
+        valores = calcular_indice_np(ventana, indice)[mascara]
+        stats = estadisticas_np(valores, indice)
+        resultado[zona["nombre"]] = {
+            k: stats[f"{indice}_{k}"] for k in ("mean", "min", "max", "stdDev")
+        }
+        resultado[zona["nombre"]]["count"] = int(np.count_nonzero(~np.isnan(valores)))
+
+    return resultado
+
+
+def estadisticas_zonas(indice, anios, escala=ESCALA):
+    """
+    {año: {zona: {mean, min, max, stdDev, count}}} del conjunto de zonas
+    de Core.zonas, o None si no hay GeoJSON de zonas.
+    """
+    conjunto = zonas.cargar_zonas()
+
+    if conjunto is None or not conjunto["zonas"]:
+        return None
+
+    return _estadisticas_zonas(conjunto["huella"], indice, tuple(anios), escala)
+
+
+@cacheado(anios=lambda a: a["anios"])
+def _estadisticas_zonas(huella, indice, anios, escala):
+
+    conjunto = zonas.conjunto_por_huella(huella)
+
+    # Tantos años por getInfo como quepan en el límite de la colección
+    return _lote_anual(
+        "zonas", f"{indice}:{huella[:16]}", anios, escala,
+        lote=lambda anios: _lote_zonas(conjunto, indice, anios, escala),
+        local=lambda anio: estadisticas_zonas_locales(anio, indice, conjunto),
+        compactar=compactar_zonas,
+        anios_por_lote=max(1, MAX_FEATURES_LOTE // len(conjunto["zonas"])),
+    )
+
+
+GRANULARIDADES = {
+    "anual": None,
+    "mensual": "mes",
+    "estacional": "estacion",
+}
+
+# Propiedad que fija el año de cada periodo: la estación dic-feb de un año
+# incluye el diciembre anterior
+ANIO_PERIODO = {"estacional": "anio_estacion"}
+
+
+def _serie_gee(indice, anios, granularidad, escala):
+
+    # Agrupación en el servidor: una mediana y una reducción por periodo
+    # con imágenes, sin ramas If por año ni periodos vacíos
+    zona = zona_estudio()
+    subperiodo = GRANULARIDADES[granularidad]
+    anio_periodo = ANIO_PERIODO.get(granularidad, "anio")
+
+    # Con estaciones, también el diciembre anterior al primer año
+    inicio = min(anios) - (1 if anio_periodo != "anio" else 0)
+    coleccion = coleccion_armonizada(inicio, max(anios)).filter(
+        ee.Filter.inList(anio_periodo, list(anios))
+    )
+
+    if subperiodo is None:
+        coleccion = coleccion.map(lambda img: img.set("periodo", img.get("anio")))
+    else:
+        coleccion = coleccion.map(
+            lambda img: img.set(
+                "periodo",
+                ee.Number(img.get(anio_periodo)).multiply(100).add(img.get(subperiodo))
+            )
+        )
+
+    def calcular(periodo):
+        periodo = ee.Number(periodo)
+        img = coleccion.filter(ee.Filter.eq("periodo", periodo)).median()
+        red = INDICES[indice](img).rename(indice).reduceRegion(
+            ee.Reducer.mean(),
+            zona,
+            **_parametros_reduccion(escala)
+        )
+        return ee.Feature(
+            None,
+            {
+                "periodo": periodo,
+                "Valor": ee.Algorithms.If(red.contains(indice), red.get(indice), None)
+            }
+        )
+
+    periodos = ee.List(coleccion.aggregate_array("periodo")).distinct().sort()
+    datos = llamada_ee(
+        "serie_temporal", (indice, granularidad, escala),
+        ee.FeatureCollection(periodos.map(calcular)).getInfo
+    )
+
+    resultado = {anio: [] for anio in anios}
+    for f in datos["features"]:
+        periodo = int(f["properties"]["periodo"])
+        valor = f["properties"].get("Valor")
+        if subperiodo is None:
+            resultado[periodo].append({"Año": periodo, "Valor": valor})
+        else:
+            resultado[periodo // 100].append(
+                {"Año": periodo // 100, "Periodo": periodo % 100, "Valor": valor}
+            )
+    return resultado
+
+
+@cacheado(anios=lambda a: range(a["inicio"], a["fin"] + 1))
+def serie_temporal(indice, inicio=2000, fin=2025, granularidad="anual", escala=ESCALA):
+
+    tipo = "media" if granularidad == "anual" else f"media_{granularidad}"
+
+    # Solo se calculan en GEE los años que no están en el almacén
+    serie = {}
+    for anio in range(inicio, fin + 1):
+        guardado = almacen.leer(tipo, indice, anio, huella_zona(), escala=escala)
+        if guardado is None and sin_escenas(anio):
+            # Sin escenas según el catálogo: valor nulo sin ir a GEE
+            guardado = {"Año": anio, "Valor": None} if granularidad == "anual" else []
+        if guardado is not None:
+            serie[anio] = guardado
+
+    faltantes = [a for a in range(inicio, fin + 1) if a not in serie]
+
+    if faltantes:
+        # Una sola petición por serie aunque la pidan varias sesiones a la vez
+        calculado = vuelo_unico.compartir(
+            ("serie", indice, tuple(faltantes), granularidad, escala, huella_zona()),
+            _serie_gee, indice, faltantes, granularidad, escala
+        )
+
+        for anio, valores in calculado.items():
+            # Años sin escenas: un valor nulo en la serie anual
+            if granularidad == "anual":
+                valores = valores[0] if valores else {"Año": anio, "Valor": None}
+            almacen.guardar(tipo, indice, anio, huella_zona(), valores, escala=escala)
+            serie[anio] = valores
+
+    if granularidad == "anual":
+        return [serie[a] for a in sorted(serie)]
+
+    return [d for a in sorted(serie) for d in serie[a]]
+
+
+# ===============================
+# RESULTADOS PROGRESIVOS
+# ===============================
+ESPERA_RESOLUCION_COMPLETA = 0.5
+# Tras un fallo del cálculo completo no se reintenta antes de este plazo
+REINTENTO_FALLO = 300
+
+_ejecutor_completo = ThreadPoolExecutor(max_workers=2, thread_name_prefix="completo")
+# Solo cálculos pendientes o fallidos: los completos ya están en la caché
+# de su función, así que se retiran al terminar
+_en_curso = {}
+_cerrojo_en_curso = threading.Lock()
+
+
+def _al_terminar(clave, futuro):
+
+    if futuro.exception() is not None:
+        futuro.fallido = time.monotonic()
+        return
+    with _cerrojo_en_curso:
+        if _en_curso.get(clave) is futuro:
+            del _en_curso[clave]
+
+
+def _futuro_completo(fn, args):
+
+    clave = (fn.__name__, args)
+    with _cerrojo_en_curso:
+        futuro = _en_curso.get(clave)
+        reintentar = (
+            futuro is not None and futuro.done() and futuro.exception() is not None
+            and time.monotonic() - getattr(futuro, "fallido", time.monotonic()) >= REINTENTO_FALLO
+        )
+        if futuro is None or reintentar:
+            futuro = _ejecutor_completo.submit(fn, *args, escala=ESCALA)
+            _en_curso[clave] = futuro
+            nuevo = True
+        else:
+            nuevo = False
+
+    # Fuera del cerrojo: si ya terminó, el callback se ejecuta aquí mismo
+    if nuevo:
+        futuro.add_done_callback(lambda f: _al_terminar(clave, f))
+    return futuro
+
+
+def resultado_progresivo(fn, *args):
+
+    # Devuelve (resultado, aproximado). Si la resolución completa no está
+    # lista enseguida, se responde con una estimación a escala gruesa y el
+    # cálculo completo sigue en segundo plano (cada escala se cachea aparte).
+    # Si el cálculo completo falló, también se responde con la estimación
+    # y el error queda en error_resolucion_completa
+    futuro = _futuro_completo(fn, args)
+
+    try:
+        return futuro.result(timeout=ESPERA_RESOLUCION_COMPLETA), False
+    except TimeoutError:
+        return fn(*args, escala=ESCALA_APROXIMADA), True
+    except Exception:
+        return fn(*args, escala=ESCALA_APROXIMADA), True
+
+
+def resolucion_completa_lista(fn, *args):
+
+    # Terminado, con resultado o con error
+    with _cerrojo_en_curso:
+        futuro = _en_curso.get((fn.__name__, args))
+
+    return futuro is None or futuro.done()
+
+
+def error_resolucion_completa(fn, *args):
+
+    # Excepción del último cálculo completo, o None
+    with _cerrojo_en_curso:
+        futuro = _en_curso.get((fn.__name__, args))
+
+    if futuro is None or not futuro.done():
+        return None
+    return futuro.exception()
+
+
+def url_capa(anio, indice):
+
+    # Teselas locales si el compuesto del año ya está en caché; si no, GEE.
+    # None si el catálogo sabe que el año no tiene escenas
+    if sin_escenas(anio):
+        return None
+
+    if teselas.disponible(anio):
+        teselas.iniciar_servidor()
+        return teselas.url_teselas(anio, indice)
+
+    return mapas.url_mapa(
+        anio, indice, VIS_PARAMS[indice],
+        lambda: obtener_indice(anio, indice)
+    )
+
+
+# ===============================
+# CLIMATOLOGÍA Y ANOMALÍAS
+# ===============================
+ASSET_CLIMATOLOGIA = "projects/fourth-return-458106-r5/assets/climatologia_{indice}"
+# Una exportación lanzada no se repite antes de este plazo (suele tardar horas)
+TTL_EXPORTACION_CLIMATOLOGIA = 12 * 3600
+
+
+def climatologia_gee(indice):
+
+    # Media y desviación por píxel de los compuestos anuales del periodo;
+    # como en _serie_gee, solo entran los años que tienen escenas
+    coleccion = coleccion_armonizada(climatologia.INICIO, climatologia.FIN)
+
+    def indice_anual(anio):
+        compuesto = coleccion.filter(ee.Filter.eq("anio", anio)).median()
+        return INDICES[indice](compuesto).rename(indice)
+
+    anios = ee.List(coleccion.aggregate_array("anio")).distinct()
+    anuales = ee.ImageCollection(anios.map(indice_anual))
+
+    return anuales.reduce(
+        ee.Reducer.mean().combine(ee.Reducer.stdDev(), "", True)
+    )
+
+
+def _asset_climatologia(indice):
+
+    # Se comprueba en GEE como mucho una vez por hora mientras no exista
+    asset = ASSET_CLIMATOLOGIA.format(indice=indice)
+    guardado = almacen.leer("climatologia", indice, climatologia.FIN, huella_zona())
+
+    if guardado is None:
+        try:
+            llamada_ee("climatologia_asset", indice, ee.data.getAsset, asset)
+            existe = True
+        except ee.EEException:
+            existe = False
+        almacen.guardar(
+            "climatologia", indice, climatologia.FIN, huella_zona(),
+            {"existe": existe}, ttl=None if existe else 3600
+        )
+        guardado = {"existe": existe}
+
+    return asset if guardado["existe"] else None
+
+
+def imagen_climatologia(indice):
+
+    # Solo el asset exportado: el grafo equivalente (un compuesto por año
+    # de todo el periodo) es demasiado caro para evaluarlo en cada vista y
+    # tesela. Sin asset, None y se lanza su exportación
+    asset = _asset_climatologia(indice)
+
+    if asset is None:
+        exportar_climatologia(indice)
+        return None
+
+    return ee.Image(asset)
+
+
+def exportar_climatologia(indice):
+
+    # Tarea de exportación (por lotes) de la climatología a un asset; como
+    # mucho una cada TTL_EXPORTACION_CLIMATOLOGIA mientras el asset no exista
+    if _asset_climatologia(indice) is not None:
+        return None
+
+    # Varias sesiones a la vez encuentran el asset ausente: una sola lanza
+    # la tarea y las demás reciben la misma
+    return vuelo_unico.compartir(
+        ("climatologia_exportacion", indice), _iniciar_exportacion_climatologia, indice
+    )
+
+
+def _iniciar_exportacion_climatologia(indice):
+
+    if almacen.leer("climatologia_exportacion", indice, climatologia.FIN, huella_zona()):
+        return None
+
+    tarea = ee.batch.Export.image.toAsset(
+        image=climatologia_gee(indice).toFloat(),
+        description=f"climatologia_{indice}",
+        assetId=ASSET_CLIMATOLOGIA.format(indice=indice),
+        region=zona_filtro(),
+        scale=ESCALA,
+        maxPixels=1e10,
+    )
+    llamada_ee("exportar_climatologia", indice, tarea.start)
+    almacen.guardar(
+        "climatologia_exportacion", indice, climatologia.FIN, huella_zona(),
+        {"iniciada": True}, ttl=TTL_EXPORTACION_CLIMATOLOGIA
+    )
+
+    return tarea
+
+
+def obtener_anomalia(anio, indice):
+
+    # Una sola operación sobre la climatología persistida (None sin ella)
+    clim = imagen_climatologia(indice)
+
+    if clim is None:
+        return None
+
+    return (
+        obtener_indice(anio, indice)
+        .subtract(clim.select(f"{indice}_mean"))
+        .divide(clim.select(f"{indice}_stdDev"))
+        .rename("z")
+    )
+
+
+def url_anomalia(anio, indice):
+
+    # Como url_capa, pero para la anomalía z del año. None si el año no
+    # tiene escenas o si la climatología aún no está calculada
+    capa = indice + SUFIJO_ANOMALIA
+
+    if sin_escenas(anio):
+        return None
+
+    if teselas.disponible(anio, capa):
+        teselas.iniciar_servidor()
+        return teselas.url_teselas(anio, capa)
+
+    if imagen_climatologia(indice) is None:
+        return None
+
+    return mapas.url_mapa(
+        anio, capa, VIS_ANOMALIA,
+        lambda: obtener_anomalia(anio, indice)
+    )
+
+
+def descargar_compuestos_locales(anios):
+
+    # Los años históricos se descargan una vez al caché local de compuestos;
+    # devuelve los futuros de las descargas lanzadas
+    futuros = []
+    for anio in set(anios):
+        if (almacen.es_historico(anio)
+                and not compuestos_locales.compuesto_disponible(anio)
+                and not sin_escenas(anio)):
+            futuros.append(compuestos_locales.descargar_en_segundo_plano(
+                anio, obtener_compuesto(anio), zona_estudio(),
+                zona_estudio_proceso()["limites"]
+            ))
+
+    return futuros
+
+
+def grafico_rango_anios(serie, anios_sel, titulo):
+
+    a_ini, a_fin = min(anios_sel), max(anios_sel)
+
+    anios = []
+    valores = []
+
+    for d in serie:
+        if d["Valor"] is not None and a_ini <= d["Año"] <= a_fin:
+            anios.append(d["Año"])
+            valores.append(d["Valor"])
+
+    if valores:
+        st.subheader(titulo)
+        st.line_chart({str(a): v for a, v in zip(anios, valores)})
+    else:
+        st.warning("No hay datos suficientes para generar el gráfico.")
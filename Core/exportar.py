@@ -0,0 +1,445 @@
+"""
+Exportación masiva de rásteres de índices, series y tablas de estadísticas.
+
+- Rásteres: el índice de cada año (Core.datos.obtener_indice) se divide en
+  las teselas de la rejilla de Core.compuestos_locales y cada una se
+  descarga como GeoTIFF con ee.data.computePixels, con como mucho HILOS
+  descargas a la vez y en el carril de fondo del planificador. Cada
+  tesela escrita se anota en un manifiesto con su SHA-256: al reanudar
+  una exportación interrumpida se omiten las teselas cuyo archivo existe
+  y coincide con su hash. Un VRT une las teselas en un solo ráster
+  (GDAL, QGIS).
+- Tablas: la serie temporal y las estadísticas por año y por zona se
+  escriben por lotes de filas (Parquet o CSV), sin montar la tabla entera
+  en memoria.
+
+Uso:
+    python -m Core.exportar rasteres --indice NDVI [--anios 2000-2025]
+                                     [--destino DIR] [--hilos 4]
+    python -m Core.exportar tablas --indice NDVI [--anios 2000-2025]
+                                   [--formato parquet|csv] [--destino DIR]
+"""
+import os
+import sys
+import csv
+import json
+import hashlib
+import zipfile
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import ee
+
+from Core import almacen, compuestos_locales, datos, planificador
+from Core.gee_init import inicializar_gee, zona_estudio_proceso
+from Core.indices import INDICES
+from Core.instrumentacion import llamada_ee
+
+DIRECTORIO = os.getenv("LANDSAT_EXPORTACIONES") or os.path.join(
+    os.path.dirname(almacen.RUTA_ALMACEN), "exportaciones"
+)
+HILOS = 4
+NODATA = compuestos_locales.NODATA
+FILAS_LOTE = 5000
+ANIOS_LOTE = 5
+
+FORMATOS = {"parquet": ".parquet", "csv": ".csv"}
+
+_cerrojos = {}
+_cerrojo_cerrojos = threading.Lock()
+
+# Columnas y tipos de cada tabla exportable
+TABLAS = {
+    "serie": [
+        ("indice", "str"), ("anio", "int"), ("periodo", "int"), ("valor", "float"),
+    ],
+    "estadisticas": [
+        ("anio", "int"), ("indice", "str"),
+        ("mean", "float"), ("min", "float"), ("max", "float"), ("stdDev", "float"),
+    ],
+    "zonas": [
+        ("anio", "int"), ("zona", "str"), ("indice", "str"),
+        ("mean", "float"), ("min", "float"), ("max", "float"), ("stdDev", "float"),
+        ("count", "int"),
+    ],
+}
+
+
+def _sha256(ruta):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _cerrojo(ruta):
+    """Un cerrojo por exportación (directorio o archivo de destino)"""
+    with _cerrojo_cerrojos:
+        return _cerrojos.setdefault(os.path.abspath(ruta), threading.Lock())
+
+
+def _temporal(ruta):
+    """
+    Ruta temporal única junto a la ruta final: dos exportaciones simultáneas
+    (dos sesiones, o la CLI y la página) no escriben en el mismo archivo
+    """
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(ruta), prefix=os.path.basename(ruta) + ".",
+        suffix=".tmp", delete=False
+    ) as f:
+        return f.name
+
+
+def _escribir(ruta, contenido, modo="w"):
+    temporal = _temporal(ruta)
+    with open(temporal, modo) as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)
+
+
+def _escribir_json(ruta, contenido):
+    _escribir(ruta, json.dumps(contenido, indent=1))
+
+
+# ===============================
+# RÁSTERES
+# ===============================
+def _directorio_raster(destino, anio, indice):
+    return os.path.join(destino, "rasteres", f"{indice}_{anio}")
+
+
+def _manifiesto_valido(manifiesto, anio, indice, limites):
+    return (
+        manifiesto is not None
+        and manifiesto.get("version") == almacen.VERSION
+        and manifiesto.get("indice") == indice
+        and manifiesto.get("anio") == anio
+        and manifiesto.get("limites") == limites
+    )
+
+
+def escribir_vrt(directorio, manifiesto):
+    """VRT que compone las teselas del manifiesto en un solo ráster"""
+    sx, _, x0, _, sy, y0 = manifiesto["transformada"]
+    fuentes = []
+    for tesela in sorted(manifiesto["teselas"].values(), key=lambda t: (t["fila"], t["columna"])):
+        fuentes.append(
+            "    <SimpleSource>\n"
+            f'      <SourceFilename relativeToVRT="1">{tesela["archivo"]}</SourceFilename>\n'
+            "      <SourceBand>1</SourceBand>\n"
+            f'      <SrcRect xOff="0" yOff="0" xSize="{tesela["ancho"]}" ySize="{tesela["alto"]}"/>\n'
+            f'      <DstRect xOff="{tesela["columna"]}" yOff="{tesela["fila"]}" '
+            f'xSize="{tesela["ancho"]}" ySize="{tesela["alto"]}"/>\n'
+            "    </SimpleSource>"
+        )
+
+    vrt = (
+        f'<VRTDataset rasterXSize="{manifiesto["columnas"]}" rasterYSize="{manifiesto["filas"]}">\n'
+        f'  <SRS>{manifiesto["crs"]}</SRS>\n'
+        f"  <GeoTransform>{x0!r}, {sx!r}, 0.0, {y0!r}, 0.0, {sy!r}</GeoTransform>\n"
+        '  <VRTRasterBand dataType="Float32" band="1">\n'
+        f"    <NoDataValue>{NODATA}</NoDataValue>\n"
+        + "\n".join(fuentes) + "\n"
+        "  </VRTRasterBand>\n"
+        "</VRTDataset>\n"
+    )
+
+    ruta = os.path.join(directorio, f'{manifiesto["indice"]}_{manifiesto["anio"]}.vrt')
+    _escribir(ruta, vrt)
+    return ruta
+
+
+def exportar_raster(anio, indice, destino=DIRECTORIO, hilos=HILOS, progreso=None):
+    """
+    Exporta el índice de un año como teselas GeoTIFF + manifiesto + VRT.
+
+    Reanudable: las teselas ya escritas (archivo presente y hash correcto)
+    no se vuelven a descargar. progreso(hechas, total) se llama tras cada
+    tesela. Devuelve el manifiesto. Dos exportaciones del mismo año e
+    índice en el proceso se ejecutan una tras otra: la segunda reanuda la
+    primera.
+    """
+    directorio = _directorio_raster(destino, anio, indice)
+    os.makedirs(directorio, exist_ok=True)
+    with _cerrojo(directorio):
+        return _exportar_raster(anio, indice, directorio, hilos, progreso)
+
+
+def _exportar_raster(anio, indice, directorio, hilos, progreso):
+    ruta_manifiesto = os.path.join(directorio, "manifiesto.json")
+
+    limites = zona_estudio_proceso()["limites"]
+    transformada, filas, columnas, teselas = compuestos_locales.rejilla(limites)
+
+    manifiesto = None
+    if os.path.exists(ruta_manifiesto):
+        with open(ruta_manifiesto) as f:
+            manifiesto = json.load(f)
+    if not _manifiesto_valido(manifiesto, anio, indice, limites):
+        manifiesto = {
+            "anio": anio,
+            "indice": indice,
+            "version": almacen.VERSION,
+            "crs": compuestos_locales.CRS,
+            "limites": limites,
+            "transformada": transformada,
+            "filas": filas,
+            "columnas": columnas,
+            "nodata": NODATA,
+            "teselas": {},
+            "completo": False,
+        }
+
+    # Solo se conservan las teselas que siguen intactas en disco
+    manifiesto["teselas"] = {
+        clave: t for clave, t in manifiesto["teselas"].items()
+        if os.path.exists(os.path.join(directorio, t["archivo"]))
+        and _sha256(os.path.join(directorio, t["archivo"])) == t["sha256"]
+    }
+    pendientes = [t for t in teselas if f"{t[0]}_{t[1]}" not in manifiesto["teselas"]]
+    manifiesto["completo"] = not pendientes
+    _escribir_json(ruta_manifiesto, manifiesto)
+
+    expresion = datos.obtener_indice(anio, indice).toFloat().unmask(NODATA)
+    cerrojo = threading.Lock()
+
+    def descargar(tesela):
+        fila, columna, alto, ancho = tesela
+        with planificador.carril(planificador.FONDO):
+            contenido = llamada_ee(
+                "exportar_tesela", (anio, indice, fila, columna),
+                ee.data.computePixels, {
+                    "expression": expresion,
+                    "fileFormat": "GEO_TIFF",
+                    "grid": compuestos_locales.grid_tesela(transformada, fila, columna, alto, ancho),
+                    "bandIds": [indice],
+                }
+            )
+
+        archivo = f"tesela_{fila}_{columna}.tif"
+        ruta = os.path.join(directorio, archivo)
+        _escribir(ruta, contenido, "wb")
+
+        with cerrojo:
+            manifiesto["teselas"][f"{fila}_{columna}"] = {
+                "archivo": archivo,
+                "fila": fila,
+                "columna": columna,
+                "alto": alto,
+                "ancho": ancho,
+                "bytes": len(contenido),
+                "sha256": hashlib.sha256(contenido).hexdigest(),
+            }
+            _escribir_json(ruta_manifiesto, manifiesto)
+            if progreso is not None:
+                progreso(len(manifiesto["teselas"]), len(teselas))
+
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        for futuro in as_completed([pool.submit(descargar, t) for t in pendientes]):
+            futuro.result()
+
+    manifiesto["completo"] = True
+    _escribir_json(ruta_manifiesto, manifiesto)
+    escribir_vrt(directorio, manifiesto)
+    return manifiesto
+
+
+def exportar_rasteres(anios, indice, destino=DIRECTORIO, hilos=HILOS):
+    """Exporta varios años; devuelve {año: manifiesto o mensaje de error}"""
+    resultado = {}
+    for anio in anios:
+        if datos.sin_escenas(anio):
+            resultado[anio] = "sin escenas"
+            print(f"- {indice} {anio}: sin escenas", file=sys.stderr)
+            continue
+        try:
+            resultado[anio] = exportar_raster(anio, indice, destino, hilos)
+        except Exception as e:
+            resultado[anio] = f"{type(e).__name__}: {e}"
+            print(f"✗ {indice} {anio}: {e}", file=sys.stderr)
+            continue
+        print(f"✓ {indice} {anio}")
+    return resultado
+
+
+def empaquetar(directorios, ruta_zip):
+    """ZIP (sin recomprimir) con el contenido de los directorios dados"""
+    temporal = _temporal(ruta_zip)
+    with zipfile.ZipFile(temporal, "w", zipfile.ZIP_STORED) as z:
+        for directorio in directorios:
+            base = os.path.basename(directorio)
+            for nombre in sorted(os.listdir(directorio)):
+                if not nombre.endswith(".tmp"):
+                    z.write(os.path.join(directorio, nombre), f"{base}/{nombre}")
+    os.replace(temporal, ruta_zip)
+    return ruta_zip
+
+
+def zip_rasteres(anios, indice, destino=DIRECTORIO, hilos=HILOS):
+    """Exporta (o reanuda) los años y los empaqueta en un ZIP"""
+    manifiestos = exportar_rasteres(anios, indice, destino, hilos)
+    directorios = [
+        _directorio_raster(destino, anio, indice)
+        for anio, m in manifiestos.items() if isinstance(m, dict)
+    ]
+    anios_txt = "-".join(str(a) for a in sorted(anios))
+    ruta_zip = os.path.join(destino, f"{indice}_{anios_txt}.zip")
+    with _cerrojo(ruta_zip):
+        return empaquetar(directorios, ruta_zip)
+
+
+# ===============================
+# TABLAS
+# ===============================
+def _filas_serie(indice, anios):
+    for d in datos.serie_temporal(indice, min(anios), max(anios)):
+        if d["Año"] in anios:
+            yield {"indice": indice, "anio": d["Año"], "periodo": None, "valor": d["Valor"]}
+
+
+def _filas_estadisticas(indice, anios):
+    # Por lotes de años; el lote (todos los índices) es el mismo que piden
+    # las páginas, así que se sirve desde su caché
+    for i in range(0, len(anios), ANIOS_LOTE):
+        lote = tuple(anios[i:i + ANIOS_LOTE])
+        stats = datos.estadisticas_anios(lote)
+        for anio in lote:
+            por_indice = datos.estadisticas_indice(anio, indice, stats[anio])
+            yield {
+                "anio": anio,
+                "indice": indice,
+                **{k: por_indice.get(f"{indice}_{k}") for k in ("mean", "min", "max", "stdDev")},
+            }
+
+
+def _filas_zonas(indice, anios):
+    for i in range(0, len(anios), ANIOS_LOTE):
+        lote = tuple(anios[i:i + ANIOS_LOTE])
+        por_anio = datos.estadisticas_zonas(indice, lote) or {}
+        for anio in lote:
+            for zona, stats in sorted(por_anio.get(anio, {}).items()):
+                yield {"anio": anio, "zona": zona, "indice": indice, **stats}
+
+
+_GENERADORES = {
+    "serie": _filas_serie,
+    "estadisticas": _filas_estadisticas,
+    "zonas": _filas_zonas,
+}
+
+
+def escribir_tabla(filas, ruta, esquema, formato="parquet", filas_lote=FILAS_LOTE):
+    """
+    Escribe un iterable de dicts en Parquet o CSV por lotes: nunca hay más
+    de filas_lote filas en memoria. Devuelve el número de filas.
+    """
+    temporal = _temporal(ruta)
+    try:
+        if formato == "csv":
+            total = _escribir_csv(filas, temporal, esquema)
+        else:
+            total = _escribir_parquet(filas, temporal, esquema, filas_lote)
+    except BaseException:
+        # Si falla a mitad (p. ej. GEE), no queda un temporal huérfano
+        os.remove(temporal)
+        raise
+    os.replace(temporal, ruta)
+    return total
+
+
+def _escribir_csv(filas, ruta, esquema):
+    total = 0
+    with open(ruta, "w", newline="") as f:
+        escritor = csv.DictWriter(
+            f, fieldnames=[nombre for nombre, _ in esquema], extrasaction="ignore"
+        )
+        escritor.writeheader()
+        for fila in filas:
+            escritor.writerow(fila)
+            total += 1
+    return total
+
+
+def _escribir_parquet(filas, ruta, esquema, filas_lote):
+    # pyarrow solo se importa al exportar a Parquet
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tipos = {"int": pa.int64(), "float": pa.float64(), "str": pa.string()}
+    esquema_pa = pa.schema([(nombre, tipos[tipo]) for nombre, tipo in esquema])
+
+    total = 0
+    lote = []
+    with pq.ParquetWriter(ruta, esquema_pa) as escritor:
+        for fila in filas:
+            lote.append(fila)
+            if len(lote) >= filas_lote:
+                escritor.write_table(pa.Table.from_pylist(lote, schema=esquema_pa))
+                total += len(lote)
+                lote = []
+        if lote or total == 0:
+            escritor.write_table(pa.Table.from_pylist(lote, schema=esquema_pa))
+            total += len(lote)
+    return total
+
+
+def exportar_tabla(nombre, indice, anios, destino=DIRECTORIO, formato="parquet"):
+    """Escribe la tabla (serie, estadisticas o zonas) y devuelve su ruta"""
+    os.makedirs(os.path.join(destino, "tablas"), exist_ok=True)
+    anios = sorted(anios)
+    ruta = os.path.join(
+        destino, "tablas",
+        f"{nombre}_{indice}_{anios[0]}-{anios[-1]}{FORMATOS[formato]}"
+    )
+    with _cerrojo(ruta):
+        escribir_tabla(_GENERADORES[nombre](indice, anios), ruta, TABLAS[nombre], formato)
+    return ruta
+
+
+# ===============================
+# CLI
+# ===============================
+def _rango_anios(texto):
+    inicio, _, fin = texto.partition("-")
+    return list(range(int(inicio), int(fin or inicio) + 1))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("que", choices=["rasteres", "tablas"])
+    parser.add_argument("--indice", default="NDVI", choices=list(INDICES))
+    parser.add_argument("--anios", default="2000-2025", type=_rango_anios,
+                        help="año o rango (2000-2025)")
+    parser.add_argument("--destino", default=DIRECTORIO)
+    parser.add_argument("--hilos", type=int, default=HILOS)
+    parser.add_argument("--formato", default="parquet", choices=list(FORMATOS))
+    parser.add_argument("--tablas", default=",".join(TABLAS),
+                        help="tablas a exportar, separadas por comas")
+    args = parser.parse_args(argv)
+
+    inicializar_gee()
+
+    if args.que == "rasteres":
+        resultado = exportar_rasteres(args.anios, args.indice, args.destino, args.hilos)
+        omitidos = sorted(a for a, m in resultado.items() if m == "sin escenas")
+        fallidos = {
+            a: m for a, m in resultado.items() if not isinstance(m, dict) and a not in omitidos
+        }
+        print(json.dumps({
+            "exportados": sorted(a for a, m in resultado.items() if isinstance(m, dict)),
+            "sin_escenas": omitidos,
+            "fallidos": fallidos,
+            "destino": os.path.join(args.destino, "rasteres"),
+        }, indent=2, ensure_ascii=False))
+        return 1 if fallidos else 0
+
+    for nombre in args.tablas.split(","):
+        print(exportar_tabla(nombre, args.indice, args.anios, args.destino, args.formato))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,56 +1,262 @@
-import ee
-import os
-import json
-import streamlit as st
-
-def inicializar_gee():
-    """Inicializa Google Earth Engine con credenciales OAuth2"""
-    try:
-        client_id = os.getenv('EE_CLIENT_ID') or os.getenv('CLIENT_ID')
-        client_secret = os.getenv('EE_CLIENT_SECRET') or os.getenv('CLIENT_SECRET')
-        refresh_token = os.getenv('EE_REFRESH_TOKEN') or os.getenv('REFRESH_TOKEN')
-
-        if client_id and client_secret and refresh_token:
-            credentials = {
-                "client_id": client_id,
-                "client_secret": client_secret,
-                "refresh_token": refresh_token,
-                "type": "authorized_user"
-            }
-
-            cred_dir = os.path.join(os.path.expanduser("~"), ".config", "earthengine")
-            os.makedirs(cred_dir, exist_ok=True)
-
-            with open(os.path.join(cred_dir, "credentials"), "w") as f:
-                json.dump(credentials, f)
-
-        ee.Initialize(project="fourth-return-458106-r5")
-
-    except Exception as e:
-        raise RuntimeError(f"Error inicializando GEE: {e}")
-
-
-def obtener_zona_estudio():
-    """Obtiene la geometría de la zona de estudio desde GEE"""
-    try:
-        return ee.FeatureCollection(
-            "projects/fourth-return-458106-r5/assets/uchumayo"
-        ).geometry()
-    except Exception as e:
-        raise RuntimeError(f"Error al cargar zona de estudio: {e}")
-
-
-def asegurar_zona_estudio():
-    """
-    Asegura que la zona de estudio esté cargada en session_state.
-    Llama a esta función al inicio de cada página de Streamlit.
-    """
-    if "zona_estudio" not in st.session_state:
-        try:
-            inicializar_gee()
-            st.session_state["zona_estudio"] = obtener_zona_estudio()
-        except Exception as e:
-            st.error(f"Error al inicializar el sistema: {str(e)}")
-            st.stop()
-    
-    return st.session_state["zona_estudio"]
\ No newline at end of file
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import streamlit as st
+
+# `ee` se importa de forma diferida: la página de inicio pinta su contenido
+# antes de pagar la importación y la inicialización de GEE.
+
+log = logging.getLogger(__name__)
+
+ASSET_ZONA = "projects/fourth-return-458106-r5/assets/uchumayo"
+
+RUTA_ZONA = os.getenv("LANDSAT_ZONA_GEOJSON") or os.path.join(
+    os.path.expanduser("~"), ".cache", "landsat_uchumayo", "uchumayo.geojson"
+)
+
+# Cada cuánto se comprueba en GEE si el asset de la zona ha cambiado
+REVALIDAR_ZONA = 24 * 3600
+
+# Presupuesto de arranque en frío (segundos) y tiempos medidos por etapa
+PRESUPUESTO_ARRANQUE = float(os.getenv("LANDSAT_PRESUPUESTO_ARRANQUE", "5"))
+tiempos_arranque = {}
+
+_cerrojo_init = threading.Lock()
+_inicializado = False
+
+
+@contextmanager
+def medir_arranque(etapa):
+    """Registra la duración de una etapa del arranque"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        tiempos_arranque[etapa] = time.perf_counter() - t0
+
+
+def arranque_excedido():
+    """Total medido si supera el presupuesto de arranque; si no, None"""
+    total = sum(tiempos_arranque.values())
+    if total > PRESUPUESTO_ARRANQUE:
+        log.warning(
+            "Arranque de %.2f s (presupuesto %.2f s): %s",
+            total, PRESUPUESTO_ARRANQUE, tiempos_arranque
+        )
+        return total
+    return None
+
+
+def _escribir_credenciales(credentials):
+    """Escribe el archivo de credenciales solo si su contenido cambió"""
+    cred_dir = os.path.join(os.path.expanduser("~"), ".config", "earthengine")
+    ruta = os.path.join(cred_dir, "credentials")
+
+    try:
+        with open(ruta) as f:
+            if json.load(f) == credentials:
+                return
+    except (OSError, ValueError):
+        pass
+
+    os.makedirs(cred_dir, exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, "w") as f:
+        json.dump(credentials, f)
+    os.replace(temporal, ruta)
+
+
+def inicializar_gee():
+    """Inicializa Google Earth Engine con credenciales OAuth2 (una vez por proceso)"""
+    global _inicializado
+
+    if _inicializado:
+        return
+
+    with _cerrojo_init:
+        if _inicializado:
+            return
+        _inicializar_gee()
+        _inicializado = True
+
+
+def _inicializar_gee():
+    try:
+        with medir_arranque("importar_ee"):
+            import ee
+
+        client_id = os.getenv('EE_CLIENT_ID') or os.getenv('CLIENT_ID')
+        client_secret = os.getenv('EE_CLIENT_SECRET') or os.getenv('CLIENT_SECRET')
+        refresh_token = os.getenv('EE_REFRESH_TOKEN') or os.getenv('REFRESH_TOKEN')
+
+        if client_id and client_secret and refresh_token:
+            credentials = {
+                "client_id": client_id,
+                "client_secret": client_secret,
+                "refresh_token": refresh_token,
+                "type": "authorized_user"
+            }
+
+            _escribir_credenciales(credentials)
+
+        with medir_arranque("ee_initialize"):
+            ee.Initialize(project="fourth-return-458106-r5")
+
+    except Exception as e:
+        raise RuntimeError(f"Error inicializando GEE: {e}")
+
+
+def obtener_zona_estudio():
+    """Obtiene la geometría de la zona de estudio desde GEE"""
+    import ee
+
+    try:
+        return ee.FeatureCollection(ASSET_ZONA).geometry()
+    except Exception as e:
+        raise RuntimeError(f"Error al cargar zona de estudio: {e}")
+
+
+def _leer_instantanea():
+    """
+    Instantánea local de la zona ({"geometry", "version", "verificado"...})
+    si existe y su hash es correcto
+    """
+    from Core.almacen import huella_geometria
+
+    if not os.path.exists(RUTA_ZONA):
+        return None
+    try:
+        with open(RUTA_ZONA) as f:
+            instantanea = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if instantanea.get("asset") != ASSET_ZONA:
+        return None
+    # Mismo hash que las claves del almacén; las instantáneas con el
+    # formato anterior ("sha256") se descargan de nuevo una vez
+    if instantanea.get("huella") != huella_geometria(instantanea.get("geometry")):
+        return None
+    return instantanea
+
+
+def _guardar_instantanea(geometria, version=None):
+    """version: updateTime del asset cuando se descargó (None si se desconoce)"""
+    from Core.almacen import huella_geometria
+
+    instantanea = {
+        "asset": ASSET_ZONA,
+        "huella": huella_geometria(geometria),
+        "geometry": geometria,
+        "version": version,
+        "verificado": time.time(),
+    }
+    os.makedirs(os.path.dirname(RUTA_ZONA), exist_ok=True)
+    temporal = f"{RUTA_ZONA}.{os.getpid()}.tmp"
+    with open(temporal, "w") as f:
+        json.dump(instantanea, f)
+    os.replace(temporal, RUTA_ZONA)
+    return instantanea
+
+
+def _version_asset():
+    """updateTime del asset de la zona, o None si no se puede consultar"""
+    import ee
+    from Core.instrumentacion import llamada_ee
+
+    try:
+        return llamada_ee(
+            "zona_version", ASSET_ZONA, ee.data.getAsset, ASSET_ZONA
+        ).get("updateTime")
+    except Exception as e:
+        log.warning("No se pudo comprobar la versión de %s: %s", ASSET_ZONA, e)
+        return None
+
+
+def _descargar_zona(version=None):
+    from Core.instrumentacion import llamada_ee
+
+    geojson = llamada_ee("zona_estudio", ASSET_ZONA, obtener_zona_estudio().getInfo)
+    return _guardar_instantanea(geojson, version)
+
+
+def _instantanea_vigente():
+    """
+    Instantánea local de la zona, revalidada contra el asset cada
+    REVALIDAR_ZONA segundos: si su updateTime cambió, se vuelve a descargar.
+    Sin conexión con GEE se conserva la instantánea que hay.
+    """
+    instantanea = _leer_instantanea()
+    if instantanea is None:
+        # Sin versión: se fijará en la primera revalidación
+        return _descargar_zona()
+
+    if time.time() - instantanea.get("verificado", 0) < REVALIDAR_ZONA:
+        return instantanea
+
+    version = _version_asset()
+    if version is None:
+        return instantanea
+    if version != instantanea.get("version"):
+        return _descargar_zona(version)
+    return _guardar_instantanea(instantanea["geometry"], version)
+
+
+def _limites(geometria):
+    """[oeste, sur, este, norte] de un GeoJSON (Polygon o MultiPolygon)"""
+    def puntos(coords):
+        if isinstance(coords[0], (int, float)):
+            yield coords
+        else:
+            for c in coords:
+                yield from puntos(c)
+
+    pts = list(puntos(geometria["coordinates"]))
+    xs = [p[0] for p in pts]
+    ys = [p[1] for p in pts]
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+@st.cache_resource(show_spinner=False, ttl=REVALIDAR_ZONA)
+def zona_estudio_proceso():
+    """
+    Zona de estudio compartida por todas las sesiones del proceso.
+
+    La geometría se lee de una instantánea GeoJSON local (verificada por
+    hash) y solo se descarga de GEE si falta, no es válida o el asset ha
+    cambiado (updateTime, comprobado cada REVALIDAR_ZONA). "huella" es el
+    hash de sus coordenadas y forma parte de las claves del almacén. Variantes:
+    - "exacta": referencia al asset, para recortes y reducciones.
+    - "simplificada": rectángulo envolvente, para filterBounds (grafo
+      mínimo; no altera los píxeles dentro de la zona).
+    """
+    import ee
+
+    from Core.almacen import huella_geometria
+
+    with medir_arranque("zona_estudio"):
+        geojson = _instantanea_vigente()["geometry"]
+
+    limites = _limites(geojson)
+    return {
+        "exacta": obtener_zona_estudio(),
+        "simplificada": ee.Geometry.Rectangle(limites),
+        "geojson": geojson,
+        "limites": limites,
+        "huella": huella_geometria(geojson),
+    }
+
+
+def asegurar_zona_estudio():
+    """
+    Asegura que GEE y la zona de estudio estén disponibles en el proceso.
+    Llama a esta función al inicio de cada página de Streamlit.
+    """
+    try:
+        inicializar_gee()
+        return zona_estudio_proceso()["exacta"]
+    except Exception as e:
+        st.error(f"Error al inicializar el sistema: {str(e)}")
+        st.stop()
\ No newline at end of file
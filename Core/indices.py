@@ -1,34 +1,76 @@
-def calcular_indice(img, nombre):
-
-    if nombre == "NDVI":
-        return img.normalizedDifference(["NIR", "RED"])
-
-    if nombre == "SAVI":
-        return img.expression(
-            "(NIR - RED) / (NIR + RED + 0.5) * 1.5",
-            {"NIR": img.select("NIR"), "RED": img.select("RED")}
-        )
-
-    if nombre == "EVI":
-        return img.expression(
-            "2.5 * ((NIR - RED) / (NIR + 6 * RED - 7.5 * BLUE + 1))",
-            {
-                "NIR": img.select("NIR"),
-                "RED": img.select("RED"),
-                "BLUE": img.select("BLUE")
-            }
-        )
-
-    if nombre == "GNDVI":
-        return img.normalizedDifference(["NIR", "GREEN"])
-
-    if nombre == "LSWI":
-        return img.normalizedDifference(["NIR", "SWIR1"])
-
-    if nombre == "NDWI":
-        return img.normalizedDifference(["GREEN", "NIR"])
-
-    if nombre == "MNDWI":
-        return img.normalizedDifference(["GREEN", "SWIR1"])
-
-    raise ValueError(f"Índice no soportado: {nombre}")
+def calcular_indice(img, nombre):
+
+    if nombre == "NDVI":
+        return img.normalizedDifference(["NIR", "RED"])
+
+    if nombre == "SAVI":
+        return img.expression(
+            "(NIR - RED) / (NIR + RED + 0.5) * 1.5",
+            {"NIR": img.select("NIR"), "RED": img.select("RED")}
+        )
+
+    if nombre == "EVI":
+        return img.expression(
+            "2.5 * ((NIR - RED) / (NIR + 6 * RED - 7.5 * BLUE + 1))",
+            {
+                "NIR": img.select("NIR"),
+                "RED": img.select("RED"),
+                "BLUE": img.select("BLUE")
+            }
+        )
+
+    if nombre == "GNDVI":
+        return img.normalizedDifference(["NIR", "GREEN"])
+
+    if nombre == "LSWI":
+        return img.normalizedDifference(["NIR", "SWIR1"])
+
+    if nombre == "NDWI":
+        return img.normalizedDifference(["GREEN", "NIR"])
+
+    if nombre == "MNDWI":
+        return img.normalizedDifference(["GREEN", "SWIR1"])
+
+    raise ValueError(f"Índice no soportado: {nombre}")
+
+
+INDICES = {
+    nombre: (lambda img, nombre=nombre: calcular_indice(img, nombre))
+    for nombre in ["NDVI", "SAVI", "EVI", "GNDVI", "LSWI", "NDWI", "MNDWI"]
+}
+
+
+VIS_PARAMS = {
+    "NDVI": {"min": -0.2, "max": 0.9, "palette": ["brown", "yellow", "green"]},
+    "SAVI": {"min": -0.2, "max": 0.9, "palette": ["brown", "yellow", "green"]},
+    "EVI":  {"min": -0.2, "max": 0.9, "palette": ["brown", "yellow", "green"]},
+    "GNDVI":{"min": -0.2, "max": 0.9, "palette": ["brown", "yellow", "green"]},
+    "LSWI": {"min": -0.5, "max": 0.8, "palette": ["brown", "white", "blue"]},
+    "NDWI": {"min": -0.5, "max": 0.8, "palette": ["white", "cyan", "blue"]},
+    "MNDWI":{"min": -0.5, "max": 0.8, "palette": ["white", "lightblue", "darkblue"]}
+}
+
+
+# Anomalía estandarizada (z) de un año respecto a la climatología por
+# píxel; las capas de anomalía se nombran con el sufijo SUFIJO_ANOMALIA
+SUFIJO_ANOMALIA = "_z"
+
+VIS_ANOMALIA = {
+    "min": -3,
+    "max": 3,
+    "palette": ["8c510a", "d8b365", "f6e8c3", "f5f5f5", "c7eae5", "5ab4ac", "01665e"]
+}
+
+
+def vis_capa(capa):
+    """Parámetros de visualización de un índice o de su anomalía (o None)"""
+    if capa.endswith(SUFIJO_ANOMALIA) and capa[:-len(SUFIJO_ANOMALIA)] in VIS_PARAMS:
+        return VIS_ANOMALIA
+    return VIS_PARAMS.get(capa)
+
+
+# Estadísticas de distribución por año: percentiles e histograma de bins
+# fijos (mismos límites para todos los índices, comparables entre años)
+PERCENTILES = [5, 25, 50, 75, 95]
+
+HISTOGRAMA = {"min": -1.0, "max": 1.0, "bins": 40}
@@ -0,0 +1,213 @@
+"""
+Motor local (NumPy) de los índices espectrales.
+
+Evalúa las mismas fórmulas que Core/indices.py sobre arreglos locales de
+bandas (BLUE, GREEN, RED, NIR, SWIR1, SWIR2), reproduciendo la semántica
+de GEE:
+
+- normalizedDifference enmascara los píxeles con valores negativos en
+  cualquiera de las dos bandas.
+- La división por cero devuelve 0 (como ee.Image.divide).
+- Un píxel enmascarado en cualquier banda usada queda enmascarado.
+
+Los resultados se devuelven como float32 con NaN en los píxeles
+enmascarados y se calculan por bloques de filas para acotar la memoria.
+"""
+import numpy as np
+
+BANDAS = ["BLUE", "GREEN", "RED", "NIR", "SWIR1", "SWIR2"]
+
+BANDAS_INDICE = {
+    "NDVI": ("NIR", "RED"),
+    "SAVI": ("NIR", "RED"),
+    "EVI": ("NIR", "RED", "BLUE"),
+    "GNDVI": ("NIR", "GREEN"),
+    "LSWI": ("NIR", "SWIR1"),
+    "NDWI": ("GREEN", "NIR"),
+    "MNDWI": ("GREEN", "SWIR1"),
+}
+
+FILAS_BLOQUE = 512
+
+
+def _dividir(num, den):
+    """División de GEE: 0 cuando el denominador es 0"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(den != 0, num / den, 0.0)
+
+
+def _diferencia_normalizada(a, b):
+    invalido = (a < 0) | (b < 0)
+    return _dividir(a - b, a + b), invalido
+
+
+def _formula(nombre, b):
+    """Devuelve (valores, píxeles inválidos) para un bloque de bandas"""
+
+    if nombre == "NDVI":
+        return _diferencia_normalizada(b["NIR"], b["RED"])
+
+    if nombre == "SAVI":
+        return _dividir(b["NIR"] - b["RED"], b["NIR"] + b["RED"] + 0.5) * 1.5, None
+
+    if nombre == "EVI":
+        den = b["NIR"] + 6 * b["RED"] - 7.5 * b["BLUE"] + 1
+        return 2.5 * _dividir(b["NIR"] - b["RED"], den), None
+
+    if nombre == "GNDVI":
+        return _diferencia_normalizada(b["NIR"], b["GREEN"])
+
+    if nombre == "LSWI":
+        return _diferencia_normalizada(b["NIR"], b["SWIR1"])
+
+    if nombre == "NDWI":
+        return _diferencia_normalizada(b["GREEN"], b["NIR"])
+
+    if nombre == "MNDWI":
+        return _diferencia_normalizada(b["GREEN"], b["SWIR1"])
+
+    raise ValueError(f"Índice no soportado: {nombre}")
+
+
+def calcular_indice_np(bandas, nombre, mascara=None, nodata=None,
+                       salida=None, filas_bloque=FILAS_BLOQUE):
+    """
+    Calcula un índice sobre arreglos 2D de bandas.
+
+    bandas: dict nombre -> arreglo 2D (puede ser un memmap).
+    mascara: arreglo booleano opcional, True = píxel válido.
+    nodata: valor de relleno de las bandas (además de NaN).
+    salida: arreglo float32 opcional donde escribir el resultado.
+    """
+    if nombre not in BANDAS_INDICE:
+        raise ValueError(f"Índice no soportado: {nombre}")
+
+    usadas = BANDAS_INDICE[nombre]
+    filas, columnas = bandas[usadas[0]].shape
+
+    if salida is None:
+        salida = np.empty((filas, columnas), dtype=np.float32)
+
+    for ini in range(0, filas, filas_bloque):
+        fin = min(ini + filas_bloque, filas)
+        bloque = {
+            banda: np.asarray(bandas[banda][ini:fin], dtype=np.float64)
+            for banda in usadas
+        }
+
+        enmascarado = np.zeros((fin - ini, columnas), dtype=bool)
+        for valores in bloque.values():
+            enmascarado |= np.isnan(valores)
+            if nodata is not None:
+                enmascarado |= valores == nodata
+        if mascara is not None:
+            enmascarado |= ~np.asarray(mascara[ini:fin], dtype=bool)
+
+        with np.errstate(invalid="ignore"):
+            valores, invalido = _formula(nombre, bloque)
+        if invalido is not None:
+            enmascarado |= invalido
+
+        salida[ini:fin] = np.where(enmascarado, np.nan, valores)
+
+    return salida
+
+
+def calcular_indices_np(bandas, indices=tuple(BANDAS_INDICE), **kwargs):
+    """Calcula varios índices; devuelve dict nombre -> arreglo"""
+    return {nombre: calcular_indice_np(bandas, nombre, **kwargs) for nombre in indices}
+
+
+def _combinar(n, media, m2, bloque):
+    """Combinación de Chan et al. de medias y varianzas parciales"""
+    n_b = bloque.size
+    media_b = bloque.mean()
+    m2_b = ((bloque - media_b) ** 2).sum()
+    delta = media_b - media
+    total = n + n_b
+    media += delta * n_b / total
+    m2 += m2_b + delta ** 2 * n * n_b / total
+    return total, media, m2
+
+
+def _bloques_validos(valores, filas_bloque):
+    """Valores no NaN (float64, 1D) de cada bloque de filas"""
+    for ini in range(0, valores.shape[0], filas_bloque):
+        bloque = np.asarray(valores[ini:ini + filas_bloque], dtype=np.float64)
+        bloque = bloque[~np.isnan(bloque)]
+        if bloque.size:
+            yield bloque
+
+
+def estadisticas_np(valores, nombre, filas_bloque=FILAS_BLOQUE):
+    """
+    mean/min/max/stdDev de un índice ignorando NaN, por bloques.
+
+    Devuelve las mismas claves que reduceRegion en GEE ("NDVI_mean", ...).
+    stdDev es la desviación poblacional, como ee.Reducer.stdDev.
+    """
+    n = 0
+    media = 0.0
+    m2 = 0.0
+    minimo = np.inf
+    maximo = -np.inf
+
+    for bloque in _bloques_validos(valores, filas_bloque):
+        n, media, m2 = _combinar(n, media, m2, bloque)
+        minimo = min(minimo, bloque.min())
+        maximo = max(maximo, bloque.max())
+
+    if n == 0:
+        return {f"{nombre}_{k}": None for k in ("mean", "min", "max", "stdDev")}
+
+    return {
+        f"{nombre}_mean": float(media),
+        f"{nombre}_min": float(minimo),
+        f"{nombre}_max": float(maximo),
+        f"{nombre}_stdDev": float((m2 / n) ** 0.5),
+    }
+
+
+def distribucion_np(valores, minimo, maximo, bins, percentiles=(5, 25, 50, 75, 95),
+                    filas_bloque=FILAS_BLOQUE, resolucion=2000):
+    """
+    Distribución de un índice en una sola pasada por bloques.
+
+    Devuelve count, mean, stdDev, los percentiles ("p5", "p25"...) y el
+    histograma de `bins` intervalos fijos en [minimo, maximo] ("hist").
+    Como ee.Reducer.percentile, los percentiles se interpolan sobre un
+    histograma fino (`resolucion` intervalos); los valores fuera del rango
+    cuentan en los extremos para los percentiles y no en "hist".
+    """
+    n = 0
+    media = 0.0
+    m2 = 0.0
+    fino = np.zeros(resolucion, dtype=np.int64)
+    hist = np.zeros(bins, dtype=np.int64)
+
+    for bloque in _bloques_validos(valores, filas_bloque):
+        n, media, m2 = _combinar(n, media, m2, bloque)
+        fino += np.histogram(np.clip(bloque, minimo, maximo), resolucion, (minimo, maximo))[0]
+        hist += np.histogram(bloque, bins, (minimo, maximo))[0]
+
+    resultado = {
+        "count": int(n),
+        "mean": float(media) if n else None,
+        "stdDev": float((m2 / n) ** 0.5) if n else None,
+        "hist": hist.tolist(),
+    }
+
+    acumulado = np.cumsum(fino)
+    ancho = (maximo - minimo) / resolucion
+    for p in percentiles:
+        if n == 0:
+            resultado[f"p{p}"] = None
+            continue
+        objetivo = p / 100 * n
+        i = int(np.searchsorted(acumulado, objetivo))
+        i = min(i, resolucion - 1)
+        previo = acumulado[i - 1] if i > 0 else 0
+        fraccion = (objetivo - previo) / fino[i] if fino[i] else 0.5
+        resultado[f"p{p}"] = float(minimo + (i + fraccion) * ancho)
+
+    return resultado
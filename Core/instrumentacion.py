@@ -0,0 +1,227 @@
+"""
+Instrumentación de las llamadas a Earth Engine y de los cachés.
+
+Cada viaje de ida y vuelta a GEE (getInfo, getMapId, computePixels) pasa
+por llamada_ee, que lo encola en Core.planificador y registra el sitio
+de la llamada, la clave (año, índice...), la latencia, el tamaño de la
+respuesta y los errores. Los cachés registran aciertos y fallos con
+registrar_cache. Los datos (y el estado de la cola del planificador) se
+consultan en un panel lateral opcional o se vuelcan como JSON o en
+formato de texto de Prometheus.
+"""
+import os
+import json
+import time
+import threading
+from collections import deque, defaultdict
+
+from Core import planificador
+
+MAX_EVENTOS = 2000
+
+_cerrojo = threading.Lock()
+_eventos = deque(maxlen=MAX_EVENTOS)
+_totales = defaultdict(lambda: {"llamadas": 0, "errores": 0, "segundos": 0.0, "bytes": 0})
+_caches = defaultdict(lambda: {"aciertos": 0, "fallos": 0})
+
+
+def _tamano(resultado):
+    """Tamaño aproximado de la respuesta en bytes"""
+    nbytes = getattr(resultado, "nbytes", None)
+    if nbytes is not None:
+        return int(nbytes)
+    try:
+        return len(json.dumps(resultado, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+def llamada_ee(sitio, clave, fn, *args, **kwargs):
+    """
+    Ejecuta una llamada a GEE a través del planificador y registra
+    latencia (incluida la espera en cola), tamaño y errores.
+    """
+    t0 = time.perf_counter()
+    error = None
+    resultado = None
+    try:
+        resultado = planificador.ejecutar(fn, *args, **kwargs)
+        return resultado
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        segundos = time.perf_counter() - t0
+        tamano = _tamano(resultado) if error is None else 0
+        with _cerrojo:
+            _eventos.append({
+                "momento": time.time(),
+                "sitio": sitio,
+                "clave": str(clave),
+                "segundos": round(segundos, 4),
+                "bytes": tamano,
+                "error": error,
+            })
+            total = _totales[sitio]
+            total["llamadas"] += 1
+            total["segundos"] += segundos
+            total["bytes"] += tamano
+            if error is not None:
+                total["errores"] += 1
+
+
+def registrar_cache(cache, acierto):
+    """Cuenta un acierto o un fallo de un caché"""
+    with _cerrojo:
+        _caches[cache]["aciertos" if acierto else "fallos"] += 1
+
+
+def resumen():
+    """Totales por sitio de llamada y por caché, y los eventos recientes"""
+    with _cerrojo:
+        eventos = list(_eventos)
+        totales = {k: dict(v) for k, v in _totales.items()}
+        caches = {k: dict(v) for k, v in _caches.items()}
+
+    for sitio, total in totales.items():
+        latencias = sorted(e["segundos"] for e in eventos if e["sitio"] == sitio)
+        total["p50"] = latencias[len(latencias) // 2] if latencias else None
+        total["p95"] = latencias[int(len(latencias) * 0.95)] if latencias else None
+        total["max"] = latencias[-1] if latencias else None
+
+    for cache in caches.values():
+        n = cache["aciertos"] + cache["fallos"]
+        cache["tasa_aciertos"] = cache["aciertos"] / n if n else None
+
+    # Import diferido: Core.cache_memoria usa registrar_cache
+    from Core import cache_memoria
+
+    return {
+        "llamadas": totales,
+        "caches": caches,
+        "planificador": planificador.estado(),
+        "memoria": cache_memoria.estado(),
+        "eventos": eventos,
+    }
+
+
+def volcar_json():
+    return json.dumps(resumen(), indent=2, ensure_ascii=False)
+
+
+def volcar_prometheus():
+    """Métricas acumuladas en formato de texto de Prometheus"""
+    datos = resumen()
+    familias = [
+        ("landsat_ee_llamadas_total", "sitio", datos["llamadas"], "llamadas"),
+        ("landsat_ee_errores_total", "sitio", datos["llamadas"], "errores"),
+        ("landsat_ee_segundos_total", "sitio", datos["llamadas"], "segundos"),
+        ("landsat_ee_bytes_total", "sitio", datos["llamadas"], "bytes"),
+        ("landsat_cache_aciertos_total", "cache", datos["caches"], "aciertos"),
+        ("landsat_cache_fallos_total", "cache", datos["caches"], "fallos"),
+    ]
+
+    lineas = []
+    for metrica, etiqueta, grupo, campo in familias:
+        lineas.append(f"# TYPE {metrica} counter")
+        for nombre, valores in sorted(grupo.items()):
+            lineas.append(f'{metrica}{{{etiqueta}="{nombre}"}} {valores[campo]:g}')
+
+    plan = datos["planificador"]
+    lineas.append("# TYPE landsat_ee_cola gauge")
+    for carril, n in sorted(plan["en_cola"].items()):
+        lineas.append(f'landsat_ee_cola{{carril="{carril}"}} {n}')
+    lineas.append("# TYPE landsat_ee_espera_media_segundos gauge")
+    for carril, espera in sorted(plan["espera"].items()):
+        lineas.append(
+            f'landsat_ee_espera_media_segundos{{carril="{carril}"}} {espera["media"] or 0:g}'
+        )
+    memoria = datos["memoria"]
+    lineas.append("# TYPE landsat_cache_expulsiones_total counter")
+    for funcion, valores in sorted(memoria["funciones"].items()):
+        lineas.append(
+            f'landsat_cache_expulsiones_total{{funcion="{funcion}"}} {valores["expulsiones"]}'
+        )
+
+    for metrica, tipo, valor in (
+        ("landsat_cache_memoria_bytes", "gauge", memoria["bytes"]),
+        ("landsat_cache_memoria_presupuesto_bytes", "gauge", memoria["presupuesto"]),
+        ("landsat_ee_activas", "gauge", plan["activas"]),
+        ("landsat_ee_tasa", "gauge", plan["tasa"]),
+        ("landsat_ee_reintentos_total", "counter", plan["reintentos"]),
+        ("landsat_ee_cuota_agotada_total", "counter", plan["agotadas"]),
+    ):
+        lineas.append(f"# TYPE {metrica} {tipo}")
+        lineas.append(f"{metrica} {valor:g}")
+
+    return "\n".join(lineas) + "\n"
+
+
+def reiniciar():
+    with _cerrojo:
+        _eventos.clear()
+        _totales.clear()
+        _caches.clear()
+    planificador.reiniciar()
+
+
+def panel_depuracion():
+    """
+    Panel lateral con las métricas. Se muestra con LANDSAT_DEPURACION=1
+    o con el parámetro de URL ?depuracion=1.
+    """
+    import streamlit as st
+
+    if os.getenv("LANDSAT_DEPURACION") != "1" and st.query_params.get("depuracion") != "1":
+        return
+
+    datos = resumen()
+    with st.sidebar.expander("Depuración: llamadas a GEE", expanded=False):
+        filas = [
+            {
+                "sitio": sitio,
+                "llamadas": t["llamadas"],
+                "errores": t["errores"],
+                "p50 (s)": t["p50"],
+                "p95 (s)": t["p95"],
+                "máx (s)": t["max"],
+                "KB": round(t["bytes"] / 1024, 1),
+            }
+            for sitio, t in sorted(datos["llamadas"].items())
+        ]
+        st.dataframe(filas, hide_index=True)
+
+        st.dataframe(
+            [{"caché": k, **v} for k, v in sorted(datos["caches"].items())],
+            hide_index=True
+        )
+
+        memoria = datos["memoria"]
+        st.caption(
+            f"Caché en memoria: {memoria['bytes'] / 2 ** 20:.1f} de "
+            f"{memoria['presupuesto'] / 2 ** 20:.0f} MB, {memoria['entradas']} entradas"
+        )
+        st.dataframe(
+            [{"función": k, **v} for k, v in sorted(memoria["funciones"].items())],
+            hide_index=True
+        )
+
+        plan = datos["planificador"]
+        st.caption(
+            f"Planificador: {plan['activas']} activas, tasa {plan['tasa']}/s, "
+            f"{plan['reintentos']} reintentos, {plan['agotadas']} agotadas"
+        )
+        st.dataframe(
+            [
+                {"carril": carril, "en cola": plan["en_cola"][carril], **espera}
+                for carril, espera in plan["espera"].items()
+            ],
+            hide_index=True
+        )
+
+        lentas = sorted(datos["eventos"], key=lambda e: e["segundos"], reverse=True)[:10]
+        st.caption("Llamadas más lentas")
+        st.dataframe(lentas, hide_index=True)
+
+        st.download_button("JSON", volcar_json(), "llamadas_gee.json", "application/json")
+        st.download_button("Prometheus", volcar_prometheus(), "llamadas_gee.prom", "text/plain")
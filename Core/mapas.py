@@ -0,0 +1,113 @@
+"""
+Caché de plantillas de teselas de GEE (getMapId).
+
+Cada capa (año, índice, parámetros de visualización) se solicita a GEE
+una sola vez por proceso. Los tokens de mapa caducan, así que se guarda
+la hora de creación y, pasado MARGEN_REFRESCO de su vida útil, se
+renuevan en segundo plano mientras se sigue sirviendo la URL vigente.
+
+Las peticiones simultáneas de la misma capa desde varias sesiones se
+agrupan en una sola (Core.vuelo_unico). Las URL también se guardan en el
+almacén persistente, de modo que las generadas por el precalentamiento
+(Core.precalentar) o por otro proceso se reutilizan mientras no caduquen.
+La clave incluye la huella de la zona de estudio: si se edita el asset,
+las capas recortadas con la geometría anterior no se sirven.
+"""
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from Core import almacen, gee_init, planificador, vuelo_unico
+from Core.instrumentacion import llamada_ee, registrar_cache
+
+# Vida útil conservadora de un mapid de GEE
+TTL_TOKEN = 4 * 3600
+MARGEN_REFRESCO = 0.75
+
+_cerrojo = threading.Lock()
+_entradas = {}
+_refrescando = set()
+_ejecutor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="mapid")
+
+
+def _clave(anio, indice, vis):
+    huella = gee_init.zona_estudio_proceso()["huella"]
+    return (anio, indice, json.dumps(vis, sort_keys=True), huella)
+
+
+def _indice_almacen(clave):
+    _, indice, vis, _ = clave
+    return f"{indice}:{hashlib.sha1(vis.encode()).hexdigest()[:10]}"
+
+
+def _solicitar(clave, construir_imagen, vis):
+    # Varias sesiones pidiendo la misma capa comparten un solo getMapId
+    return vuelo_unico.compartir(("mapid",) + clave, _pedir, clave, construir_imagen, vis)
+
+
+def _pedir(clave, construir_imagen, vis):
+    imagen = construir_imagen()
+    url = llamada_ee("getMapId", clave[:2], imagen.getMapId, vis)["tile_fetcher"].url_format
+    creado = time.time()
+    with _cerrojo:
+        _entradas[clave] = (url, creado, construir_imagen)
+    almacen.guardar(
+        "mapid", _indice_almacen(clave), clave[0], clave[3],
+        {"url": url, "creado": creado}, ttl=TTL_TOKEN
+    )
+    return url
+
+
+def _refrescar(clave, construir_imagen, vis):
+    try:
+        with planificador.carril(planificador.FONDO):
+            _solicitar(clave, construir_imagen, vis)
+    finally:
+        with _cerrojo:
+            _refrescando.discard(clave)
+
+
+def url_mapa(anio, indice, vis, construir_imagen):
+    """
+    Plantilla XYZ de GEE para una capa.
+
+    construir_imagen: función sin argumentos que devuelve la ee.Image; solo
+    se invoca cuando la capa no está en caché.
+    """
+    clave = _clave(anio, indice, vis)
+    ahora = time.time()
+
+    with _cerrojo:
+        entrada = _entradas.get(clave)
+    registrar_cache("mapid_memoria", entrada is not None)
+
+    if entrada is None:
+        guardado = almacen.leer("mapid", _indice_almacen(clave), anio, clave[3])
+        if guardado is not None:
+            entrada = (guardado["url"], guardado["creado"], construir_imagen)
+            with _cerrojo:
+                _entradas[clave] = entrada
+
+    if entrada is not None:
+        url, creado, _ = entrada
+        edad = ahora - creado
+        if edad < TTL_TOKEN:
+            if edad > TTL_TOKEN * MARGEN_REFRESCO:
+                with _cerrojo:
+                    lanzar = clave not in _refrescando
+                    _refrescando.add(clave)
+                if lanzar:
+                    _ejecutor.submit(_refrescar, clave, construir_imagen, vis)
+            return url
+
+    return _solicitar(clave, construir_imagen, vis)
+
+
+def invalidar(anio=None, indice=None):
+    """Olvida las capas cacheadas (todas, o las de un año/índice)"""
+    with _cerrojo:
+        for clave in list(_entradas):
+            if (anio is None or clave[0] == anio) and (indice is None or clave[1] == indice):
+                del _entradas[clave]
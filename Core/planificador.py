@@ -0,0 +1,194 @@
+"""
+Planificador de las llamadas a Earth Engine con cuota.
+
+Todas las llamadas (vía Core.instrumentacion.llamada_ee) pasan por aquí:
+- Presupuesto de concurrencia: como mucho CONCURRENCIA llamadas a la vez.
+- Cubeta de fichas: TASA llamadas por segundo con ráfagas de RAFAGA.
+- Dos carriles: las peticiones de las páginas (INTERACTIVO) pasan antes
+  que el precalentamiento o las descargas (FONDO).
+- Ante errores de cuota (429, "Too many concurrent aggregations"...) se
+  reintenta con espera exponencial y jitter completo, y la tasa se reduce
+  a la mitad; cada llamada correcta la recupera poco a poco. Así el ritmo
+  se mantiene cerca de la cuota en lugar de caer en tormentas de
+  reintentos.
+"""
+import os
+import re
+import time
+import heapq
+import random
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+CONCURRENCIA = int(os.getenv("LANDSAT_EE_CONCURRENCIA", "6"))
+TASA = float(os.getenv("LANDSAT_EE_TASA", "10"))
+TASA_MINIMA = 0.5
+RAFAGA = 20
+
+REINTENTOS = 5
+PAUSA_BASE = 1.0
+PAUSA_MAXIMA = 60.0
+
+INTERACTIVO = 0
+FONDO = 1
+CARRILES = {INTERACTIVO: "interactivo", FONDO: "fondo"}
+
+# Mensajes concretos de cuota: no basta con "too many", que también
+# aparece en errores deterministas ("Too many pixels in the region")
+_MARCAS_CUOTA = re.compile(
+    r"\b429\b|too many requests|too many concurrent|quota|rate limit|resource_exhausted"
+)
+
+_condicion = threading.Condition()
+_local = threading.local()
+_turnos = itertools.count()
+_cola = []
+_esperas = deque(maxlen=1000)
+_contadores = {"reintentos": 0, "agotadas": 0}
+_estado = {
+    "activas": 0,
+    "fichas": float(RAFAGA),
+    "tasa": TASA,
+    "recarga": time.monotonic(),
+}
+
+
+class CuotaAgotada(RuntimeError):
+    """GEE sigue rechazando la llamada por cuota tras todos los reintentos"""
+
+
+def es_error_cuota(error):
+    mensaje = str(error).lower()
+    return _MARCAS_CUOTA.search(mensaje) is not None
+
+
+@contextmanager
+def carril(prioridad):
+    """Asigna un carril a las llamadas a GEE del hilo actual"""
+    anterior = getattr(_local, "carril", INTERACTIVO)
+    _local.carril = prioridad
+    try:
+        yield
+    finally:
+        _local.carril = anterior
+
+
+def carril_actual():
+    return getattr(_local, "carril", INTERACTIVO)
+
+
+def _recargar(ahora):
+    transcurrido = ahora - _estado["recarga"]
+    _estado["fichas"] = min(RAFAGA, _estado["fichas"] + transcurrido * _estado["tasa"])
+    _estado["recarga"] = ahora
+
+
+def _adquirir(prioridad):
+    """Espera turno (carril, orden de llegada), hueco y ficha"""
+    turno = (prioridad, next(_turnos))
+    t0 = time.monotonic()
+
+    with _condicion:
+        heapq.heappush(_cola, turno)
+        obtenido = False
+        try:
+            while True:
+                _recargar(time.monotonic())
+                if (_cola[0] == turno
+                        and _estado["activas"] < CONCURRENCIA
+                        and _estado["fichas"] >= 1):
+                    heapq.heappop(_cola)
+                    obtenido = True
+                    _estado["activas"] += 1
+                    _estado["fichas"] -= 1
+                    _condicion.notify_all()
+                    break
+                # Si solo falta la ficha, se duerme hasta que se genere
+                faltan = 1 - _estado["fichas"]
+                _condicion.wait(faltan / _estado["tasa"] if faltan > 0 else None)
+        finally:
+            # Si la espera se interrumpe (KeyboardInterrupt, excepción en el
+            # hilo), el turno abandonado no puede quedar bloqueando la cola
+            if not obtenido:
+                _cola.remove(turno)
+                heapq.heapify(_cola)
+                _condicion.notify_all()
+
+        _esperas.append((prioridad, time.monotonic() - t0))
+
+
+def _liberar(cuota):
+    with _condicion:
+        _estado["activas"] -= 1
+        if cuota:
+            # Menos ritmo y sin ráfaga acumulada hasta que GEE se recupere
+            _estado["tasa"] = max(TASA_MINIMA, _estado["tasa"] / 2)
+            _estado["fichas"] = min(_estado["fichas"], 0.0)
+        else:
+            _estado["tasa"] = min(TASA, _estado["tasa"] + TASA * 0.05)
+        _condicion.notify_all()
+
+
+def ejecutar(fn, *args, **kwargs):
+    """Ejecuta una llamada a GEE respetando la cuota; reintenta si se excede"""
+    prioridad = carril_actual()
+
+    for intento in range(REINTENTOS + 1):
+        _adquirir(prioridad)
+        cuota = False
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if not es_error_cuota(e):
+                raise
+            cuota = True
+            if intento == REINTENTOS:
+                with _condicion:
+                    _contadores["agotadas"] += 1
+                raise CuotaAgotada(
+                    "Earth Engine está saturado en este momento; "
+                    "vuelve a intentarlo en unos minutos."
+                ) from e
+            with _condicion:
+                _contadores["reintentos"] += 1
+        finally:
+            _liberar(cuota)
+
+        time.sleep(random.uniform(0, min(PAUSA_MAXIMA, PAUSA_BASE * 2 ** intento)))
+
+
+def estado():
+    """Profundidad de cola, llamadas activas, tasa actual y esperas por carril"""
+    with _condicion:
+        en_cola = {nombre: 0 for nombre in CARRILES.values()}
+        for prioridad, _ in _cola:
+            en_cola[CARRILES[prioridad]] += 1
+        esperas = list(_esperas)
+        resultado = {
+            "activas": _estado["activas"],
+            "tasa": round(_estado["tasa"], 2),
+            "en_cola": en_cola,
+            **_contadores,
+        }
+
+    resultado["espera"] = {}
+    for prioridad, nombre in CARRILES.items():
+        valores = sorted(s for p, s in esperas if p == prioridad)
+        resultado["espera"][nombre] = {
+            "llamadas": len(valores),
+            "media": sum(valores) / len(valores) if valores else None,
+            "p95": valores[int(len(valores) * 0.95)] if valores else None,
+        }
+    return resultado
+
+
+def reiniciar():
+    with _condicion:
+        _esperas.clear()
+        for clave in _contadores:
+            _contadores[clave] = 0
+        _estado["tasa"] = TASA
+        _estado["fichas"] = float(RAFAGA)
+        _estado["recarga"] = time.monotonic()
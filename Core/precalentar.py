@@ -0,0 +1,227 @@
+"""
+Precalentamiento offline de los cachés (cron o hook de despliegue).
+
+Calcula las series temporales, las estadísticas y la distribución
+(percentiles e histograma) por año y las plantillas
+de teselas de todos los índices y años, y las deja en el almacén
+persistente que leen las páginas. Antes sincroniza el catálogo local de
+escenas. Con --climatologia, además, exporta a
+un asset la climatología por píxel de cada índice y, si las teselas
+locales están activas, la calcula también sobre los compuestos locales. El progreso se guarda tras cada tarea,
+de modo que una ejecución interrumpida se reanuda donde quedó.
+
+Uso:
+    python -m Core.precalentar [--inicio 2000] [--fin 2025] [--hilos 4]
+                               [--climatologia]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tenacity import (
+    retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+)
+
+from Core import almacen, climatologia, datos, mapas, planificador, teselas
+from Core.gee_init import inicializar_gee
+from Core.indices import INDICES, VIS_PARAMS
+
+RUTA_PROGRESO = os.path.join(
+    os.path.dirname(almacen.RUTA_ALMACEN), "precalentamiento.json"
+)
+
+# Solo errores transitorios: el planificador ya reintenta los de cuota
+# llamada a llamada; aquí se repite la tarea entera si aun así se agotó la
+# cuota o falló la red. Los errores de GEE deterministas no se repiten.
+_reintentar = retry(
+    retry=retry_if_exception_type((planificador.CuotaAgotada, OSError)),
+    stop=stop_after_attempt(5),
+    wait=wait_exponential_jitter(initial=2, max=60),
+    reraise=True,
+)
+
+
+def _cargar_progreso():
+    if not os.path.exists(RUTA_PROGRESO):
+        return set()
+    with open(RUTA_PROGRESO) as f:
+        progreso = json.load(f)
+    if progreso.get("version") != almacen.VERSION:
+        return set()
+    return set(progreso.get("completadas", []))
+
+
+def _guardar_progreso(completadas):
+    # Temporal único: dos precalentamientos a la vez no se pisan el archivo
+    descriptor, temporal = tempfile.mkstemp(
+        dir=os.path.dirname(RUTA_PROGRESO), prefix=os.path.basename(RUTA_PROGRESO) + ".",
+        suffix=".tmp"
+    )
+    try:
+        with os.fdopen(descriptor, "w") as f:
+            json.dump({"version": almacen.VERSION, "completadas": sorted(completadas)}, f)
+        os.replace(temporal, RUTA_PROGRESO)
+    except BaseException:
+        os.remove(temporal)
+        raise
+
+
+def _en_segundo_plano(fn):
+    """Las llamadas del precalentamiento ceden el paso a las de las páginas"""
+    def tarea():
+        with planificador.carril(planificador.FONDO):
+            return fn()
+    return tarea
+
+
+def _renovable(ident):
+    """Tareas que se repiten siempre: tokens de mapa y el año en curso"""
+    return ident.startswith("mapa:") or str(time.localtime().tm_year) in ident
+
+
+def _climatologia(indice):
+    """Climatología local (con teselas locales) y exportación a asset"""
+    if teselas.ACTIVO:
+        anios = range(climatologia.INICIO, climatologia.FIN + 1)
+        for futuro in datos.descargar_compuestos_locales(anios):
+            futuro.result()
+        climatologia.calcular_climatologia(indice)
+    datos.exportar_climatologia(indice)
+
+
+def _token_mapa(anio, indice):
+    """Plantilla de teselas de GEE; los años sin escenas no se piden"""
+    if datos.sin_escenas(anio):
+        return None
+    return mapas.url_mapa(
+        anio, indice, VIS_PARAMS[indice],
+        lambda: datos.obtener_indice(anio, indice)
+    )
+
+
+def tareas(inicio, fin, indices, con_mapas=True, con_climatologia=False):
+    """Lista de (identificador, función) a ejecutar"""
+    lista = []
+
+    for indice in indices:
+        lista.append((
+            f"serie:{indice}:{inicio}-{fin}",
+            lambda indice=indice: datos.serie_temporal(indice, inicio, fin)
+        ))
+
+    for indice in indices:
+        lista.append((
+            f"distribucion:{indice}:{inicio}-{fin}",
+            lambda indice=indice: datos.distribucion_anios(
+                indice, tuple(range(inicio, fin + 1))
+            )
+        ))
+
+    for anio in range(inicio, fin + 1):
+        lista.append((
+            f"estadisticas:{anio}",
+            lambda anio=anio: datos.estadisticas_anios((anio,))
+        ))
+
+    if con_mapas:
+        for anio in range(inicio, fin + 1):
+            for indice in indices:
+                lista.append((
+                    f"mapa:{anio}:{indice}",
+                    lambda anio=anio, indice=indice: _token_mapa(anio, indice)
+                ))
+
+    if con_climatologia:
+        for indice in indices:
+            lista.append((
+                f"climatologia:{indice}",
+                lambda indice=indice: _climatologia(indice)
+            ))
+
+    return lista
+
+
+def precalentar(inicio=2000, fin=2025, indices=tuple(INDICES), hilos=4,
+                con_mapas=True, con_climatologia=False, reiniciar=False):
+    """Ejecuta las tareas pendientes y devuelve un informe"""
+    completadas = set() if reiniciar else _cargar_progreso()
+    todas = tareas(inicio, fin, indices, con_mapas, con_climatologia)
+    pendientes = [
+        (ident, fn) for ident, fn in todas
+        if ident not in completadas or _renovable(ident)
+    ]
+
+    # El catálogo primero: los años sin escenas ya no llegan a GEE
+    with planificador.carril(planificador.FONDO):
+        _reintentar(datos.sincronizar_catalogo)()
+
+    informe = {
+        "omitidas": len(todas) - len(pendientes),
+        "completadas": 0,
+        "fallidas": {},
+        "segundos": 0.0,
+    }
+    cerrojo = threading.Lock()
+    t0 = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        futuros = {
+            pool.submit(_reintentar(_en_segundo_plano(fn))): ident
+            for ident, fn in pendientes
+        }
+
+        for futuro in as_completed(futuros):
+            ident = futuros[futuro]
+            try:
+                futuro.result()
+            except Exception as e:
+                informe["fallidas"][ident] = str(e)
+                print(f"✗ {ident}: {e}", file=sys.stderr)
+                continue
+
+            with cerrojo:
+                informe["completadas"] += 1
+                completadas.add(ident)
+                _guardar_progreso(completadas)
+            print(f"✓ {ident}")
+
+    informe["segundos"] = round(time.perf_counter() - t0, 1)
+    return informe
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--inicio", type=int, default=2000)
+    parser.add_argument("--fin", type=int, default=2025)
+    parser.add_argument("--indices", default=",".join(INDICES))
+    parser.add_argument("--hilos", type=int, default=4)
+    parser.add_argument("--sin-mapas", action="store_true")
+    parser.add_argument("--climatologia", action="store_true",
+                        help="exporta la climatología por píxel de cada índice")
+    parser.add_argument("--reiniciar", action="store_true",
+                        help="ignora el progreso guardado")
+    args = parser.parse_args(argv)
+
+    inicializar_gee()
+
+    informe = precalentar(
+        inicio=args.inicio,
+        fin=args.fin,
+        indices=tuple(args.indices.split(",")),
+        hilos=args.hilos,
+        con_mapas=not args.sin_mapas,
+        con_climatologia=args.climatologia,
+        reiniciar=args.reiniciar,
+    )
+
+    print(json.dumps(informe, indent=2, ensure_ascii=False))
+    return 1 if informe["fallidas"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
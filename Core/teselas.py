@@ -0,0 +1,347 @@
+"""
+Servidor local de teselas XYZ (PNG) a partir de los compuestos cacheados.
+
+Las teselas se renderizan con las paletas y rangos de VIS_PARAMS sobre los
+rásteres de índices calculados localmente (Core.indices_np) o, para las
+capas de anomalía (sufijo "_z"), sobre su anomalía respecto a la
+climatología por píxel (Core.climatologia). Se guardan en un LRU acotado
+en memoria y otro en disco. Se activa con la variable
+de entorno LANDSAT_TESELAS_LOCALES=1.
+"""
+import io
+import os
+import glob
+import asyncio
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image, ImageColor
+
+from Core import climatologia, compuestos_locales, vuelo_unico
+from Core.indices import SUFIJO_ANOMALIA, vis_capa
+from Core.indices_np import calcular_indice_np
+from Core.instrumentacion import registrar_cache
+
+ACTIVO = os.getenv("LANDSAT_TESELAS_LOCALES") == "1"
+PUERTO = int(os.getenv("LANDSAT_TESELAS_PUERTO", "8502"))
+URL_BASE = os.getenv("LANDSAT_TESELAS_URL") or f"http://localhost:{PUERTO}"
+
+DIRECTORIO = os.path.join(compuestos_locales.DIRECTORIO, "teselas")
+TAM = 256
+MAX_BYTES_MEMORIA = 64 * 1024 * 1024
+MAX_TESELAS_DISCO = 20000
+
+_cerrojo = threading.Lock()
+_memoria = OrderedDict()
+_bytes_memoria = 0
+_rasteres = {}
+_servidor = None
+_escrituras_disco = 0
+
+
+# ===============================
+# PALETAS
+# ===============================
+def _color(nombre):
+    if all(c in "0123456789abcdefABCDEF" for c in nombre) and len(nombre) in (3, 6):
+        nombre = "#" + nombre
+    return ImageColor.getrgb(nombre)[:3]
+
+
+def tabla_colores(vis, niveles=256):
+    """Tabla (niveles, 3) uint8 interpolando linealmente la paleta"""
+    paleta = np.array([_color(c) for c in vis["palette"]], dtype=np.float64)
+    posiciones = np.linspace(0, 1, len(paleta))
+    t = np.linspace(0, 1, niveles)
+    return np.stack(
+        [np.interp(t, posiciones, paleta[:, i]) for i in range(3)], axis=1
+    ).round().astype(np.uint8)
+
+
+# ===============================
+# RÁSTERES DE ÍNDICES
+# ===============================
+def raster_indice(anio, indice):
+    """
+    (memmap 2D float32 del índice, metadatos) o None si no hay compuesto.
+    El archivo lleva el sello del compuesto: si este se vuelve a
+    descargar, el ráster se recalcula.
+    """
+    sello = compuestos_locales.sello_compuesto(anio)
+    clave = (anio, indice, sello)
+    with _cerrojo:
+        if clave in _rasteres:
+            return _rasteres[clave]
+
+    # Al abrir un mapa el navegador pide muchas teselas a la vez: solo un
+    # hilo calcula el ráster y el resto espera su resultado
+    return vuelo_unico.compartir(("raster", *clave), _construir_raster, anio, indice, sello)
+
+
+def _construir_raster(anio, indice, sello):
+    clave = (anio, indice, sello)
+    with _cerrojo:
+        if clave in _rasteres:
+            return _rasteres[clave]
+
+    abierto = compuestos_locales.abrir_compuesto(anio)
+    if abierto is None:
+        return None
+    datos, meta = abierto
+
+    nombre = f"{anio}_{indice}_{sello}.npy"
+    ruta = os.path.join(compuestos_locales.DIRECTORIO, nombre)
+    if not os.path.exists(ruta):
+        # Rásteres de descargas anteriores del compuesto (no los temporales
+        # que otro proceso pueda estar escribiendo)
+        with _cerrojo:
+            for vieja in [c for c in _rasteres if c[:2] == (anio, indice)]:
+                del _rasteres[vieja]
+        for vieja in glob.glob(
+            os.path.join(compuestos_locales.DIRECTORIO, f"{anio}_{indice}_*.npy")
+        ):
+            if ".tmp" in os.path.basename(vieja) or os.path.basename(vieja) == nombre:
+                continue
+            try:
+                os.remove(vieja)
+            except OSError:
+                pass
+
+        descriptor, temporal = tempfile.mkstemp(
+            dir=compuestos_locales.DIRECTORIO, prefix=nombre + ".", suffix=".tmp.npy"
+        )
+        os.close(descriptor)
+        try:
+            salida = np.lib.format.open_memmap(
+                temporal, mode="w+", dtype=np.float32, shape=datos.shape[1:]
+            )
+            bandas = {b: datos[i] for i, b in enumerate(meta["bandas"])}
+            calcular_indice_np(bandas, indice, salida=salida)
+            salida.flush()
+            del salida
+            os.replace(temporal, ruta)
+        except BaseException:
+            os.remove(temporal)
+            raise
+
+    resultado = (np.load(ruta, mmap_mode="r"), meta)
+    with _cerrojo:
+        _rasteres[clave] = resultado
+    return resultado
+
+
+# ===============================
+# RENDER
+# ===============================
+def _lonlat_tesela(z, x, y):
+    """Longitudes (columnas) y latitudes (filas) de los centros de píxel"""
+    n = TAM * 2 ** z
+    px = (x * TAM + np.arange(TAM) + 0.5) / n
+    py = (y * TAM + np.arange(TAM) + 0.5) / n
+    lon = px * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * py))))
+    return lon, lat
+
+
+def _muestrear(raster, meta, z, x, y):
+    """Valores (TAM, TAM) de la tesela por vecino más próximo; NaN fuera"""
+    sx, _, x0, _, sy, y0 = meta["transformada"]
+
+    lon, lat = _lonlat_tesela(z, x, y)
+    cols = np.floor((lon - x0) / sx).astype(np.int64)
+    filas = np.floor((lat - y0) / sy).astype(np.int64)
+    col_ok = (cols >= 0) & (cols < raster.shape[-1])
+    fila_ok = (filas >= 0) & (filas < raster.shape[-2])
+
+    valores = np.full(raster.shape[:-2] + (TAM, TAM), np.nan, dtype=np.float32)
+    if col_ok.any() and fila_ok.any():
+        # Solo se leen del memmap las filas necesarias
+        valores[..., fila_ok[:, None] & col_ok[None, :]] = (
+            raster[..., filas[fila_ok], :][..., cols[col_ok]]
+        ).reshape(raster.shape[:-2] + (-1,))
+    return valores
+
+
+def renderizar_tesela(anio, capa, z, x, y):
+    """PNG (bytes) de la tesela o None si no hay compuesto local"""
+    anomalia = capa.endswith(SUFIJO_ANOMALIA)
+    indice = capa[:-len(SUFIJO_ANOMALIA)] if anomalia else capa
+
+    abierto = raster_indice(anio, indice)
+    if abierto is None:
+        return None
+    valores = _muestrear(*abierto, z, x, y)
+
+    if anomalia:
+        clim = climatologia.abrir_climatologia(indice)
+        if clim is None:
+            return None
+        media, desviacion = _muestrear(*clim, z, x, y)
+        valores = climatologia.anomalia_np(valores, media, desviacion)
+
+    vis = vis_capa(capa)
+    tabla = tabla_colores(vis)
+    validos = ~np.isnan(valores)
+    norm = (np.nan_to_num(valores) - vis["min"]) / (vis["max"] - vis["min"])
+    niveles = np.clip(norm * (len(tabla) - 1), 0, len(tabla) - 1).astype(np.int64)
+
+    rgba = np.zeros((TAM, TAM, 4), dtype=np.uint8)
+    rgba[..., :3] = tabla[niveles]
+    rgba[..., 3] = np.where(validos, 255, 0)
+
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, "RGBA").save(buffer, format="PNG", optimize=False)
+    return buffer.getvalue()
+
+
+# ===============================
+# LRU MEMORIA + DISCO
+# ===============================
+def _ruta_disco(clave):
+    anio, indice, sello, z, x, y = clave
+    return os.path.join(DIRECTORIO, indice, str(anio), sello, str(z), str(x), f"{y}.png")
+
+
+def _recordar(clave, png):
+    global _bytes_memoria
+    with _cerrojo:
+        if clave in _memoria:
+            _memoria.move_to_end(clave)
+            return
+        _memoria[clave] = png
+        _bytes_memoria += len(png)
+        while _bytes_memoria > MAX_BYTES_MEMORIA and _memoria:
+            _, viejo = _memoria.popitem(last=False)
+            _bytes_memoria -= len(viejo)
+
+
+def _podar_disco():
+    """Elimina las teselas menos usadas si se supera el máximo en disco"""
+    archivos = []
+    for raiz, _, nombres in os.walk(DIRECTORIO):
+        for nombre in nombres:
+            ruta = os.path.join(raiz, nombre)
+            archivos.append((os.stat(ruta).st_mtime, ruta))
+    if len(archivos) <= MAX_TESELAS_DISCO:
+        return
+    archivos.sort()
+    for _, ruta in archivos[:len(archivos) - MAX_TESELAS_DISCO]:
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+
+def obtener_tesela(anio, indice, z, x, y):
+    """
+    PNG desde memoria, disco o render (en ese orden). La clave incluye el
+    sello del compuesto: tras una nueva descarga no se sirven teselas viejas.
+    """
+    global _escrituras_disco
+    sello = compuestos_locales.sello_compuesto(anio)
+    if sello is None:
+        return None
+    clave = (anio, indice, sello, z, x, y)
+
+    with _cerrojo:
+        png = _memoria.get(clave)
+        if png is not None:
+            _memoria.move_to_end(clave)
+    registrar_cache("teselas_memoria", png is not None)
+    if png is not None:
+        return png
+
+    ruta = _ruta_disco(clave)
+    registrar_cache("teselas_disco", os.path.exists(ruta))
+    if os.path.exists(ruta):
+        with open(ruta, "rb") as f:
+            png = f.read()
+        os.utime(ruta)
+        _recordar(clave, png)
+        return png
+
+    png = renderizar_tesela(anio, indice, z, x, y)
+    if png is None:
+        return None
+
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(png)
+    os.replace(temporal, ruta)
+    _recordar(clave, png)
+
+    with _cerrojo:
+        _escrituras_disco += 1
+        podar = _escrituras_disco % 500 == 0
+    if podar:
+        _podar_disco()
+    return png
+
+
+# ===============================
+# SERVIDOR HTTP
+# ===============================
+def url_teselas(anio, indice):
+    """
+    Plantilla XYZ del servidor local para folium. El sello del compuesto
+    va en la consulta para que el navegador no reutilice teselas viejas.
+    """
+    sello = compuestos_locales.sello_compuesto(anio)
+    return f"{URL_BASE}/teselas/{indice}/{anio}/{{z}}/{{x}}/{{y}}.png?v={sello}"
+
+
+def disponible(anio, capa=None):
+    if not (ACTIVO and compuestos_locales.compuesto_disponible(anio)):
+        return False
+    if capa is not None and capa.endswith(SUFIJO_ANOMALIA):
+        return climatologia.climatologia_disponible(capa[:-len(SUFIJO_ANOMALIA)])
+    return True
+
+
+def iniciar_servidor(puerto=PUERTO):
+    """Arranca (una vez por proceso) el servidor tornado en un hilo aparte"""
+    global _servidor
+    with _cerrojo:
+        if _servidor is not None:
+            return _servidor
+
+        import tornado.web
+
+        class ManejadorTesela(tornado.web.RequestHandler):
+            async def get(self, indice, anio, z, x, y):
+                if vis_capa(indice) is None:
+                    raise tornado.web.HTTPError(404)
+                png = await asyncio.get_running_loop().run_in_executor(
+                    None, obtener_tesela, int(anio), indice, int(z), int(x), int(y)
+                )
+                if png is None:
+                    raise tornado.web.HTTPError(404)
+                self.set_header("Content-Type", "image/png")
+                self.set_header("Cache-Control", "public, max-age=86400")
+                self.set_header("Access-Control-Allow-Origin", "*")
+                self.write(png)
+
+        listo = threading.Event()
+
+        def ejecutar():
+            bucle = asyncio.new_event_loop()
+            asyncio.set_event_loop(bucle)
+            app = tornado.web.Application([
+                (r"/teselas/(\w+)/(\d+)/(\d+)/(\d+)/(\d+)\.png", ManejadorTesela),
+            ])
+            try:
+                app.listen(puerto)
+            except OSError:
+                # Otro proceso del mismo host ya sirve las teselas
+                listo.set()
+                return
+            listo.set()
+            bucle.run_forever()
+
+        _servidor = threading.Thread(target=ejecutar, name="teselas", daemon=True)
+        _servidor.start()
+        listo.wait(timeout=5)
+        return _servidor
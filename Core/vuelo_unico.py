@@ -0,0 +1,71 @@
+"""
+Coalescencia de peticiones a GEE entre sesiones ("single flight").
+
+Si varias sesiones piden a la vez el mismo cálculo (misma clave), solo la
+primera lo ejecuta; las demás esperan a ese vuelo y reciben su resultado
+o su excepción. Cada espera tiene su propio tiempo límite: si vence, esa
+sesión recibe TimeoutError y el vuelo sigue para el resto. Así, durante
+un pico de tráfico, GEE recibe como mucho una llamada por clave distinta.
+"""
+import threading
+from concurrent.futures import Future
+
+from Core.instrumentacion import registrar_cache
+
+# Espera máxima por defecto de cada sesión que se une a un vuelo ajeno
+ESPERA = 300
+
+_cerrojo = threading.Lock()
+_vuelos = {}
+
+
+def iniciar(clave):
+    """
+    (futuro, lider). Si lider es True, quien llama debe ejecutar el
+    cálculo y cerrarlo con terminar(); si no, basta con esperar al futuro.
+    """
+    with _cerrojo:
+        futuro = _vuelos.get(clave)
+        lider = futuro is None
+        if lider:
+            futuro = Future()
+            futuro.set_running_or_notify_cancel()
+            _vuelos[clave] = futuro
+    registrar_cache("vuelo_unico", not lider)
+    return futuro, lider
+
+
+def terminar(clave, resultado=None, error=None):
+    """Publica el resultado (o el error) del vuelo y lo retira"""
+    with _cerrojo:
+        futuro = _vuelos.pop(clave)
+    if error is not None:
+        futuro.set_exception(error)
+    else:
+        futuro.set_result(resultado)
+
+
+def esperar(futuro, espera=None):
+    """Resultado de un vuelo ajeno; propaga su excepción o TimeoutError"""
+    return futuro.result(timeout=ESPERA if espera is None else espera)
+
+
+def compartir(clave, fn, *args, espera=None, **kwargs):
+    """Ejecuta fn(*args, **kwargs) una sola vez por clave entre hilos concurrentes"""
+    futuro, lider = iniciar(clave)
+    if not lider:
+        return esperar(futuro, espera)
+
+    try:
+        resultado = fn(*args, **kwargs)
+    except BaseException as e:
+        terminar(clave, error=e)
+        raise
+    terminar(clave, resultado)
+    return resultado
+
+
+def en_vuelo():
+    """Número de cálculos en curso"""
+    with _cerrojo:
+        return len(_vuelos)
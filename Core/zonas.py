@@ -0,0 +1,227 @@
+"""
+Conjuntos de zonas de análisis dentro de la zona de estudio.
+
+Las zonas (buffers de la vía, distritos, parcelas de control...) se leen
+de un GeoJSON local: una FeatureCollection de Polygon/MultiPolygon con la
+propiedad "nombre". Las estadísticas por zona se calculan en Core.datos
+con reduceRegions: todas las zonas de un año en una sola reducción y
+varios años por petición, de modo que añadir zonas no añade viajes a GEE.
+
+Un clic del mapa se resuelve a su zona sin consultar a GEE: una rejilla
+regular sobre los límites del conjunto guarda en cada celda las zonas
+cuyo rectángulo envolvente la toca, y solo esas se comprueban con punto
+en polígono.
+"""
+import os
+import json
+import hashlib
+import threading
+from functools import lru_cache
+from collections import defaultdict
+
+import numpy as np
+
+from Core import almacen
+
+RUTA_ZONAS = os.getenv("LANDSAT_ZONAS") or os.path.join(
+    os.path.dirname(almacen.RUTA_ALMACEN), "zonas.geojson"
+)
+PROPIEDAD_NOMBRE = "nombre"
+CELDAS = 64  # celdas por lado de la rejilla del índice espacial
+
+_por_huella = {}
+_mascaras = {}
+_cerrojo = threading.Lock()
+
+
+# ===============================
+# GEOMETRÍA
+# ===============================
+def _poligonos(geometria):
+    """Polígonos de un GeoJSON como listas de anillos (exterior y huecos)"""
+    if geometria["type"] == "Polygon":
+        return [geometria["coordinates"]]
+    if geometria["type"] == "MultiPolygon":
+        return geometria["coordinates"]
+    raise ValueError(f"Geometría no soportada: {geometria['type']}")
+
+
+def limites(geometria):
+    """[oeste, sur, este, norte] de un Polygon o MultiPolygon"""
+    puntos = [p for poligono in _poligonos(geometria) for anillo in poligono for p in anillo]
+    xs = [p[0] for p in puntos]
+    ys = [p[1] for p in puntos]
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+def contiene(geometria, lon, lat):
+    """
+    Punto(s) dentro de la geometría, con la regla par-impar (los huecos
+    restan). lon y lat pueden ser escalares o arreglos NumPy.
+    """
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    dentro = np.zeros(np.broadcast(lon, lat).shape, dtype=bool)
+
+    for poligono in _poligonos(geometria):
+        en_poligono = np.zeros_like(dentro)
+        for anillo in poligono:
+            puntos = np.asarray(anillo, dtype=np.float64)
+            for (xa, ya), (xb, yb) in zip(puntos[:-1], puntos[1:]):
+                if ya == yb:
+                    continue
+                cruza = (ya > lat) != (yb > lat)
+                corte = xa + (lat - ya) * (xb - xa) / (yb - ya)
+                en_poligono ^= cruza & (lon < corte)
+        dentro |= en_poligono
+
+    return dentro
+
+
+# ===============================
+# CONJUNTOS DE ZONAS
+# ===============================
+def cargar_zonas(ruta=RUTA_ZONAS):
+    """
+    Conjunto de zonas del GeoJSON, o None si no existe. Se relee solo si
+    el archivo cambia.
+
+    Devuelve {"zonas": [{"nombre", "geometry", "limites"}], "huella",
+    "indice"}; es compartido entre sesiones y no debe modificarse.
+    """
+    if not os.path.exists(ruta):
+        return None
+    return _cargar(ruta, os.path.getmtime(ruta))
+
+
+@lru_cache(maxsize=4)
+def _cargar(ruta, _mtime):
+
+    with open(ruta) as f:
+        geojson = json.load(f)
+
+    zonas = []
+    for i, feature in enumerate(geojson.get("features", [])):
+        geometria = feature.get("geometry")
+        if not geometria or geometria["type"] not in ("Polygon", "MultiPolygon"):
+            continue
+        props = feature.get("properties") or {}
+        zonas.append({
+            "nombre": str(props.get(PROPIEDAD_NOMBRE) or f"zona_{i + 1}"),
+            "geometry": geometria,
+            "limites": limites(geometria),
+        })
+
+    nombres = [z["nombre"] for z in zonas]
+    repetidos = sorted({n for n in nombres if nombres.count(n) > 1})
+    if repetidos:
+        raise ValueError(f"Nombres de zona repetidos en {ruta}: {', '.join(repetidos)}")
+
+    huella = hashlib.sha256(
+        json.dumps([[z["nombre"], z["geometry"]] for z in zonas], sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+    conjunto = {"zonas": zonas, "huella": huella, "indice": indice_espacial(zonas)}
+    with _cerrojo:
+        _por_huella[huella] = conjunto
+    return conjunto
+
+
+def conjunto_por_huella(huella):
+    """Conjunto ya cargado con esa huella (o None)"""
+    with _cerrojo:
+        return _por_huella.get(huella)
+
+
+# ===============================
+# ÍNDICE ESPACIAL
+# ===============================
+def _celda(valor, origen, tam, celdas):
+    return min(celdas - 1, max(0, int((valor - origen) / tam)))
+
+
+def indice_espacial(zonas, celdas=CELDAS):
+    """Rejilla celda -> posiciones de las zonas cuyo envolvente la toca"""
+    if not zonas:
+        return None
+
+    oeste = min(z["limites"][0] for z in zonas)
+    sur = min(z["limites"][1] for z in zonas)
+    este = max(z["limites"][2] for z in zonas)
+    norte = max(z["limites"][3] for z in zonas)
+    ancho = max((este - oeste) / celdas, 1e-12)
+    alto = max((norte - sur) / celdas, 1e-12)
+
+    rejilla = defaultdict(list)
+    for k, zona in enumerate(zonas):
+        o, s, e, n = zona["limites"]
+        for i in range(_celda(o, oeste, ancho, celdas), _celda(e, oeste, ancho, celdas) + 1):
+            for j in range(_celda(s, sur, alto, celdas), _celda(n, sur, alto, celdas) + 1):
+                rejilla[(i, j)].append(k)
+
+    return {
+        "limites": [oeste, sur, este, norte],
+        "ancho": ancho,
+        "alto": alto,
+        "celdas": celdas,
+        "rejilla": dict(rejilla),
+    }
+
+
+def zonas_en_punto(conjunto, lon, lat):
+    """Zonas que contienen el punto (pueden solaparse), sin acceso a GEE"""
+    indice = conjunto["indice"]
+    if indice is None:
+        return []
+
+    oeste, sur, este, norte = indice["limites"]
+    if not (oeste <= lon <= este and sur <= lat <= norte):
+        return []
+
+    celda = (
+        _celda(lon, oeste, indice["ancho"], indice["celdas"]),
+        _celda(lat, sur, indice["alto"], indice["celdas"]),
+    )
+    encontradas = []
+    for k in indice["rejilla"].get(celda, []):
+        zona = conjunto["zonas"][k]
+        o, s, e, n = zona["limites"]
+        if o <= lon <= e and s <= lat <= n and contiene(zona["geometry"], lon, lat):
+            encontradas.append(zona)
+    return encontradas
+
+
+# ===============================
+# MÁSCARAS SOBRE COMPUESTOS LOCALES
+# ===============================
+def mascaras(conjunto, meta):
+    """
+    (zona, (fila_ini, fila_fin, col_ini, col_fin), máscara) de cada zona
+    sobre la rejilla de un compuesto local. La máscara cubre solo la
+    ventana de la zona (centros de píxel dentro del polígono).
+    """
+    clave = (conjunto["huella"], tuple(meta["transformada"]), meta["filas"], meta["columnas"])
+    with _cerrojo:
+        guardadas = _mascaras.get(clave)
+    if guardadas is not None:
+        return guardadas
+
+    sx, _, x0, _, sy, y0 = meta["transformada"]
+    guardadas = []
+    for zona in conjunto["zonas"]:
+        o, s, e, n = zona["limites"]
+        f0 = max(0, int(np.floor((n - y0) / sy)))
+        f1 = min(meta["filas"], int(np.ceil((s - y0) / sy)))
+        c0 = max(0, int(np.floor((o - x0) / sx)))
+        c1 = min(meta["columnas"], int(np.ceil((e - x0) / sx)))
+        if f0 >= f1 or c0 >= c1:
+            continue
+
+        lon = x0 + (np.arange(c0, c1) + 0.5) * sx
+        lat = y0 + (np.arange(f0, f1) + 0.5) * sy
+        mascara = contiene(zona["geometry"], lon[None, :], lat[:, None])
+        guardadas.append((zona, (f0, f1, c0, c1), mascara))
+
+    with _cerrojo:
+        _mascaras[clave] = guardadas
+    return guardadas
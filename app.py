@@ -1,5 +1,10 @@
 import streamlit as st
-from Core.gee_init import inicializar_gee, obtener_zona_estudio
+from Core.gee_init import (
+    arranque_excedido,
+    inicializar_gee,
+    tiempos_arranque,
+    zona_estudio_proceso,
+)
 
 # SOLO el archivo principal tiene st.set_page_config
 st.set_page_config(
@@ -7,23 +12,6 @@ st.set_page_config(
     layout="wide",
 )
 
-# Inicializar GEE primero
-try:
-    inicializar_gee()
-except Exception as e:
-    st.error(f"Error al inicializar Google Earth Engine: {str(e)}")
-    st.info("Por favor, verifica tus credenciales de GEE en las variables de entorno.")
-    st.stop()
-
-# Luego obtener la zona de estudio
-if "zona_estudio" not in st.session_state:
-    try:
-        st.session_state["zona_estudio"] = obtener_zona_estudio()
-    except Exception as e:
-        st.error(f"Error al cargar la zona de estudio: {str(e)}")
-        st.info("Verifica que el asset 'projects/fourth-return-458106-r5/assets/uchumayo' exista y sea accesible.")
-        st.stop()
-
 # ===============================
 # PÁGINA DE INICIO
 # ===============================
@@ -42,12 +30,16 @@ usando la tecnología satelital georreferencial .
 - Visualiza índices espectrales de un año específico
 - Explora diferentes índices de vegetación y agua
 - Ajusta la opacidad de las capas
+- Haz clic en el mapa para ver las estadísticas de la zona (si hay un GeoJSON de zonas)
 
 **Análisis Multitemporal**
-- Compara 3 años diferentes simultáneamente
+- Compara varios años simultáneamente
 - Visualiza series temporales (2000-2025)
 - Analiza anomalías y tendencias
 - Estadísticas por periodo
+- Promedios por zona (vías, distritos, parcelas de control)
+- Exporta series y estadísticas (Parquet/CSV) y rásteres GeoTIFF
+- Escenas disponibles por año (los años sin escenas se marcan y no se consultan)
 
 ## Índices disponibles:
 - **NDVI** - Índice de Vegetación Normalizado
@@ -61,6 +53,28 @@ usando la tecnología satelital georreferencial .
 ---
 """)
 
+# Inicializar GEE después de pintar el texto: la primera vista no espera
+# a la importación de `ee` ni a la inicialización (idempotente por proceso)
+try:
+    with st.spinner("Conectando con Google Earth Engine..."):
+        inicializar_gee()
+except Exception as e:
+    st.error(f"Error al inicializar Google Earth Engine: {str(e)}")
+    st.info("Por favor, verifica tus credenciales de GEE en las variables de entorno.")
+    st.stop()
+
+# Luego obtener la zona de estudio (una vez por proceso, desde la
+# instantánea local si existe)
+try:
+    zona_estudio_proceso()
+except Exception as e:
+    st.error(f"Error al cargar la zona de estudio: {str(e)}")
+    st.info("Verifica que el asset 'projects/fourth-return-458106-r5/assets/uchumayo' exista y sea accesible.")
+    st.stop()
+
+if arranque_excedido():
+    st.caption(f"Arranque lento: {tiempos_arranque}")
+
 col1, col2 = st.columns(2)
 
 with col1:
@@ -0,0 +1,640 @@
+"""
+Módulo `ee` simulado para ejecutar Core sin credenciales de GEE.
+
+Implementa, con evaluación inmediata en Python, la parte de la API de
+Earth Engine que usa Core. Los viajes de ida y vuelta (getInfo, getMapId,
+ee.data.computePixels) añaden una latencia configurable, pueden fallar
+con una tasa configurable (o al superar un número de llamadas
+simultáneas, como la cuota de GEE) y se cuentan en `contador`. Los valores son
+sintéticos pero deterministas, de modo que los resultados cacheados y
+los recalculados coinciden.
+"""
+import json
+import time
+import math
+import random
+import hashlib
+import datetime
+import threading
+import types
+
+import numpy as np
+
+CONFIG = {"latencia": 0.02, "tasa_fallos": 0.0, "max_concurrentes": None}
+
+ZONA = {
+    "type": "Polygon",
+    "coordinates": [[
+        [-71.70, -16.55], [-71.40, -16.55], [-71.40, -16.30],
+        [-71.70, -16.30], [-71.70, -16.55],
+    ]],
+}
+
+_cerrojo = threading.Lock()
+_azar = random.Random(0)
+contador = {"getInfo": 0, "getMapId": 0, "computePixels": 0, "tareas": 0}
+_activos = [0]
+
+
+class EEException(Exception):
+    pass
+
+
+def configurar(latencia=None, tasa_fallos=None, max_concurrentes=None, semilla=0):
+    CONFIG["max_concurrentes"] = max_concurrentes
+    if latencia is not None:
+        CONFIG["latencia"] = latencia
+    if tasa_fallos is not None:
+        CONFIG["tasa_fallos"] = tasa_fallos
+    _azar.seed(semilla)
+
+
+def reiniciar_contador():
+    with _cerrojo:
+        for clave in contador:
+            contador[clave] = 0
+
+
+def viajes():
+    with _cerrojo:
+        return dict(contador)
+
+
+def _viaje(tipo):
+    with _cerrojo:
+        contador[tipo] += 1
+        limite = CONFIG["max_concurrentes"]
+        saturado = limite is not None and _activos[0] >= limite
+        falla = saturado or _azar.random() < CONFIG["tasa_fallos"]
+        _activos[0] += 1
+    try:
+        time.sleep(CONFIG["latencia"])
+    finally:
+        with _cerrojo:
+            _activos[0] -= 1
+    if falla:
+        raise EEException("Too many concurrent aggregations.")
+
+
+def _valor(x):
+    """Convierte objetos simulados en valores de Python"""
+    if isinstance(x, _Objeto):
+        return x._valor()
+    if isinstance(x, (list, tuple)):
+        return [_valor(v) for v in x]
+    if isinstance(x, dict):
+        return {k: _valor(v) for k, v in x.items()}
+    return x
+
+
+def _pseudoaleatorio(*partes):
+    """Número determinista en [0, 1) a partir de cualquier clave"""
+    h = hashlib.md5(repr(partes).encode("utf-8")).hexdigest()
+    return int(h[:8], 16) / 0xFFFFFFFF
+
+
+def Initialize(*args, **kwargs):
+    pass
+
+
+class _Objeto:
+
+    def getInfo(self):
+        _viaje("getInfo")
+        return _valor(self)
+
+    def _valor(self):
+        raise NotImplementedError
+
+
+# ===============================
+# TIPOS BÁSICOS
+# ===============================
+class Number(_Objeto):
+
+    def __init__(self, valor):
+        self.v = _valor(valor)
+
+    def _valor(self):
+        return self.v
+
+    def add(self, o):
+        return Number(self.v + _valor(o))
+
+    def subtract(self, o):
+        return Number(self.v - _valor(o))
+
+    def multiply(self, o):
+        return Number(self.v * _valor(o))
+
+    def divide(self, o):
+        return Number(self.v / _valor(o))
+
+    def mod(self, o):
+        return Number(self.v % _valor(o))
+
+    def floor(self):
+        return Number(int(self.v // 1))
+
+    def eq(self, o):
+        return Number(self.v == _valor(o))
+
+    def lte(self, o):
+        return Number(self.v <= _valor(o))
+
+    def gt(self, o):
+        return Number(self.v > _valor(o))
+
+
+class Date(_Objeto):
+
+    def __init__(self, valor):
+        valor = _valor(valor)
+        if isinstance(valor, str):
+            valor = datetime.datetime.fromisoformat(valor).replace(
+                tzinfo=datetime.timezone.utc
+            ).timestamp() * 1000
+        self.millis = valor
+
+    @staticmethod
+    def fromYMD(anio, mes, dia):
+        return Date(f"{_valor(anio):04d}-{_valor(mes):02d}-{_valor(dia):02d}")
+
+    def _fecha(self):
+        return datetime.datetime.fromtimestamp(self.millis / 1000, datetime.timezone.utc)
+
+    def get(self, unidad):
+        return Number(getattr(self._fecha(), unidad))
+
+    def millis_(self):
+        return self.millis
+
+    def _valor(self):
+        return self.millis
+
+
+class List(_Objeto):
+
+    def __init__(self, valores):
+        self.v = list(valores.v) if isinstance(valores, List) else list(valores)
+
+    @staticmethod
+    def sequence(inicio, fin):
+        return List(range(int(_valor(inicio)), int(_valor(fin)) + 1))
+
+    def map(self, fn):
+        return List([fn(x) for x in self.v])
+
+    def cat(self, otra):
+        return List(self.v + List(otra).v)
+
+    def distinct(self):
+        vistos = []
+        for x in self.v:
+            if _valor(x) not in [_valor(y) for y in vistos]:
+                vistos.append(x)
+        return List(vistos)
+
+    def sort(self):
+        return List(sorted(self.v, key=_valor))
+
+    def _valor(self):
+        return [_valor(x) for x in self.v]
+
+
+class Dictionary(_Objeto):
+
+    def __init__(self, valores=None):
+        self.v = dict(_valor(valores) or {})
+
+    def contains(self, clave):
+        return clave in self.v
+
+    def get(self, clave):
+        return self.v[clave]
+
+    def _valor(self):
+        return dict(self.v)
+
+
+class Algorithms:
+
+    @staticmethod
+    def If(condicion, verdadero, falso):
+        return verdadero if _valor(condicion) else falso
+
+
+class Filter:
+
+    @staticmethod
+    def lt(propiedad, valor):
+        return lambda props: props.get(propiedad) is not None and props[propiedad] < _valor(valor)
+
+    @staticmethod
+    def gt(propiedad, valor):
+        return lambda props: props.get(propiedad) is not None and props[propiedad] > _valor(valor)
+
+    @staticmethod
+    def eq(propiedad, valor):
+        return lambda props: props.get(propiedad) == _valor(valor)
+
+    @staticmethod
+    def inList(propiedad, valores):
+        valores = _valor(valores)
+        return lambda props: props.get(propiedad) in valores
+
+
+# ===============================
+# GEOMETRÍAS
+# ===============================
+class Geometry(_Objeto):
+
+    def __init__(self, geojson):
+        self.geojson = geojson
+
+    @staticmethod
+    def Rectangle(limites):
+        o, s, e, n = _valor(limites)
+        return Geometry({
+            "type": "Polygon",
+            "coordinates": [[[o, s], [e, s], [e, n], [o, n], [o, s]]],
+        })
+
+    def bounds(self):
+        puntos = self.geojson["coordinates"][0]
+        xs = [p[0] for p in puntos]
+        ys = [p[1] for p in puntos]
+        return Geometry.Rectangle([min(xs), min(ys), max(xs), max(ys)])
+
+    def serialize(self):
+        return json.dumps(self.geojson, sort_keys=True)
+
+    def _valor(self):
+        return self.geojson
+
+
+# ===============================
+# REDUCTORES E IMÁGENES
+# ===============================
+class Reducer:
+
+    def __init__(self, salidas, histograma=None):
+        self.salidas = salidas
+        self.histograma = histograma
+
+    @staticmethod
+    def mean():
+        return Reducer(["mean"])
+
+    @staticmethod
+    def min():
+        return Reducer(["min"])
+
+    @staticmethod
+    def max():
+        return Reducer(["max"])
+
+    @staticmethod
+    def stdDev():
+        return Reducer(["stdDev"])
+
+    @staticmethod
+    def count():
+        return Reducer(["count"])
+
+    @staticmethod
+    def percentile(percentiles):
+        return Reducer([f"p{p}" for p in percentiles])
+
+    @staticmethod
+    def fixedHistogram(min, max, steps):
+        return Reducer(["histogram"], (min, max, steps))
+
+    def combine(self, otro, outputPrefix="", sharedInputs=False):
+        return Reducer(self.salidas + otro.salidas, self.histograma or otro.histograma)
+
+
+def _estadistico(semilla, banda, salida, histograma=None):
+    media = -0.2 + _pseudoaleatorio(semilla, banda)
+    desviacion = 0.1 + 0.05 * _pseudoaleatorio(semilla, banda, "sd")
+    if salida.startswith("p"):
+        # Aproximación normal: z de los percentiles habituales
+        z = {5: -1.645, 25: -0.674, 50: 0.0, 75: 0.674, 95: 1.645}.get(int(salida[1:]), 0.0)
+        return media + z * desviacion
+    if salida == "count":
+        return 100000 + int(50000 * _pseudoaleatorio(semilla, banda, "n"))
+    if salida == "histogram":
+        minimo, maximo, bins = histograma
+        ancho = (maximo - minimo) / bins
+        return [
+            [minimo + i * ancho,
+             round(1000 * math.exp(-0.5 * ((minimo + (i + 0.5) * ancho - media) / desviacion) ** 2))]
+            for i in range(bins)
+        ]
+    return {
+        "mean": media,
+        "min": media - 0.4,
+        "max": media + 0.4,
+        "stdDev": desviacion,
+    }[salida]
+
+
+class Image(_Objeto):
+
+    def __init__(self, bandas=None, semilla=0, props=None):
+        if isinstance(bandas, str):
+            escena = _escena(bandas)
+            if escena is not None:
+                bandas, semilla, props = escena.bandas, escena.semilla, escena.props
+            else:
+                semilla, bandas = bandas, ["b1"]
+        self.bandas = list(bandas or [])
+        self.semilla = semilla
+        self.props = dict(props or {})
+
+    def _derivada(self, bandas, *clave):
+        return Image(bandas, (self.semilla,) + clave if clave else self.semilla, self.props)
+
+    def _exigir(self, bandas):
+        for b in bandas:
+            if b not in self.bandas:
+                raise EEException(f"Image.select: Pattern '{b}' did not match any bands.")
+
+    @staticmethod
+    def cat(imagenes):
+        bandas = [b for img in imagenes for b in img.bandas]
+        return Image(bandas, tuple(img.semilla for img in imagenes))
+
+    def select(self, origen, destino=None):
+        origen = [origen] if isinstance(origen, str) else list(_valor(origen))
+        self._exigir(origen)
+        return self._derivada(list(destino) if destino else origen)
+
+    def rename(self, nombres):
+        nombres = [nombres] if isinstance(nombres, str) else list(nombres)
+        img = self._derivada(nombres)
+        # La semilla conserva el contenido, no el nombre de las bandas
+        img.alias = dict(zip(nombres, self.bandas))
+        return img
+
+    def normalizedDifference(self, bandas):
+        self._exigir(bandas)
+        return self._derivada(["nd"], "nd", tuple(bandas))
+
+    def expression(self, expresion, mapa):
+        return self._derivada(["constant"], "expr", expresion)
+
+    def subtract(self, otra):
+        return self._derivada(self.bandas, "subtract", getattr(otra, "semilla", otra))
+
+    def divide(self, otra):
+        return self._derivada(self.bandas, "divide", getattr(otra, "semilla", otra))
+
+    def clip(self, geometria):
+        return self
+
+    def toFloat(self):
+        return self
+
+    def unmask(self, valor=None):
+        return self
+
+    def set(self, *args):
+        props = args[0] if len(args) == 1 else {args[0]: args[1]}
+        img = Image(self.bandas, self.semilla, self.props)
+        img.props.update(_valor(props))
+        return img
+
+    def get(self, propiedad):
+        return Number(self.props.get(propiedad))
+
+    def geometry(self):
+        return Geometry(ZONA)
+
+    def reduceRegion(self, reducer, geometry=None, scale=None, **kwargs):
+        # Cada banda conserva una semilla propia (índice + año)
+        if len(self.bandas) == 1 and len(reducer.salidas) == 1:
+            b = self.bandas[0]
+            return Dictionary({
+                b: _estadistico((self.semilla, b), b, reducer.salidas[0], reducer.histograma)
+            })
+        return Dictionary({
+            f"{b}_{s}": _estadistico((self.semilla, b), b, s, reducer.histograma)
+            for b in self.bandas for s in reducer.salidas
+        })
+
+    def reduceRegions(self, collection, reducer, scale=None, **kwargs):
+        # Una semilla por zona: cada Feature conserva sus propiedades
+        return FeatureCollection([
+            f.set({
+                s: _estadistico((self.semilla, b, repr(_valor(f.props))), b, s, reducer.histograma)
+                for b in self.bandas[:1] for s in reducer.salidas
+            })
+            for f in collection.features
+        ])
+
+    def getMapId(self, vis=None):
+        _viaje("getMapId")
+        mapid = hashlib.md5(repr((self.semilla, self.bandas, vis)).encode()).hexdigest()
+        return {
+            "mapid": mapid,
+            "token": "",
+            "tile_fetcher": types.SimpleNamespace(
+                url_format=f"https://earthengine.invalid/{mapid}/{{z}}/{{x}}/{{y}}"
+            ),
+        }
+
+    def _valor(self):
+        return {"type": "Image", "bands": [{"id": b} for b in self.bandas]}
+
+
+# ===============================
+# COLECCIONES
+# ===============================
+def _catalogo(coleccion):
+    """Escenas sintéticas: ~1 por mes y sensor en su periodo operativo"""
+    if "LE07" in coleccion:
+        anios, bandas = range(2000, 2023), ["SR_B1", "SR_B2", "SR_B3", "SR_B4", "SR_B5", "SR_B7"]
+    elif "LC08" in coleccion:
+        anios, bandas = range(2013, 2027), ["SR_B2", "SR_B3", "SR_B4", "SR_B5", "SR_B6", "SR_B7"]
+    else:
+        return []
+
+    escenas = []
+    for anio in anios:
+        for mes in range(1, 13):
+            fecha = Date(f"{anio}-{mes:02d}-15")
+            ident = f"{coleccion.split('/')[1]}_003071_{anio}{mes:02d}15"
+            escenas.append(Image(bandas, ident, {
+                "system:index": ident,
+                "system:time_start": fecha.millis,
+                "CLOUD_COVER": round(100 * _pseudoaleatorio(ident), 1),
+            }))
+    return escenas
+
+
+def _escena(ident):
+    """Escena del catálogo por su ID completo ("LANDSAT/LC08/C02/T1_L2/LC08_...")"""
+    coleccion, _, indice = ident.rpartition("/")
+    for img in _catalogo(coleccion):
+        if img.props["system:index"] == indice:
+            return img
+    return None
+
+
+class ImageCollection(_Objeto):
+
+    def __init__(self, origen):
+        if isinstance(origen, str):
+            self.imagenes = _catalogo(origen)
+        elif isinstance(origen, ImageCollection):
+            self.imagenes = list(origen.imagenes)
+        else:
+            self.imagenes = list(origen.v if isinstance(origen, List) else origen)
+
+    def _con(self, imagenes):
+        return ImageCollection(imagenes)
+
+    def filterDate(self, inicio, fin):
+        ini, fn = Date(inicio).millis, Date(fin).millis
+        return self._con([
+            i for i in self.imagenes
+            if ini <= i.props.get("system:time_start", 0) < fn
+        ])
+
+    def filterBounds(self, geometria):
+        return self
+
+    def filter(self, filtro):
+        return self._con([i for i in self.imagenes if filtro(i.props)])
+
+    def select(self, origen, destino=None):
+        return self._con([i.select(origen, destino) for i in self.imagenes])
+
+    def merge(self, otra):
+        return self._con(self.imagenes + otra.imagenes)
+
+    def map(self, fn):
+        return self._con([fn(i) for i in self.imagenes])
+
+    def median(self):
+        if not self.imagenes:
+            return Image([])
+        ids = tuple(sorted(str(i.props.get("system:index")) for i in self.imagenes))
+        return Image(self.imagenes[0].bandas, hashlib.md5(repr(ids).encode()).hexdigest())
+
+    def reduce(self, reducer):
+        ids = tuple(str(i.semilla) for i in self.imagenes)
+        bandas = [f"{b}_{s}" for b in (self.imagenes[0].bandas if self.imagenes else []) for s in reducer.salidas]
+        return Image(bandas, hashlib.md5(repr(ids).encode()).hexdigest())
+
+    def size(self):
+        return Number(len(self.imagenes))
+
+    def aggregate_array(self, propiedad):
+        return List([i.props.get(propiedad) for i in self.imagenes])
+
+    def _valor(self):
+        return {"type": "ImageCollection", "features": [i.props for i in self.imagenes]}
+
+
+class Feature(_Objeto):
+
+    def __init__(self, geometria, props=None):
+        self.geometria = geometria
+        self.props = _valor(props) or {}
+
+    def set(self, *args):
+        props = args[0] if len(args) == 1 else {args[0]: args[1]}
+        f = Feature(self.geometria, self.props)
+        f.props = {**self.props, **_valor(props)}
+        return f
+
+    def toDictionary(self):
+        return Dictionary(self.props)
+
+    def _valor(self):
+        return {
+            "type": "Feature",
+            "geometry": _valor(self.geometria),
+            "properties": _valor(self.props),
+        }
+
+
+class FeatureCollection(_Objeto):
+
+    def __init__(self, origen):
+        if isinstance(origen, str):
+            self.features = [Feature(Geometry(ZONA), {"asset": origen})]
+        elif isinstance(origen, List):
+            self.features = list(origen.v)
+        elif isinstance(origen, ImageCollection):
+            self.features = list(origen.imagenes)
+        else:
+            self.features = list(origen)
+
+    def geometry(self):
+        return Geometry(ZONA)
+
+    def map(self, fn):
+        return FeatureCollection([fn(f) for f in self.features])
+
+    def flatten(self):
+        return FeatureCollection([f for fc in self.features for f in fc.features])
+
+    def merge(self, otra):
+        return FeatureCollection(self.features + otra.features)
+
+    def _valor(self):
+        return {"type": "FeatureCollection", "features": [_valor(f) for f in self.features]}
+
+
+# ===============================
+# ee.data
+# ===============================
+def _compute_pixels(params):
+    _viaje("computePixels")
+    dims = params["grid"]["dimensions"]
+    forma = (dims["height"], dims["width"])
+    tipo = np.dtype([(b, np.float32) for b in params["bandIds"]])
+    pixeles = np.zeros(forma, dtype=tipo)
+    semilla = repr((getattr(params["expression"], "semilla", None), params["grid"]))
+    rng = np.random.default_rng(int(hashlib.md5(semilla.encode()).hexdigest()[:8], 16))
+    for b in params["bandIds"]:
+        pixeles[b] = rng.uniform(500, 20000, forma)
+    if params.get("fileFormat") == "GEO_TIFF":
+        # Bytes opacos: basta con que sean deterministas por tesela
+        return pixeles.tobytes()
+    return pixeles
+
+
+# Metadatos de los assets que "existen" (p. ej. {"updateTime": ...})
+ASSETS = {}
+
+
+def _get_asset(asset_id):
+    _viaje("getInfo")
+    if asset_id in ASSETS:
+        return dict(ASSETS[asset_id])
+    raise EEException(f"Asset '{asset_id}' not found.")
+
+
+data = types.SimpleNamespace(computePixels=_compute_pixels, getAsset=_get_asset)
+
+
+# ===============================
+# ee.batch
+# ===============================
+class _Tarea:
+
+    def __init__(self, **parametros):
+        self.parametros = parametros
+
+    def start(self):
+        # Lanzar la tarea es un viaje; el asset no aparece hasta que termina
+        _viaje("tareas")
+
+
+batch = types.SimpleNamespace(
+    Export=types.SimpleNamespace(image=types.SimpleNamespace(toAsset=_Tarea))
+)
@@ -0,0 +1,381 @@
+"""
+Benchmarks de las páginas de Exploración y Análisis con un `ee` simulado.
+
+Ejecuta las páginas reales con el AppTest de Streamlit, sin servidor ni
+credenciales, y mide por escenario los viajes a GEE (getInfo, getMapId,
+computePixels), el tiempo total y la tasa de aciertos de los cachés.
+Falla (código de salida 1) si algún escenario hace más viajes por
+render que los límites guardados en bench/limites.json.
+
+Uso:
+    python -m bench.escenarios [--latencia 0.02] [--fallos 0.0]
+                               [--max-concurrentes N] [--usuarios 8]
+                               [--actualizar-limites]
+"""
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+# El almacén, los compuestos y la instantánea de la zona van a un
+# directorio temporal; `ee` se sustituye antes de importar Core.
+_TEMPORAL = tempfile.mkdtemp(prefix="bench_landsat_")
+os.environ["LANDSAT_ALMACEN"] = os.path.join(_TEMPORAL, "resultados.sqlite")
+os.environ["LANDSAT_COMPUESTOS"] = os.path.join(_TEMPORAL, "compuestos")
+os.environ["LANDSAT_ZONA_GEOJSON"] = os.path.join(_TEMPORAL, "uchumayo.geojson")
+
+from bench import ee_falso  # noqa: E402
+
+sys.modules["ee"] = ee_falso
+
+import streamlit.logger  # noqa: E402
+from streamlit.runtime import Runtime  # noqa: E402
+from streamlit.runtime.caching.storage.dummy_cache_storage import (  # noqa: E402
+    MemoryCacheStorageManager,
+)
+from streamlit.runtime.media_file_manager import MediaFileManager  # noqa: E402
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage  # noqa: E402
+from streamlit.testing.v1 import AppTest, app_test  # noqa: E402
+
+from Core import (  # noqa: E402
+    almacen, cache_memoria, catalogo, compuestos_locales, datos, gee_init, instrumentacion,
+    mapas, planificador, zonas,
+)
+
+RUTA_LIMITES = os.path.join(os.path.dirname(__file__), "limites.json")
+RUTA_PAGINAS = os.path.join(os.path.dirname(os.path.dirname(__file__)), "pages")
+EXPLORACION = "1_Exploracion.py"
+ANALISIS = "2_Analisis.py"
+
+# Valores por defecto de la página de Análisis
+ANIOS = [2023, 2020, 2017]
+ZONAS = 1000
+
+
+# ===============================
+# RENDERS DE LAS PÁGINAS
+# ===============================
+def pagina(nombre):
+    """Sesión de navegador sobre una página real (pages/), sin servidor"""
+    return AppTest.from_file(os.path.join(RUTA_PAGINAS, nombre), default_timeout=60)
+
+
+def render(sesion):
+    """
+    Ejecuta la página como un rerun de Streamlit y espera al trabajo que
+    deja en segundo plano (catálogo, compuestos locales): sus viajes
+    cuentan en el render que los lanzó.
+    """
+    sesion.run()
+    futuro = datos._sincronizacion.get("futuro")
+    if futuro is not None:
+        futuro.result()
+    for futuro in list(compuestos_locales._descargas.values()):
+        futuro.result()
+    if sesion.exception:
+        raise RuntimeError(sesion.exception[0].message)
+    return sesion
+
+
+class _RuntimeSesion(Runtime):
+    """Recibe el Runtime simulado que instala cada AppTest"""
+
+
+def sesiones_simultaneas():
+    """
+    AppTest instala un Runtime simulado al empezar cada ejecución y lo quita
+    al terminar: con varias sesiones a la vez, la primera en acabar se lo
+    quitaría a las demás. Durante el escenario se deja uno fijo.
+    """
+    runtime = mock.MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    return mock.patch.object(app_test, "Runtime", _RuntimeSesion)
+
+
+def render_exploracion():
+    return render(pagina(EXPLORACION))
+
+
+def render_analisis(anios=None):
+    sesion = pagina(ANALISIS)
+    if anios is not None:
+        sesion.session_state["anios_sel"] = anios
+    return render(sesion)
+
+
+# ===============================
+# CACHÉS
+# ===============================
+def limpiar_caches():
+    """Deja el proceso como recién arrancado y sin nada en disco"""
+    cache_memoria.limpiar()
+    gee_init.zona_estudio_proceso.clear()
+    for fn in (datos._compuesto, datos._indice):
+        fn.cache_clear()
+    catalogo.vaciar()
+    datos._en_curso.clear()
+    mapas.invalidar()
+    # Todos los tipos guardados, también los que se añadan más adelante
+    for (tipo,) in almacen._conexion().execute("SELECT DISTINCT tipo FROM resultados").fetchall():
+        almacen.invalidar(tipo)
+
+    compuestos_locales._descargas.clear()
+    shutil.rmtree(compuestos_locales.DIRECTORIO, ignore_errors=True)
+    if os.path.exists(gee_init.RUTA_ZONA):
+        os.remove(gee_init.RUTA_ZONA)
+
+
+# ===============================
+# ESCENARIOS
+# ===============================
+def _arranque_en_frio():
+    limpiar_caches()
+    return 1, render_analisis
+
+
+def _cambio_indice():
+    limpiar_caches()
+    sesion = render_analisis()
+    sesion.sidebar.selectbox[0].set_value("EVI")
+    return 1, lambda: render(sesion)
+
+
+def _cambio_anio():
+    limpiar_caches()
+    sesion = render_analisis()
+    sesion.sidebar.multiselect[0].set_value(ANIOS[:2] + [2010])
+    return 1, lambda: render(sesion)
+
+
+def _exploracion_capa_repetida():
+    limpiar_caches()
+    render_analisis()
+    return 1, render_exploracion
+
+
+def _reinicio_proceso():
+    # Cachés del proceso vacíos, pero el almacén en disco ya poblado
+    limpiar_caches()
+    render_analisis()
+    cache_memoria.limpiar()
+    gee_init.zona_estudio_proceso.clear()
+    mapas._entradas.clear()
+    return 1, render_analisis
+
+
+def _escribir_zonas(n):
+    """GeoJSON con n zonas cuadradas repartidas por la zona de estudio"""
+    lado = math.ceil(math.sqrt(n))
+    oeste, sur, este, norte = -71.70, -16.55, -71.40, -16.30
+    ancho, alto = (este - oeste) / lado, (norte - sur) / lado
+    features = []
+    for k in range(n):
+        x, y = oeste + (k % lado) * ancho, sur + (k // lado) * alto
+        features.append({
+            "type": "Feature",
+            "properties": {"nombre": f"zona_{k}"},
+            "geometry": {"type": "Polygon", "coordinates": [[
+                [x, y], [x + ancho, y], [x + ancho, y + alto], [x, y + alto], [x, y],
+            ]]},
+        })
+    with open(zonas.RUTA_ZONAS, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+
+def _arranque_con_zonas():
+    # Mismos viajes con 1000 zonas que con una: un lote de reduceRegions
+    limpiar_caches()
+    _escribir_zonas(ZONAS)
+
+    def ejecutar():
+        try:
+            render_analisis()
+        finally:
+            os.remove(zonas.RUTA_ZONAS)
+
+    return 1, ejecutar
+
+
+def _anio_sin_escenas():
+    # Con el catálogo, 2012 (sin escenas) no llega a GEE ni rompe los lotes
+    limpiar_caches()
+    datos.sincronizar_catalogo()
+    return 1, lambda: render_analisis([2012] + ANIOS[1:])
+
+
+def _catalogo_incremental():
+    # Repetir la sincronización el mismo día no vuelve a pedir escenas
+    limpiar_caches()
+    datos.sincronizar_catalogo()
+    return 1, datos.sincronizar_catalogo
+
+
+def _usuarios_concurrentes(usuarios):
+    def preparar():
+        limpiar_caches()
+
+        def ejecutar():
+            try:
+                with sesiones_simultaneas(), ThreadPoolExecutor(max_workers=usuarios) as pool:
+                    list(pool.map(lambda _: render_analisis(), range(usuarios)))
+            finally:
+                Runtime._instance = None
+
+        return usuarios, ejecutar
+    return preparar
+
+
+def escenarios(usuarios):
+    return {
+        "arranque_en_frio": _arranque_en_frio,
+        "cambio_indice": _cambio_indice,
+        "cambio_anio": _cambio_anio,
+        "exploracion_capa_repetida": _exploracion_capa_repetida,
+        "reinicio_proceso": _reinicio_proceso,
+        "arranque_con_zonas": _arranque_con_zonas,
+        "anio_sin_escenas": _anio_sin_escenas,
+        "catalogo_incremental": _catalogo_incremental,
+        f"usuarios_concurrentes_{usuarios}": _usuarios_concurrentes(usuarios),
+    }
+
+
+def medir(preparar):
+    """Prepara el escenario y mide solo los renders"""
+    renders, ejecutar = preparar()
+    instrumentacion.reiniciar()
+    ee_falso.reiniciar_contador()
+
+    t0 = time.perf_counter()
+    error = None
+    try:
+        ejecutar()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    segundos = time.perf_counter() - t0
+
+    viajes = ee_falso.viajes()
+    caches = instrumentacion.resumen()["caches"]
+    return {
+        "renders": renders,
+        "viajes": viajes,
+        "viajes_por_render": sum(viajes.values()) / renders,
+        "segundos": round(segundos, 3),
+        "planificador": {
+            k: v for k, v in planificador.estado().items() if k in ("reintentos", "agotadas")
+        },
+        "caches": {
+            k: round(v["tasa_aciertos"], 2)
+            for k, v in sorted(caches.items()) if v["tasa_aciertos"] is not None
+        },
+        "error": error,
+    }
+
+
+# ===============================
+# INFORME
+# ===============================
+def _imprimir(nombre, r, limite):
+    estado = "OK"
+    if r["error"]:
+        estado = "ERROR"
+    elif limite is not None and r["viajes_por_render"] > limite:
+        estado = "REGRESIÓN"
+
+    viajes = ", ".join(f"{k}={v}" for k, v in r["viajes"].items() if v)
+    print(f"{nombre:<30} {estado:<10} {r['viajes_por_render']:>6.2f} viajes/render"
+          f" (límite {limite if limite is not None else '-'})  {r['segundos']:.3f} s")
+    if viajes:
+        print(f"    {viajes}")
+    if any(r["planificador"].values()):
+        print("    " + ", ".join(f"{k}={v}" for k, v in r["planificador"].items()))
+    if r["caches"]:
+        print("    " + ", ".join(f"{k}={v:.0%}" for k, v in r["caches"].items()))
+    if r["error"]:
+        print(f"    {r['error']}")
+    return estado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks con un `ee` simulado")
+    parser.add_argument("--latencia", type=float, default=0.02,
+                        help="segundos por viaje a GEE")
+    parser.add_argument("--fallos", type=float, default=0.0,
+                        help="probabilidad de fallo de cada viaje")
+    parser.add_argument("--max-concurrentes", type=int,
+                        help="llamadas simultáneas que acepta el `ee` simulado")
+    parser.add_argument("--usuarios", type=int, default=8)
+    parser.add_argument("--json", help="guardar el informe en este archivo")
+    parser.add_argument("--actualizar-limites", action="store_true",
+                        help="guardar los viajes por render actuales como límites")
+    args = parser.parse_args(argv)
+
+    # Sin servidor, Streamlit avisa de cada hilo sin contexto de sesión
+    streamlit.logger.set_log_level("error")
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+    ee_falso.configurar(
+        latencia=args.latencia,
+        tasa_fallos=args.fallos,
+        max_concurrentes=args.max_concurrentes,
+    )
+    # Esperas entre reintentos a la escala de la latencia simulada
+    planificador.PAUSA_BASE = args.latencia
+    # Se espera siempre a la resolución completa: recuentos deterministas
+    datos.ESPERA_RESOLUCION_COMPLETA = 60
+
+    limites = {}
+    if os.path.exists(RUTA_LIMITES):
+        with open(RUTA_LIMITES) as f:
+            limites = json.load(f)
+
+    informe = {}
+    fallidos = []
+    try:
+        for nombre, preparar in escenarios(args.usuarios).items():
+            informe[nombre] = medir(preparar)
+            # Los usuarios concurrentes se comparan por render, sea cual sea N
+            clave = "usuarios_concurrentes" if nombre.startswith("usuarios_") else nombre
+            estado = _imprimir(nombre, informe[nombre], limites.get(clave))
+            if estado != "OK":
+                fallidos.append(nombre)
+    finally:
+        shutil.rmtree(_TEMPORAL, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+
+    if args.actualizar_limites:
+        nuevos = {}
+        for k, v in informe.items():
+            if v["error"] is not None:
+                continue
+            if k.startswith("usuarios_"):
+                # El reparto entre hilos varía de una ejecución a otra:
+                # se guarda una cota superior en lugar del valor exacto
+                nuevos["usuarios_concurrentes"] = math.ceil(v["viajes_por_render"])
+            else:
+                nuevos[k] = v["viajes_por_render"]
+        with open(RUTA_LIMITES, "w") as f:
+            json.dump(nuevos, f, indent=2)
+            f.write("\n")
+        print(f"Límites guardados en {RUTA_LIMITES}")
+        return 0
+
+    # Con fallos inyectados los recuentos incluyen reintentos: solo informativo
+    if fallidos and args.fallos == 0 and args.max_concurrentes is None:
+        print(f"\nFallan: {', '.join(fallidos)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
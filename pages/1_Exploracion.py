@@ -1,73 +1,26 @@
 import streamlit as st
 import folium
 from streamlit_folium import st_folium
-import ee
 from Core.gee_init import asegurar_zona_estudio
+from Core.instrumentacion import panel_depuracion
+from Core.planificador import CuotaAgotada
+from Core.catalogo import NUBES
+from Core.indices import INDICES
+from Core.datos import (
+    descargar_compuestos_locales,
+    disponibilidad_escenas,
+    estadisticas_zonas,
+    sincronizar_catalogo_en_segundo_plano,
+    url_capa,
+)
+from Core.zonas import cargar_zonas, zonas_en_punto
 
 # ===============================
 # INICIALIZACIÓN Y CONTEXTO
 # ===============================
-zona_estudio = asegurar_zona_estudio()
-
-# ===============================
-# DEFINICIÓN DE ÍNDICES
-# ===============================
-INDICES = {
-    "NDVI": lambda img: img.normalizedDifference(['NIR', 'RED']),
-    "SAVI": lambda img: img.expression(
-        '(NIR - RED) / (NIR + RED + 0.5) * 1.5',
-        {'NIR': img.select('NIR'), 'RED': img.select('RED')}
-    ),
-    "EVI": lambda img: img.expression(
-        '2.5 * ((NIR - RED) / (NIR + 6 * RED - 7.5 * BLUE + 1))',
-        {
-            'NIR': img.select('NIR'),
-            'RED': img.select('RED'),
-            'BLUE': img.select('BLUE')
-        }
-    ),
-    "GNDVI": lambda img: img.normalizedDifference(['NIR', 'GREEN']),
-    "LSWI": lambda img: img.normalizedDifference(['NIR', 'SWIR1']),
-    "NDWI": lambda img: img.normalizedDifference(['GREEN', 'NIR']),
-    "MNDWI": lambda img: img.normalizedDifference(['GREEN', 'SWIR1'])
-}
-
-VIS_PARAMS = {
-    "NDVI": {"min": -0.2, "max": 0.9, "palette": ["brown", "yellow", "green"]},
-    "SAVI": {"min": -0.2, "max": 0.9, "palette": ["brown", "yellow", "green"]},
-    "EVI":  {"min": -0.2, "max": 0.9, "palette": ["brown", "yellow", "green"]},
-    "GNDVI":{"min": -0.2, "max": 0.9, "palette": ["brown", "yellow", "green"]},
-    "LSWI": {"min": -0.5, "max": 0.8, "palette": ["brown", "white", "blue"]},
-    "NDWI": {"min": -0.5, "max": 0.8, "palette": ["white", "cyan", "blue"]},
-    "MNDWI":{"min": -0.5, "max": 0.8, "palette": ["white", "lightblue", "darkblue"]}
-}
-
-# ===============================
-# FUNCIONES
-# ===============================
-@st.cache_data(show_spinner=False)
-def obtener_imagen(anio, indice, _zona_estudio):
-    fecha_inicio = ee.Date.fromYMD(anio, 1, 1)
-    fecha_fin = ee.Date.fromYMD(anio, 12, 31)
-
-    if anio <= 2011:
-        coleccion = ee.ImageCollection('LANDSAT/LE07/C02/T1_L2')
-        bandas = ['SR_B1','SR_B2','SR_B3','SR_B4','SR_B5','SR_B7']
-    else:
-        coleccion = ee.ImageCollection('LANDSAT/LC08/C02/T1_L2')
-        bandas = ['SR_B2','SR_B3','SR_B4','SR_B5','SR_B6','SR_B7']
-
-    imagen = (
-        coleccion
-        .filterDate(fecha_inicio, fecha_fin)
-        .filterBounds(_zona_estudio)
-        .filter(ee.Filter.lt('CLOUD_COVER', 20))
-        .median()
-        .select(bandas)
-        .rename(['BLUE','GREEN','RED','NIR','SWIR1','SWIR2'])
-    )
-
-    return INDICES[indice](imagen).rename(indice).clip(_zona_estudio)
+asegurar_zona_estudio()
+# El catálogo de escenas se pone al día en segundo plano (si es viejo)
+sincronizar_catalogo_en_segundo_plano()
 
 # ===============================
 # INTERFAZ
@@ -77,23 +30,106 @@ st.title("Exploración Espacial – Índice Espectral")
 with st.sidebar:
     indice = st.selectbox("Índice espectral", list(INDICES.keys()))
     anio = st.selectbox("Año", range(2000, 2026), index=23)
+
+    # Misma capa (y mismo caché) que usa la página de Análisis
+    try:
+        url_teselas = url_capa(anio, indice)
+    except CuotaAgotada as e:
+        st.error(str(e))
+        st.stop()
+    descargar_compuestos_locales([anio])
+
+    # Disponibilidad según el catálogo local, sin consultar a GEE
+    disponible = disponibilidad_escenas(anio, anio).get(anio)
+    if disponible is not None:
+        st.caption(
+            f"{disponible['utiles']} de {disponible['escenas']} escenas "
+            f"{disponible['sensor']} con menos del {NUBES} % de nubes"
+        )
+
+if url_teselas is None:
+    st.warning(f"No hay escenas Landsat útiles de {anio} sobre la zona de estudio.")
+    st.stop()
+
+
+# El mapa base se monta una sola vez (clave fija); la capa del índice se
+# envía aparte, de modo que cambiar año, índice u opacidad solo sustituye
+# esa capa. La opacidad vive en un fragmento: moverla no vuelve a
+# ejecutar la página ni pide nada a GEE. Con un conjunto de zonas, un clic
+# en el mapa se resuelve a su zona con el índice espacial local.
+@st.fragment
+def mapa_indice(url_teselas, indice, anio):
     opacidad = st.slider("Opacidad", 0.0, 1.0, 0.7, 0.1)
+    conjunto = cargar_zonas()
+
+    mapa = folium.Map(
+        location=[-16.42, -71.54],
+        zoom_start=11,
+        tiles="OpenStreetMap"
+    )
 
-    imagen = obtener_imagen(anio, indice, zona_estudio)
-    tiles = imagen.getMapId(VIS_PARAMS[indice])
+    capa = folium.FeatureGroup(name="Índice")
+    folium.TileLayer(
+        tiles=url_teselas,
+        attr="Google Earth Engine",
+        overlay=True,
+        opacity=opacidad
+    ).add_to(capa)
 
-mapa = folium.Map(
-    location=[-16.42, -71.54],
-    zoom_start=11,
-    tiles="OpenStreetMap"
-)
+    if conjunto is not None:
+        folium.GeoJson(
+            {
+                "type": "FeatureCollection",
+                "features": [
+                    {"type": "Feature", "properties": {"nombre": z["nombre"]},
+                     "geometry": z["geometry"]}
+                    for z in conjunto["zonas"]
+                ],
+            },
+            style_function=lambda _: {"color": "black", "weight": 1, "fillOpacity": 0},
+            tooltip=folium.GeoJsonTooltip(fields=["nombre"], labels=False)
+        ).add_to(capa)
+
+    salida = st_folium(
+        mapa,
+        width=1200,
+        height=650,
+        key="mapa_exploracion",
+        feature_group_to_add=capa,
+        returned_objects=["last_clicked"] if conjunto is not None else []
+    )
+
+    clic = (salida or {}).get("last_clicked")
+    if conjunto is None or not clic:
+        return
+
+    encontradas = zonas_en_punto(conjunto, clic["lng"], clic["lat"])
+    if not encontradas:
+        st.caption("El punto no está en ninguna zona.")
+        return
+
+    try:
+        stats_zonas = estadisticas_zonas(indice, (anio,))[anio]
+    except CuotaAgotada as e:
+        st.error(str(e))
+        return
+
+    for zona in encontradas:
+        stats = stats_zonas.get(zona["nombre"])
+        if not stats or stats["mean"] is None:
+            st.markdown(f"**{zona['nombre']}:** sin datos en {anio}")
+            continue
+        st.markdown(
+            f"""
+            **{zona['nombre']}** – {indice} {anio}  
+            **Promedio:** {stats['mean']:.3f}  
+            **Mínimo:** {stats['min']:.3f}  
+            **Máximo:** {stats['max']:.3f}  
+            **Píxeles:** {stats['count']:,}
+            """
+        )
 
-folium.TileLayer(
-    tiles=tiles["tile_fetcher"].url_format,
-    attr="Google Earth Engine",
-    overlay=True,
-    opacity=opacidad
-).add_to(mapa)
 
+mapa_indice(url_teselas, indice, anio)
 
-st_folium(mapa, width=1200, height=650, key=f"mapa_{indice}_{anio}_{opacidad}")
+panel_depuracion()
@@ -1,142 +1,72 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import ee
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import folium
 from streamlit_folium import st_folium
-import plotly.graph_objects as go
 from Core.gee_init import asegurar_zona_estudio 
+from Core.instrumentacion import panel_depuracion
+from Core.planificador import CuotaAgotada
+from Core.exportar import FORMATOS, TABLAS, exportar_tabla, zip_rasteres
+from Core.indices import INDICES
+from Core.datos import (
+    GRANULARIDADES,
+    bordes_histograma,
+    descargar_compuestos_locales,
+    disponibilidad_escenas,
+    distribucion_anios,
+    error_resolucion_completa,
+    estadisticas_anios,
+    estadisticas_indice,
+    estadisticas_zonas,
+    resolucion_completa_lista,
+    resultado_progresivo,
+    serie_temporal,
+    sincronizar_catalogo_en_segundo_plano,
+    sin_escenas,
+    url_anomalia,
+    url_capa,
+)
 
 # ===============================
 # CONTEXTO COMPARTIDO
 # ===============================
-zona_estudio = asegurar_zona_estudio()
-
-# ===============================
-# DEFINICIÓN DE ÍNDICES
-# ===============================
-INDICES = {
-    "NDVI": lambda img: img.normalizedDifference(['NIR', 'RED']),
-    "SAVI": lambda img: img.expression(
-        '(NIR - RED) / (NIR + RED + 0.5) * 1.5',
-        {'NIR': img.select('NIR'), 'RED': img.select('RED')}
-    ),
-    "EVI": lambda img: img.expression(
-        '2.5 * ((NIR - RED) / (NIR + 6 * RED - 7.5 * BLUE + 1))',
-        {
-            'NIR': img.select('NIR'),
-            'RED': img.select('RED'),
-            'BLUE': img.select('BLUE')
-        }
-    ),
-    "GNDVI": lambda img: img.normalizedDifference(['NIR', 'GREEN']),
-    "LSWI": lambda img: img.normalizedDifference(['NIR', 'SWIR1']),
-    "NDWI": lambda img: img.normalizedDifference(['GREEN', 'NIR']),
-    "MNDWI": lambda img: img.normalizedDifference(['GREEN', 'SWIR1'])
-}
-
-VIS_PARAMS = {
-    "NDVI": {"min": -0.2, "max": 0.9, "palette": ["brown", "yellow", "green"]},
-    "SAVI": {"min": -0.2, "max": 0.9, "palette": ["brown", "yellow", "green"]},
-    "EVI":  {"min": -0.2, "max": 0.9, "palette": ["brown", "yellow", "green"]},
-    "GNDVI":{"min": -0.2, "max": 0.9, "palette": ["brown", "yellow", "green"]},
-    "LSWI": {"min": -0.5, "max": 0.8, "palette": ["brown", "white", "blue"]},
-    "NDWI": {"min": -0.5, "max": 0.8, "palette": ["white", "cyan", "blue"]},
-    "MNDWI":{"min": -0.5, "max": 0.8, "palette": ["white", "lightblue", "darkblue"]}
-}
-
-# ===============================
-# FUNCIONES BASE
-# ===============================
-@st.cache_data(show_spinner=False)
-def obtener_indice(anio, indice):
-    if anio <= 2011:
-        coleccion = ee.ImageCollection("LANDSAT/LE07/C02/T1_L2")
-        bandas = ["SR_B1","SR_B2","SR_B3","SR_B4","SR_B5","SR_B7"]
+asegurar_zona_estudio()
+# El catálogo de escenas se pone al día en segundo plano (si es viejo)
+sincronizar_catalogo_en_segundo_plano()
+
+# Límite de peticiones simultáneas a GEE por sesión
+MAX_PETICIONES_PARALELAS = 4
+COLUMNAS_POR_FILA = 3
+ANIOS_DISTRIBUCION = tuple(range(2000, 2026))
+PERIODOS = [
+    ("2000–2006", 2000, 2006, "red"),
+    ("2007–2012", 2007, 2012, "orange"),
+    ("2013–2025", 2013, 2025, "green"),
+]
+
+
+# Valor de resultado() cuando la petición falló (None es "sin escenas")
+FALLIDO = object()
+
+
+def avisar_error(seccion, error):
+    # Cuota agotada tras los reintentos o espera de un vuelo compartido
+    # agotada: aviso; error de GEE: error. Solo en su sección, sin traza
+    if isinstance(error, (CuotaAgotada, TimeoutError)):
+        st.warning(f"{seccion}: {str(error) or 'GEE tarda demasiado en responder'}. "
+                   "Vuelve a intentarlo en unos minutos.")
     else:
-        coleccion = ee.ImageCollection("LANDSAT/LC08/C02/T1_L2")
-        bandas = ["SR_B2","SR_B3","SR_B4","SR_B5","SR_B6","SR_B7"]
-
-    img = (
-        coleccion
-        .filterDate(f"{anio}-01-01", f"{anio}-12-31")
-        .filterBounds(zona_estudio)
-        .filter(ee.Filter.lt("CLOUD_COVER", 20))
-        .median()
-        .select(bandas)
-        .rename(["BLUE","GREEN","RED","NIR","SWIR1","SWIR2"])
-    )
+        st.error(f"{seccion}: error de Earth Engine ({error}).")
 
-    return INDICES[indice](img).rename(indice).clip(zona_estudio)
-
-@st.cache_data(show_spinner=False)
-def estadisticas_indice(anio, indice):
-    img = obtener_indice(anio, indice)
-    stats = img.reduceRegion(
-        reducer=ee.Reducer.mean()
-        .combine(ee.Reducer.min(), "", True)
-        .combine(ee.Reducer.max(), "", True),
-        geometry=zona_estudio,
-        scale=30,
-        maxPixels=1e9
-    )
-    return stats.getInfo()
 
-@st.cache_data(show_spinner=False)
-def serie_temporal(indice, anio_inicio=2000, anio_fin=2025):
-
-    def calcular(anio):
-        anio = ee.Number(anio)
-
-        coleccion = ee.ImageCollection(
-            ee.Algorithms.If(
-                anio.lte(2011),
-                ee.ImageCollection("LANDSAT/LE07/C02/T1_L2"),
-                ee.ImageCollection("LANDSAT/LC08/C02/T1_L2")
-            )
-        ).filterDate(
-            ee.Date.fromYMD(anio, 1, 1),
-            ee.Date.fromYMD(anio, 12, 31)
-        ).filterBounds(zona_estudio).filter(
-            ee.Filter.lt("CLOUD_COVER", 20)
-        )
-
-        def calc():
-            img = coleccion.median()
-            bandas = ee.List(
-                ee.Algorithms.If(
-                    anio.lte(2011),
-                    ["SR_B1","SR_B2","SR_B3","SR_B4","SR_B5","SR_B7"],
-                    ["SR_B2","SR_B3","SR_B4","SR_B5","SR_B6","SR_B7"]
-                )
-            )
-            img = img.select(bandas).rename(
-                ["BLUE","GREEN","RED","NIR","SWIR1","SWIR2"]
-            )
-            ind = INDICES[indice](img).rename(indice)
-            red = ind.reduceRegion(
-                ee.Reducer.mean(),
-                zona_estudio,
-                30,
-                maxPixels=1e9
-            )
-            return ee.Algorithms.If(red.contains(indice), red.get(indice), None)
-
-        return ee.Feature(
-            None,
-            {
-                "Año": anio,
-                "Valor": ee.Algorithms.If(coleccion.size().gt(0), calc(), None)
-            }
-        )
-
-    fc = ee.FeatureCollection(
-        ee.List.sequence(anio_inicio, anio_fin).map(calcular)
-    )
-
-    datos = fc.getInfo()
-    return [
-        {"Año": int(f["properties"]["Año"]), "Valor": f["properties"].get("Valor")}
-        for f in datos["features"]
-    ]
+def resultado(futuro, seccion, si_falla=FALLIDO):
+    try:
+        return futuro.result()
+    except (CuotaAgotada, TimeoutError, ee.EEException) as e:
+        avisar_error(seccion, e)
+        return si_falla
 
 # ===============================
 # INTERFAZ
@@ -146,59 +76,166 @@ st.title("Análisis Multitemporal – Índices Landsat")
 
 with st.sidebar:
     indice = st.selectbox("Índice espectral", list(INDICES.keys()))
-    anios_sel = [
-        st.selectbox("Año 1", range(2000, 2026), index=23),
-        st.selectbox("Año 2", range(2000, 2026), index=20),
-        st.selectbox("Año 3", range(2000, 2026), index=17)
-    ]
-    opacity = st.slider("Opacidad", 0.0, 1.0, 0.6, 0.1)
-
-serie = serie_temporal(indice)
+    anios_sel = st.multiselect(
+        "Años a comparar", list(range(2000, 2026)), default=[2023, 2020, 2017],
+        key="anios_sel"
+    )
+    # Los años sin escenas útiles según el catálogo local se marcan aparte:
+    # cambiar las etiquetas de las opciones al sincronizar el catálogo
+    # haría de la lista un widget nuevo y perdería la selección
+    vacios = [a for a in anios_sel if sin_escenas(a)]
+    if vacios:
+        st.caption(f"Sin escenas útiles: {', '.join(str(a) for a in sorted(vacios))}")
+
+if not anios_sel:
+    st.warning("Selecciona al menos un año.")
+    st.stop()
+
+# Todo el trabajo de GEE se lanza a la vez: la serie, las estadísticas
+# (un único lote para todos los años) y la capa de cada año. El tiempo
+# total lo marca la petición más lenta, no la suma de todas.
+ctx = get_script_run_ctx()
+pool = ThreadPoolExecutor(
+    max_workers=MAX_PETICIONES_PARALELAS,
+    initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+)
+# Serie y estadísticas progresivas: primero una estimación a 300 m si la
+# resolución completa (30 m) aún no está lista
+anios_stats = tuple(sorted(set(anios_sel)))
+futuro_serie = pool.submit(resultado_progresivo, serie_temporal, indice)
+futuro_stats = pool.submit(resultado_progresivo, estadisticas_anios, anios_stats)
+# Percentiles e histograma por píxel de todos los años, en un solo lote
+futuro_dist = pool.submit(
+    resultado_progresivo, distribucion_anios, indice, ANIOS_DISTRIBUCION
+)
+# Estadísticas de todas las zonas (si hay GeoJSON de zonas) × años
+futuro_zonas = pool.submit(resultado_progresivo, estadisticas_zonas, indice, anios_stats)
+futuros_capas = {
+    pool.submit(url_capa, anio, indice): i for i, anio in enumerate(anios_sel)
+}
 
-tab_mapas, tab_graficos = st.tabs(
-    ["Mapas y estadísticas", "Gráficos Analíticos"]
+tab_mapas, tab_graficos, tab_exportar = st.tabs(
+    ["Mapas y estadísticas", "Gráficos Analíticos", "Exportar"]
 )
 
 # ===============================
 # TAB 1 – MAPAS
 # ===============================
-with tab_mapas:
-    cols = st.columns(3)
-
-    for i, (col, anio) in enumerate(zip(cols, anios_sel)):
-        with col:
-            st.subheader(f"{indice} – {anio}")
-            img = obtener_indice(anio, indice)
-            tiles = img.getMapId(VIS_PARAMS[indice])
-
-            mapa = folium.Map(
-                location=[-16.42, -71.54],
-                zoom_start=11,
-                tiles="OpenStreetMap"
-            )
+# La opacidad y los mapas van en un fragmento: mover el deslizador solo
+# vuelve a ejecutar esta función, con las capas y las estadísticas ya
+# resueltas (sin serie, sin nuevas peticiones a GEE). Cada mapa base se
+# monta una vez por columna y solo se sustituye su capa.
+@st.fragment
+def columnas_anios(indice, anios_sel, futuros_capas, futuro_stats):
+    opacity = st.slider("Opacidad", 0.0, 1.0, 0.6, 0.1)
+
+    huecos_mapa = []
+    huecos_stats = []
+    for fila in range(0, len(anios_sel), COLUMNAS_POR_FILA):
+        cols = st.columns(COLUMNAS_POR_FILA)
+        for col, anio in zip(cols, anios_sel[fila:fila + COLUMNAS_POR_FILA]):
+            with col:
+                st.subheader(f"{indice} – {anio}")
+                huecos_mapa.append(st.empty())
+                huecos_stats.append(st.empty())
+
+    # Cada columna se rellena en cuanto llega su capa
+    for futuro in as_completed(futuros_capas):
+        i = futuros_capas[futuro]
+        with huecos_mapa[i]:
+            url_teselas = resultado(futuro, f"Capa {anios_sel[i]}")
+        if url_teselas is FALLIDO:
+            continue
+        if url_teselas is None:
+            huecos_mapa[i].warning("Sin escenas Landsat útiles este año.")
+            continue
+
+        mapa = folium.Map(
+            location=[-16.42, -71.54],
+            zoom_start=11,
+            tiles="OpenStreetMap"
+        )
 
-            folium.TileLayer(
-                tiles=tiles["tile_fetcher"].url_format,
-                attr="Google Earth Engine",
-                opacity=opacity
-            ).add_to(mapa)
+        capa = folium.FeatureGroup(name="Índice")
+        folium.TileLayer(
+            tiles=url_teselas,
+            attr="Google Earth Engine",
+            opacity=opacity
+        ).add_to(capa)
 
+        with huecos_mapa[i]:
             st_folium(
                 mapa,
                 width=450,
                 height=380,
-                key=f"mapa_{indice}_{anio}_{i}"
-            )   
-
-            stats = estadisticas_indice(anio, indice)
-            st.markdown(
-                f"""
-                **Promedio:** {stats[indice+'_mean']:.3f}  
-                **Mínimo:** {stats[indice+'_min']:.3f}  
-                **Máximo:** {stats[indice+'_max']:.3f}
-                """
+                key=f"mapa_{i}",
+                feature_group_to_add=capa,
+                returned_objects=[]
             )
 
+    stats_anios, stats_aprox = resultado(futuro_stats, "Estadísticas", si_falla=({}, False))
+    marca = "≈ " if stats_aprox else ""
+    for i, anio in enumerate(anios_sel):
+        if anio not in stats_anios:
+            continue
+        stats = estadisticas_indice(anio, indice, stats_anios[anio])
+        if stats.get(indice + "_mean") is None:
+            continue
+        huecos_stats[i].markdown(
+            f"""
+            **Promedio:** {marca}{stats[indice+'_mean']:.3f}  
+            **Mínimo:** {marca}{stats[indice+'_min']:.3f}  
+            **Máximo:** {marca}{stats[indice+'_max']:.3f}
+            """
+        )
+
+
+with tab_mapas:
+    columnas_anios(indice, anios_sel, futuros_capas, futuro_stats)
+    # Si falló, el aviso ya está en las columnas de los mapas
+    stats_aprox = futuro_stats.exception() is None and futuro_stats.result()[1]
+
+    descargar_compuestos_locales(anios_sel)
+
+    serie, serie_aprox = resultado(futuro_serie, "Serie temporal", si_falla=([], False))
+    distribucion, dist_aprox = resultado(futuro_dist, "Distribución", si_falla=({}, False))
+    stats_zonas, zonas_aprox = resultado(
+        futuro_zonas, "Estadísticas por zona", si_falla=(None, False)
+    )
+    pool.shutdown(wait=False)
+
+    # (función, argumentos, aproximado) de cada resultado progresivo
+    progresivos = [
+        (serie_temporal, (indice,), serie_aprox),
+        (estadisticas_anios, (anios_stats,), stats_aprox),
+        (distribucion_anios, (indice, ANIOS_DISTRIBUCION), dist_aprox),
+        (estadisticas_zonas, (indice, anios_stats), bool(stats_zonas) and zonas_aprox),
+    ]
+    # Si un cálculo completo falló se muestra el error y se deja su
+    # estimación, sin seguir esperándolo (se reintenta pasado un tiempo)
+    errores = [error_resolucion_completa(fn, *args) for fn, args, _ in progresivos]
+    errores = [e for e in errores if e is not None]
+    pendientes = [
+        (fn, args) for fn, args, aprox in progresivos
+        if aprox and error_resolucion_completa(fn, *args) is None
+    ]
+
+    if errores:
+        st.error(f"No se pudo calcular a resolución completa (30 m): {errores[0]}")
+    if pendientes:
+        st.caption("≈ Valores aproximados (300 m); calculando a resolución completa…")
+
+        # Cuando termina el cálculo completo se vuelve a ejecutar la página,
+        # que ya lo encuentra en caché y sustituye la estimación
+        @st.fragment(run_every=2)
+        def esperar_resolucion_completa():
+            if all(resolucion_completa_lista(fn, *args) for fn, args in pendientes):
+                st.rerun(scope="app")
+
+        esperar_resolucion_completa()
+    elif errores:
+        st.caption("≈ Valores aproximados (300 m)")
+
     st.divider()
     st.subheader("Evolución temporal (rango seleccionado)")
 
@@ -208,71 +245,279 @@ with tab_mapas:
     else:
         st.warning("No hay datos suficientes.")
 
+    if stats_zonas:
+        st.divider()
+        st.subheader(f"Promedio del {indice} por zona")
+
+        # Zonas en filas y años en columnas, desde un único lote
+        # (reduceRegions) para todas las zonas
+        nombres = sorted({z for por_zona in stats_zonas.values() for z in por_zona})
+        tabla = {"Zona": nombres}
+        for anio in anios_stats:
+            tabla[str(anio)] = [
+                (stats_zonas[anio].get(z) or {}).get("mean") for z in nombres
+            ]
+        st.dataframe(tabla, hide_index=True)
+        if zonas_aprox:
+            st.caption("≈ Valores aproximados (300 m)")
+
 # ===============================
 # TAB 2 – GRÁFICOS ANALÍTICOS
 # ===============================
 with tab_graficos:
+    # plotly solo se importa cuando se dibujan los gráficos analíticos
+    import plotly.graph_objects as go
+
     st.subheader(f"Evolución temporal del {indice}")
     completos = [d for d in serie if d["Valor"] is not None]
-    st.line_chart({str(d["Año"]): d["Valor"] for d in completos})
+
+    # Cambiar la resolución temporal solo redibuja este gráfico
+    @st.fragment
+    def grafico_granularidad(indice, completos):
+        granularidad = st.radio(
+            "Resolución temporal", list(GRANULARIDADES), horizontal=True
+        )
+        if granularidad == "anual":
+            st.line_chart({str(d["Año"]): d["Valor"] for d in completos})
+        else:
+            fina = serie_temporal(indice, granularidad=granularidad)
+            st.line_chart({
+                f"{d['Año']}-{d['Periodo']:02d}": d["Valor"]
+                for d in fina if d["Valor"] is not None
+            })
+            if granularidad == "estacional":
+                st.caption(
+                    "Estaciones: 01 = dic (del año anterior)–feb, 02 = mar–may, "
+                    "03 = jun–ago, 04 = sep–nov."
+                )
+
+    grafico_granularidad(indice, completos)
 
     st.divider()
-    st.subheader(f"Distribución del {indice} por periodos")
+    st.subheader(f"Distribución del {indice} por años")
 
     anios = [d["Año"] for d in completos]
     valores = [d["Valor"] for d in completos]
 
-    fig = go.Figure()
-    fig.add_trace(go.Box(y=[v for a,v in zip(anios,valores) if a<=2006], name="2000–2006", marker_color="red"))
-    fig.add_trace(go.Box(y=[v for a,v in zip(anios,valores) if 2007<=a<=2012], name="2007–2012", marker_color="orange"))
-    fig.add_trace(go.Box(y=[v for a,v in zip(anios,valores) if a>=2013], name="2013–2025", marker_color="green"))
+    # Cajas por año con los percentiles de todos los píxeles (ya calculados
+    # en el lote de distribución): caja p25–p75, bigotes p5–p95
+    con_datos = sorted(a for a, d in distribucion.items() if d and d["count"])
 
+    fig = go.Figure()
+    for nombre, inicio, fin, color in PERIODOS:
+        grupo = [a for a in con_datos if inicio <= a <= fin]
+        if not grupo:
+            continue
+        fig.add_trace(go.Box(
+            x=[str(a) for a in grupo],
+            lowerfence=[distribucion[a]["p5"] for a in grupo],
+            q1=[distribucion[a]["p25"] for a in grupo],
+            median=[distribucion[a]["p50"] for a in grupo],
+            q3=[distribucion[a]["p75"] for a in grupo],
+            upperfence=[distribucion[a]["p95"] for a in grupo],
+            mean=[distribucion[a]["mean"] for a in grupo],
+            sd=[distribucion[a]["stdDev"] for a in grupo],
+            name=nombre,
+            marker_color=color
+        ))
+
+    fig.update_layout(xaxis_title="Año", yaxis_title=indice)
     st.plotly_chart(fig, use_container_width=True)
+    st.caption(
+        f"{'≈ ' if dist_aprox else ''}Caja: percentiles 25–75 de los píxeles "
+        "de la zona; bigotes: percentiles 5–95."
+    )
+
+    # Elegir otro año solo redibuja el histograma, desde la misma caché
+    @st.fragment
+    def histograma_anio(indice, distribucion, con_datos):
+        anio = st.selectbox(
+            "Año del histograma", sorted(con_datos, reverse=True), key="anio_histograma"
+        )
+        bordes = bordes_histograma()
+        dist = distribucion[anio]
+
+        fig_hist = go.Figure(go.Bar(
+            x=[(a + b) / 2 for a, b in zip(bordes, bordes[1:])],
+            y=dist["hist"],
+            width=bordes[1] - bordes[0],
+            marker_color="seagreen"
+        ))
+        fig_hist.update_layout(
+            xaxis_title=indice,
+            yaxis_title="Píxeles",
+            showlegend=False
+        )
+        st.plotly_chart(fig_hist, use_container_width=True)
+        st.markdown(
+            f"""
+            **Píxeles válidos:** {dist['count']:,}  
+            **Mediana:** {dist['p50']:.3f}  
+            **Desviación estándar:** {dist['stdDev']:.3f}
+            """
+        )
+
+    if con_datos:
+        histograma_anio(indice, distribucion, con_datos)
+
+    # Escenas por año según el catálogo local (sin consultar a GEE): explica
+    # los huecos de la serie y la fiabilidad de cada compuesto
+    disponibles = disponibilidad_escenas()
+    if disponibles:
+        st.subheader("Escenas Landsat disponibles por año")
+        st.bar_chart(
+            {
+                "Útiles": {str(a): d["utiles"] for a, d in disponibles.items()},
+                "Descartadas por nubes": {
+                    str(a): d["escenas"] - d["utiles"] for a, d in disponibles.items()
+                },
+            },
+            stack=True
+        )
 
     st.divider()
     st.subheader(f"Análisis de anomalías del {indice}")
 
-    media = sum(valores) / len(valores)
-    std = (sum((v - media) ** 2 for v in valores) / len(valores)) ** 0.5
-    anom = [v - media for v in valores]
+    # Sin serie (p. ej. si falló su cálculo) no hay anomalías que dibujar
+    if not valores:
+        st.warning("No hay datos suficientes.")
+    else:
+        media = sum(valores) / len(valores)
+        std = (sum((v - media) ** 2 for v in valores) / len(valores)) ** 0.5
+        anom = [v - media for v in valores]
+
+        colores = []
+        for a in anom:
+            if abs(a) >= std:
+                colores.append("darkgreen" if a > 0 else "darkred")
+            elif abs(a) >= 0.5 * std:
+                colores.append("green" if a > 0 else "red")
+            else:
+                colores.append("lightgreen" if a > 0 else "lightcoral")
+
+        fig2 = go.Figure()
+
+        fig2.add_trace(go.Bar(
+            x=anios,
+            y=anom,
+            marker_color=colores,
+            name="Anomalía"
+        ))
+
+        fig2.add_hline(
+            y=0,
+            line_width=2,
+            line_color="black"
+        )
 
-    colores = []
-    for a in anom:
-        if abs(a) >= std:
-            colores.append("darkgreen" if a > 0 else "darkred")
-        elif abs(a) >= 0.5 * std:
-            colores.append("green" if a > 0 else "red")
-        else:
-            colores.append("lightgreen" if a > 0 else "lightcoral")
+        fig2.update_layout(
+            title=f"Anomalías del {indice} respecto al promedio histórico",
+            xaxis_title="Año",
+            yaxis_title="Anomalía",
+            showlegend=False
+        )
 
-    fig2 = go.Figure()
+        st.plotly_chart(fig2, use_container_width=True)
 
-    fig2.add_trace(go.Bar(
-        x=anios,
-        y=anom,
-        marker_color=colores,
-        name="Anomalía"
-    ))
+        st.markdown(
+            f"""
+            **Promedio histórico:** {media:.4f}  
+            **Desviación estándar:** {std:.4f}
+            """
+        )
 
-    fig2.add_hline(
-        y=0,
-        line_width=2,
-        line_color="black"
-    )
+    st.subheader(f"Anomalía por píxel del {indice}")
+
+    # Anomalía z de cada píxel respecto a su climatología 2000–2025: muestra
+    # dónde se concentra la degradación, no solo el promedio de la zona
+    @st.fragment
+    def mapa_anomalia(indice, anios_sel):
+        anio = st.selectbox("Año", sorted(anios_sel, reverse=True), key="anio_anomalia")
+        try:
+            url = url_anomalia(anio, indice)
+        except (CuotaAgotada, TimeoutError, ee.EEException) as e:
+            avisar_error("Mapa de anomalías", e)
+            return
+        if url is None:
+            if sin_escenas(anio):
+                st.warning(f"No hay escenas Landsat útiles de {anio}.")
+            else:
+                # Sin climatología persistida no se evalúa el grafo completo:
+                # su exportación ya está en marcha
+                st.info(
+                    f"La climatología del {indice} (2000–2025) se está calculando; "
+                    "el mapa de anomalías estará disponible cuando termine."
+                )
+            return
 
-    fig2.update_layout(
-        title=f"Anomalías del {indice} respecto al promedio histórico",
-        xaxis_title="Año",
-        yaxis_title="Anomalía",
-        showlegend=False
-    )
+        mapa = folium.Map(
+            location=[-16.42, -71.54],
+            zoom_start=11,
+            tiles="OpenStreetMap"
+        )
+
+        capa = folium.FeatureGroup(name="Anomalía")
+        folium.TileLayer(
+            tiles=url,
+            attr="Google Earth Engine",
+            opacity=0.8
+        ).add_to(capa)
+
+        st_folium(
+            mapa,
+            width=900,
+            height=450,
+            key="mapa_anomalia",
+            feature_group_to_add=capa,
+            returned_objects=[]
+        )
+        st.caption(
+            "z = (valor del año − media 2000–2025) / desviación estándar, por píxel. "
+            "Marrón: por debajo de lo habitual; verde azulado: por encima."
+        )
 
-    st.plotly_chart(fig2, use_container_width=True)
+    mapa_anomalia(indice, anios_sel)
 
-    st.markdown(
-        f"""
-        **Promedio histórico:** {media:.4f}  
-        **Desviación estándar:** {std:.4f}
-        """
+# ===============================
+# TAB 3 – EXPORTAR
+# ===============================
+def leer_archivo(ruta):
+    with open(ruta, "rb") as f:
+        return f.read()
+
+
+with tab_exportar:
+    # Los archivos se generan al pulsar cada botón (en otro hilo, sin
+    # volver a ejecutar la página) y se escriben por lotes en disco
+    st.subheader("Tablas")
+    formato = st.radio("Formato", list(FORMATOS), horizontal=True)
+    extension = FORMATOS[formato]
+    mime = "text/csv" if formato == "csv" else "application/vnd.apache.parquet"
+
+    rango_anios = tuple(range(min(anios_sel), max(anios_sel) + 1))
+    for nombre in TABLAS:
+        st.download_button(
+            f"Descargar {nombre} ({min(anios_sel)}–{max(anios_sel)})",
+            data=lambda nombre=nombre: leer_archivo(
+                exportar_tabla(nombre, indice, rango_anios, formato=formato)
+            ),
+            file_name=f"{nombre}_{indice}_{min(anios_sel)}-{max(anios_sel)}{extension}",
+            mime=mime,
+            key=f"exportar_{nombre}"
+        )
+
+    st.subheader("Rásteres")
+    st.download_button(
+        f"Descargar {indice} {', '.join(str(a) for a in sorted(anios_sel))} (GeoTIFF, ZIP)",
+        data=lambda: leer_archivo(zip_rasteres(sorted(anios_sel), indice)),
+        file_name=f"{indice}_{'-'.join(str(a) for a in sorted(anios_sel))}.zip",
+        mime="application/zip",
+        key="exportar_rasteres"
+    )
+    st.caption(
+        "Cada año se descarga por teselas GeoTIFF con su suma SHA-256 y un VRT "
+        "que las une; si la descarga se interrumpe, se reanuda donde quedó. "
+        "Para exportaciones grandes: `python -m Core.exportar rasteres`."
     )
 
+panel_depuracion()
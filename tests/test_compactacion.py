@@ -0,0 +1,123 @@
+"""
+Compactación de las respuestas de GEE antes de guardarlas en el almacén
+(Core.datos): distribución por píxel (percentiles e histograma) y
+estadísticas por zona.
+"""
+import pytest
+
+from Core.datos import compactar_distribucion, compactar_zonas
+from Core.indices import HISTOGRAMA, PERCENTILES
+
+
+def _histograma(conteos):
+    """fixedHistogram de GEE: filas [límite inferior, conteo]"""
+    ancho = (HISTOGRAMA["max"] - HISTOGRAMA["min"]) / len(conteos)
+    return [[HISTOGRAMA["min"] + i * ancho, c] for i, c in enumerate(conteos)]
+
+
+def _respuesta(indice="NDVI", **cambios):
+    props = {
+        f"{indice}_count": 1234.0,
+        f"{indice}_mean": 0.31,
+        f"{indice}_stdDev": 0.12,
+        f"{indice}_histogram": _histograma([0.0, 10.5, 1200.25, 23.25]),
+    }
+    props.update({f"{indice}_p{p}": p / 100 for p in PERCENTILES})
+    props.update(cambios)
+    return props
+
+
+# ===============================
+# DISTRIBUCIÓN
+# ===============================
+def test_distribucion_guarda_solo_valores():
+    dist = compactar_distribucion(_respuesta(), "NDVI")
+
+    assert dist["count"] == 1234 and isinstance(dist["count"], int)
+    assert dist["mean"] == 0.31
+    assert dist["stdDev"] == 0.12
+    # Sin los límites de cada bin: son fijos (HISTOGRAMA)
+    assert dist["hist"] == [0.0, 10.5, 1200.25, 23.25]
+    assert all(isinstance(c, float) for c in dist["hist"])
+
+
+def test_distribucion_conserva_conteos_fraccionarios():
+    # reduceRegion pondera los píxeles del borde: el histograma suma el total
+    dist = compactar_distribucion(_respuesta(), "NDVI")
+
+    assert sum(dist["hist"]) == pytest.approx(1234.0)
+
+
+@pytest.mark.parametrize("p", PERCENTILES)
+def test_distribucion_percentiles(p):
+    assert compactar_distribucion(_respuesta(), "NDVI")[f"p{p}"] == p / 100
+
+
+def test_distribucion_solo_del_indice_pedido():
+    props = _respuesta("NDVI")
+    props.update(_respuesta("EVI", EVI_mean=-0.5))
+
+    assert compactar_distribucion(props, "EVI")["mean"] == -0.5
+    assert compactar_distribucion(props, "NDVI")["mean"] == 0.31
+
+
+def test_distribucion_sin_pixeles():
+    # Año sin píxeles válidos: GEE devuelve nulos y ningún histograma
+    props = {f"NDVI_p{p}": None for p in PERCENTILES}
+    props.update({"NDVI_count": None, "NDVI_mean": None, "NDVI_stdDev": None})
+    dist = compactar_distribucion(props, "NDVI")
+
+    assert dist["count"] == 0
+    assert dist["hist"] is None
+    assert dist["mean"] is None and dist["stdDev"] is None
+    assert all(dist[f"p{p}"] is None for p in PERCENTILES)
+
+
+def test_distribucion_vacia():
+    # Un año que no llegó en el lote se compacta desde {}
+    dist = compactar_distribucion({}, "NDVI")
+
+    assert dist["count"] == 0 and dist["hist"] is None
+
+
+# ===============================
+# ZONAS
+# ===============================
+def _fila(zona, **valores):
+    fila = {"zona": zona, "Año": 2020, "mean": 0.4, "min": 0.1, "max": 0.8,
+            "stdDev": 0.2, "count": 57.0}
+    fila.update(valores)
+    return fila
+
+
+def test_zonas_por_nombre():
+    compactas = compactar_zonas([_fila("norte"), _fila("sur", mean=0.1)])
+
+    assert set(compactas) == {"norte", "sur"}
+    assert compactas["norte"] == {"mean": 0.4, "min": 0.1, "max": 0.8, "stdDev": 0.2, "count": 57}
+    assert compactas["sur"]["mean"] == 0.1
+
+
+def test_zonas_sin_propiedades_de_gee():
+    # Sin "Año" ni otras propiedades del Feature: solo las estadísticas
+    assert set(compactar_zonas([_fila("norte", extra=1)])["norte"]) == {
+        "mean", "min", "max", "stdDev", "count"
+    }
+
+
+def test_zonas_sin_pixeles_validos():
+    # reduceRegions omite las estadísticas de las zonas sin píxeles
+    compactas = compactar_zonas([{"zona": "fuera", "Año": 2020}])
+
+    assert compactas["fuera"] == {
+        "mean": None, "min": None, "max": None, "stdDev": None, "count": 0
+    }
+
+
+def test_zonas_conteo_entero():
+    assert compactar_zonas([_fila("norte", count=12.0)])["norte"]["count"] == 12
+    assert isinstance(compactar_zonas([_fila("norte", count=12.0)])["norte"]["count"], int)
+
+
+def test_zonas_sin_filas():
+    assert compactar_zonas([]) == {}
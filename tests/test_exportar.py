@@ -0,0 +1,161 @@
+"""
+Exportación de rásteres por teselas (Core.exportar.exportar_raster):
+manifiesto con el SHA-256 de cada tesela, VRT y reanudación de una
+exportación interrumpida o con teselas dañadas.
+"""
+import hashlib
+import json
+import os
+
+import pytest
+
+from Core import almacen, compuestos_locales, exportar
+
+# ~0.2° × 0.2°: 2 × 2 teselas de la rejilla de compuestos_locales
+LIMITES = [-71.6, -16.5, -71.4, -16.3]
+
+
+class _Indice:
+    def toFloat(self):
+        return self
+
+    def unmask(self, valor):
+        return self
+
+
+class _GEE:
+    """llamada_ee falsa: el contenido de cada tesela depende de su posición"""
+
+    def __init__(self, fallar_tras=None):
+        self.llamadas = []
+        self.fallar_tras = fallar_tras
+
+    def __call__(self, nombre, clave, funcion, peticion):
+        if self.fallar_tras is not None and len(self.llamadas) >= self.fallar_tras:
+            raise TimeoutError("GEE no responde")
+        self.llamadas.append(clave)
+        return f"tif {clave}".encode()
+
+
+@pytest.fixture
+def gee(monkeypatch):
+    falso = _GEE()
+    monkeypatch.setattr(exportar, "zona_estudio_proceso", lambda: {"limites": list(LIMITES)})
+    monkeypatch.setattr(exportar.datos, "obtener_indice", lambda anio, indice: _Indice())
+    monkeypatch.setattr(exportar, "llamada_ee", falso)
+    return falso
+
+
+def _teselas():
+    return compuestos_locales.rejilla(LIMITES)[3]
+
+
+def _manifiesto(tmp_path):
+    with open(os.path.join(exportar._directorio_raster(str(tmp_path), 2020, "NDVI"), "manifiesto.json")) as f:
+        return json.load(f)
+
+
+def _exportar(tmp_path, **opciones):
+    return exportar.exportar_raster(2020, "NDVI", destino=str(tmp_path), hilos=2, **opciones)
+
+
+# ===============================
+# PRIMERA EXPORTACIÓN
+# ===============================
+def test_exporta_todas_las_teselas(tmp_path, gee):
+    manifiesto = _exportar(tmp_path)
+    directorio = exportar._directorio_raster(str(tmp_path), 2020, "NDVI")
+
+    assert len(_teselas()) == 4
+    assert len(gee.llamadas) == 4
+    assert manifiesto["completo"]
+    assert manifiesto["version"] == almacen.VERSION
+    assert _manifiesto(tmp_path) == manifiesto
+    for tesela in manifiesto["teselas"].values():
+        with open(os.path.join(directorio, tesela["archivo"]), "rb") as f:
+            contenido = f.read()
+        assert tesela["bytes"] == len(contenido)
+        assert tesela["sha256"] == hashlib.sha256(contenido).hexdigest()
+    assert not [n for n in os.listdir(directorio) if n.endswith(".tmp")]
+
+
+def test_vrt_con_todas_las_teselas(tmp_path, gee):
+    manifiesto = _exportar(tmp_path)
+    directorio = exportar._directorio_raster(str(tmp_path), 2020, "NDVI")
+
+    with open(os.path.join(directorio, "NDVI_2020.vrt")) as f:
+        vrt = f.read()
+
+    assert f'rasterXSize="{manifiesto["columnas"]}"' in vrt
+    assert f'rasterYSize="{manifiesto["filas"]}"' in vrt
+    assert vrt.count("<SimpleSource>") == 4
+    for tesela in manifiesto["teselas"].values():
+        assert tesela["archivo"] in vrt
+
+
+def test_progreso(tmp_path, gee):
+    avances = []
+    _exportar(tmp_path, progreso=lambda hechas, total: avances.append((hechas, total)))
+
+    assert sorted(avances) == [(1, 4), (2, 4), (3, 4), (4, 4)]
+
+
+# ===============================
+# REANUDACIÓN
+# ===============================
+def test_repetir_no_descarga(tmp_path, gee):
+    _exportar(tmp_path)
+    gee.llamadas.clear()
+
+    assert _exportar(tmp_path)["completo"]
+    assert gee.llamadas == []
+
+
+def test_tesela_danada_se_descarga_de_nuevo(tmp_path, gee):
+    manifiesto = _exportar(tmp_path)
+    directorio = exportar._directorio_raster(str(tmp_path), 2020, "NDVI")
+    danada = manifiesto["teselas"]["0_0"]
+    with open(os.path.join(directorio, danada["archivo"]), "wb") as f:
+        f.write(b"truncada")
+    os.remove(os.path.join(directorio, manifiesto["teselas"]["0_512"]["archivo"]))
+    gee.llamadas.clear()
+
+    reanudado = _exportar(tmp_path)
+
+    assert sorted(gee.llamadas) == [(2020, "NDVI", 0, 0), (2020, "NDVI", 0, 512)]
+    assert reanudado["teselas"]["0_0"]["sha256"] == danada["sha256"]
+
+
+def test_interrumpida_y_reanudada(tmp_path, gee):
+    gee.fallar_tras = 1
+    with pytest.raises(TimeoutError):
+        exportar.exportar_raster(2020, "NDVI", destino=str(tmp_path), hilos=1)
+
+    # El manifiesto anota solo la tesela escrita y no está completo
+    parcial = _manifiesto(tmp_path)
+    assert not parcial["completo"]
+    assert len(parcial["teselas"]) == 1
+
+    gee.fallar_tras = None
+    gee.llamadas.clear()
+    completo = _exportar(tmp_path)
+
+    assert completo["completo"]
+    assert len(gee.llamadas) == 3
+    assert set(completo["teselas"]) == {f"{f}_{c}" for f, c, _, _ in _teselas()}
+
+
+@pytest.mark.parametrize("cambio", [
+    {"version": almacen.VERSION - 1},
+    {"limites": [-72.0, -17.0, -71.8, -16.8]},
+])
+def test_manifiesto_de_otra_exportacion(tmp_path, gee, cambio):
+    _exportar(tmp_path)
+    directorio = exportar._directorio_raster(str(tmp_path), 2020, "NDVI")
+    manifiesto = dict(_manifiesto(tmp_path), **cambio)
+    exportar._escribir_json(os.path.join(directorio, "manifiesto.json"), manifiesto)
+    gee.llamadas.clear()
+
+    # Otra versión u otra zona: ninguna tesela anterior vale
+    assert _exportar(tmp_path)["completo"]
+    assert len(gee.llamadas) == 4
@@ -0,0 +1,245 @@
+"""
+El motor NumPy (Core.indices_np) frente a las fórmulas de GEE
+(Core/indices.py): valores de referencia, máscaras, división por cero,
+NaN/nodata, bloques de filas y estadísticas por bloques.
+"""
+import numpy as np
+import pytest
+
+from Core.indices_np import (
+    BANDAS,
+    BANDAS_INDICE,
+    calcular_indice_np,
+    distribucion_np,
+    estadisticas_np,
+)
+
+
+def _bandas(forma, valores):
+    return {b: np.full(forma, valores[b], dtype=np.float32) for b in BANDAS}
+
+
+def _aleatorias(filas=37, columnas=23, semilla=0):
+    rng = np.random.default_rng(semilla)
+    return {b: rng.uniform(0.0, 0.6, (filas, columnas)).astype(np.float32) for b in BANDAS}
+
+
+# Referencia píxel a píxel con las expresiones de GEE. normalizedDifference
+# enmascara (None) si alguna banda es negativa; divide da 0 con
+# denominador 0.
+def _dn(a, b):
+    if a < 0 or b < 0:
+        return None
+    return (a - b) / (a + b) if a + b != 0 else 0.0
+
+
+def _div(num, den):
+    return num / den if den != 0 else 0.0
+
+
+REFERENCIA = {
+    "NDVI": lambda p: _dn(p["NIR"], p["RED"]),
+    "SAVI": lambda p: _div(p["NIR"] - p["RED"], p["NIR"] + p["RED"] + 0.5) * 1.5,
+    "EVI": lambda p: 2.5 * _div(p["NIR"] - p["RED"], p["NIR"] + 6 * p["RED"] - 7.5 * p["BLUE"] + 1),
+    "GNDVI": lambda p: _dn(p["NIR"], p["GREEN"]),
+    "LSWI": lambda p: _dn(p["NIR"], p["SWIR1"]),
+    "NDWI": lambda p: _dn(p["GREEN"], p["NIR"]),
+    "MNDWI": lambda p: _dn(p["GREEN"], p["SWIR1"]),
+}
+
+
+def _referencia(bandas, nombre):
+    filas, columnas = bandas["NIR"].shape
+    salida = np.empty((filas, columnas), dtype=np.float64)
+    for i in range(filas):
+        for j in range(columnas):
+            pixel = {b: float(v[i, j]) for b, v in bandas.items()}
+            valor = None if any(np.isnan(x) for x in pixel.values()) else REFERENCIA[nombre](pixel)
+            salida[i, j] = np.nan if valor is None else valor
+    return salida
+
+
+# ===============================
+# FÓRMULAS
+# ===============================
+PIXEL = {"BLUE": 0.05, "GREEN": 0.2, "RED": 0.1, "NIR": 0.5, "SWIR1": 0.3, "SWIR2": 0.25}
+
+ESPERADOS = {
+    "NDVI": 0.4 / 0.6,
+    "SAVI": 0.4 / 1.1 * 1.5,
+    "EVI": 2.5 * 0.4 / 1.725,
+    "GNDVI": 0.3 / 0.7,
+    "LSWI": 0.2 / 0.8,
+    "NDWI": -0.3 / 0.7,
+    "MNDWI": -0.1 / 0.5,
+}
+
+
+@pytest.mark.parametrize("nombre", list(BANDAS_INDICE))
+def test_valores_de_referencia(nombre):
+    resultado = calcular_indice_np(_bandas((2, 3), PIXEL), nombre)
+    assert resultado.dtype == np.float32
+    np.testing.assert_allclose(resultado, ESPERADOS[nombre], rtol=1e-6)
+
+
+@pytest.mark.parametrize("nombre", list(BANDAS_INDICE))
+def test_coincide_con_expresiones_gee(nombre):
+    bandas = _aleatorias()
+    # Algunos negativos (reflectancias con ruido) y denominadores nulos
+    bandas["RED"][0, :5] = -0.05
+    bandas["GREEN"][1, :5] = -0.05
+    bandas["NIR"][2, :5] = 0.0
+    bandas["RED"][2, :5] = 0.0
+    bandas["GREEN"][2, :5] = 0.0
+    bandas["SWIR1"][2, :5] = 0.0
+
+    np.testing.assert_allclose(
+        calcular_indice_np(bandas, nombre), _referencia(bandas, nombre),
+        rtol=1e-5, atol=1e-6, equal_nan=True
+    )
+
+
+@pytest.mark.parametrize("nombre", ["NDVI", "GNDVI", "LSWI", "NDWI", "MNDWI"])
+def test_diferencia_normalizada_enmascara_negativos(nombre):
+    a, b = BANDAS_INDICE[nombre]
+    bandas = _bandas((1, 2), PIXEL)
+    bandas[a][0, 0] = -0.01
+    bandas[b][0, 1] = -0.01
+
+    assert np.isnan(calcular_indice_np(bandas, nombre)).all()
+
+
+def test_expresiones_no_enmascaran_negativos():
+    # SAVI y EVI son expresiones: GEE no enmascara los negativos
+    bandas = _bandas((1, 1), PIXEL)
+    bandas["RED"][0, 0] = -0.01
+
+    assert not np.isnan(calcular_indice_np(bandas, "SAVI")).any()
+    assert not np.isnan(calcular_indice_np(bandas, "EVI")).any()
+
+
+@pytest.mark.parametrize("nombre", ["NDVI", "GNDVI", "LSWI", "NDWI", "MNDWI"])
+def test_division_por_cero_devuelve_cero(nombre):
+    ceros = {b: 0.0 for b in BANDAS}
+    assert calcular_indice_np(_bandas((2, 2), ceros), nombre).tolist() == [[0.0, 0.0], [0.0, 0.0]]
+
+
+def test_division_por_cero_en_expresiones():
+    # NIR + RED + 0.5 = 0 (SAVI) y NIR + 6 RED - 7.5 BLUE + 1 = 0 (EVI)
+    savi = dict(PIXEL, NIR=-0.25, RED=-0.25)
+    evi = dict(PIXEL, NIR=0.875, RED=0.0, BLUE=0.25)
+
+    assert calcular_indice_np(_bandas((1, 1), savi), "SAVI")[0, 0] == 0.0
+    assert calcular_indice_np(_bandas((1, 1), evi), "EVI")[0, 0] == 0.0
+
+
+@pytest.mark.parametrize("nombre", list(BANDAS_INDICE))
+def test_nan_y_nodata_enmascaran(nombre):
+    bandas = _bandas((2, 2), PIXEL)
+    usada = BANDAS_INDICE[nombre][0]
+    bandas[usada][0, 0] = np.nan
+    bandas[usada][0, 1] = -9999
+
+    resultado = calcular_indice_np(bandas, nombre, nodata=-9999)
+
+    assert np.isnan(resultado[0]).all()
+    np.testing.assert_allclose(resultado[1], ESPERADOS[nombre], rtol=1e-6)
+
+
+def test_banda_no_usada_no_enmascara():
+    bandas = _bandas((1, 1), PIXEL)
+    bandas["SWIR2"][0, 0] = np.nan
+
+    assert not np.isnan(calcular_indice_np(bandas, "NDVI")).any()
+
+
+def test_mascara_externa():
+    mascara = np.array([[True, False], [False, True]])
+    resultado = calcular_indice_np(_bandas((2, 2), PIXEL), "NDVI", mascara=mascara)
+
+    assert np.isnan(resultado).tolist() == [[False, True], [True, False]]
+
+
+def test_indice_no_soportado():
+    with pytest.raises(ValueError):
+        calcular_indice_np(_bandas((1, 1), PIXEL), "NBR")
+
+
+@pytest.mark.parametrize("filas_bloque", [1, 5, 36, 37, 512])
+@pytest.mark.parametrize("nombre", list(BANDAS_INDICE))
+def test_bloques_de_filas(nombre, filas_bloque):
+    bandas = _aleatorias()
+    bandas["NIR"][::7, ::3] = np.nan
+    completo = calcular_indice_np(bandas, nombre, filas_bloque=10**6)
+
+    salida = np.full(completo.shape, -1.0, dtype=np.float32)
+    por_bloques = calcular_indice_np(bandas, nombre, salida=salida, filas_bloque=filas_bloque)
+
+    assert por_bloques is salida
+    np.testing.assert_array_equal(por_bloques, completo)
+
+
+# ===============================
+# ESTADÍSTICAS Y DISTRIBUCIÓN
+# ===============================
+def _valores(semilla=1):
+    rng = np.random.default_rng(semilla)
+    valores = rng.normal(0.3, 0.2, (101, 57)).astype(np.float32)
+    valores[rng.random(valores.shape) < 0.1] = np.nan
+    valores[:3] = np.nan  # un bloque entero vacío
+    return valores
+
+
+@pytest.mark.parametrize("filas_bloque", [1, 7, 64, 512])
+def test_estadisticas_np(filas_bloque):
+    valores = _valores()
+    stats = estadisticas_np(valores, "NDVI", filas_bloque=filas_bloque)
+    referencia = valores.astype(np.float64)
+
+    assert stats["NDVI_mean"] == pytest.approx(np.nanmean(referencia), rel=1e-9)
+    assert stats["NDVI_stdDev"] == pytest.approx(np.nanstd(referencia), rel=1e-9)
+    assert stats["NDVI_min"] == pytest.approx(np.nanmin(referencia))
+    assert stats["NDVI_max"] == pytest.approx(np.nanmax(referencia))
+
+
+def test_estadisticas_np_sin_datos():
+    stats = estadisticas_np(np.full((4, 4), np.nan, dtype=np.float32), "NDVI")
+
+    assert stats == {"NDVI_mean": None, "NDVI_min": None, "NDVI_max": None, "NDVI_stdDev": None}
+
+
+@pytest.mark.parametrize("filas_bloque", [1, 7, 64, 512])
+def test_distribucion_np(filas_bloque):
+    valores = _valores()
+    validos = valores[~np.isnan(valores)].astype(np.float64)
+    dist = distribucion_np(valores, -1.0, 1.0, 40, filas_bloque=filas_bloque)
+
+    assert dist["count"] == validos.size
+    assert dist["mean"] == pytest.approx(validos.mean(), rel=1e-9)
+    assert dist["stdDev"] == pytest.approx(validos.std(), rel=1e-9)
+    assert dist["hist"] == np.histogram(validos, 40, (-1.0, 1.0))[0].tolist()
+
+    # Interpolados sobre el histograma fino: error menor que un intervalo
+    ancho = 2.0 / 2000
+    for p in (5, 25, 50, 75, 95):
+        assert dist[f"p{p}"] == pytest.approx(np.percentile(validos, p), abs=2 * ancho)
+
+
+def test_distribucion_np_fuera_de_rango():
+    valores = np.array([[-2.0, 0.0, 0.5, 3.0]], dtype=np.float32)
+    dist = distribucion_np(valores, -1.0, 1.0, 4)
+
+    # Fuera de rango: no cuentan en "hist", sí en count y en los extremos
+    assert dist["count"] == 4
+    assert dist["hist"] == [0, 0, 1, 1]
+    assert dist["p5"] == pytest.approx(-1.0, abs=1e-3)
+    assert dist["p95"] == pytest.approx(1.0, abs=1e-3)
+
+
+def test_distribucion_np_sin_datos():
+    dist = distribucion_np(np.full((3, 3), np.nan, dtype=np.float32), -1.0, 1.0, 10)
+
+    assert dist["count"] == 0
+    assert dist["mean"] is None and dist["stdDev"] is None
+    assert dist["hist"] == [0] * 10
+    assert all(dist[f"p{p}"] is None for p in (5, 25, 50, 75, 95))
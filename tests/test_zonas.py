@@ -0,0 +1,150 @@
+"""
+Máscaras de las zonas sobre la rejilla de un compuesto local
+(Core.zonas.mascaras): ventana de cada zona, píxeles por centro dentro
+del polígono (con huecos), zonas fuera de la rejilla y caché.
+"""
+import json
+
+import numpy as np
+import pytest
+
+from Core import zonas
+
+# Rejilla de 10 × 10 píxeles de 0.1° desde (0, 1) hacia el sureste
+META = {"transformada": [0.1, 0, 0.0, 0, -0.1, 1.0], "filas": 10, "columnas": 10}
+
+
+def _cuadrado(o, s, e, n):
+    return [[o, s], [e, s], [e, n], [o, n], [o, s]]
+
+
+def _poligono(*anillos):
+    return {"type": "Polygon", "coordinates": list(anillos)}
+
+
+def _conjunto(tmp_path, geometrias):
+    ruta = tmp_path / "zonas.geojson"
+    ruta.write_text(json.dumps({
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "properties": {"nombre": nombre}, "geometry": geometria}
+            for nombre, geometria in geometrias.items()
+        ],
+    }))
+    return zonas.cargar_zonas(str(ruta))
+
+
+def _por_nombre(resultado):
+    return {zona["nombre"]: (ventana, mascara) for zona, ventana, mascara in resultado}
+
+
+def _en_rejilla(ventana, mascara, meta=META):
+    """La máscara de la ventana colocada sobre toda la rejilla"""
+    f0, f1, c0, c1 = ventana
+    completa = np.zeros((meta["filas"], meta["columnas"]), dtype=bool)
+    completa[f0:f1, c0:c1] = mascara
+    return completa
+
+
+# ===============================
+# VENTANAS Y MÁSCARAS
+# ===============================
+def test_cuadrado_alineado_con_la_rejilla(tmp_path):
+    # Columnas 2–4 (lon 0.2–0.5) y filas 1–2 (lat 0.7–0.9)
+    conjunto = _conjunto(tmp_path, {"a": _poligono(_cuadrado(0.2, 0.7, 0.5, 0.9))})
+    esperada = np.zeros((10, 10), dtype=bool)
+    esperada[1:3, 2:5] = True
+
+    ventana, mascara = _por_nombre(zonas.mascaras(conjunto, META))["a"]
+    f0, f1, c0, c1 = ventana
+
+    # La ventana puede llevar un píxel de margen; la máscara, no
+    assert f0 <= 1 and f1 >= 3 and c0 <= 2 and c1 >= 5
+    assert mascara.shape == (f1 - f0, c1 - c0)
+    np.testing.assert_array_equal(_en_rejilla(ventana, mascara), esperada)
+
+
+def test_mascara_por_centro_de_pixel(tmp_path):
+    # Triángulo lon + lat < 1.02: ningún centro cae sobre la hipotenusa
+    triangulo = _poligono([[0.0, 0.0], [1.02, 0.0], [0.0, 1.02], [0.0, 0.0]])
+    conjunto = _conjunto(tmp_path, {"t": triangulo})
+    lon = (np.arange(10) + 0.5) * 0.1
+    lat = 1.0 - (np.arange(10) + 0.5) * 0.1
+
+    ventana, mascara = _por_nombre(zonas.mascaras(conjunto, META))["t"]
+
+    # Recortada a la rejilla aunque el triángulo se salga
+    assert ventana == (0, 10, 0, 10)
+    np.testing.assert_array_equal(mascara, lon[None, :] + lat[:, None] < 1.02)
+
+
+def test_huecos_restan(tmp_path):
+    exterior = _cuadrado(0.0, 0.0, 1.0, 1.0)
+    hueco = _cuadrado(0.3, 0.3, 0.7, 0.7)
+    conjunto = _conjunto(tmp_path, {"anillo": _poligono(exterior, hueco)})
+
+    ventana, mascara = _por_nombre(zonas.mascaras(conjunto, META))["anillo"]
+    completa = _en_rejilla(ventana, mascara)
+
+    assert completa.sum() == 100 - 16
+    assert not completa[3:7, 3:7].any()
+
+
+def test_multipoligono(tmp_path):
+    geometria = {"type": "MultiPolygon", "coordinates": [
+        [_cuadrado(0.0, 0.9, 0.1, 1.0)], [_cuadrado(0.9, 0.0, 1.0, 0.1)],
+    ]}
+    conjunto = _conjunto(tmp_path, {"m": geometria})
+
+    ventana, mascara = _por_nombre(zonas.mascaras(conjunto, META))["m"]
+    completa = _en_rejilla(ventana, mascara)
+
+    # Una ventana que cubre ambas partes, con solo sus dos píxeles
+    assert completa.sum() == 2
+    assert completa[0, 0] and completa[9, 9]
+
+
+def test_zona_recortada_al_borde(tmp_path):
+    conjunto = _conjunto(tmp_path, {"borde": _poligono(_cuadrado(-0.5, 0.8, 0.2, 1.5))})
+    esperada = np.zeros((10, 10), dtype=bool)
+    esperada[0:2, 0:2] = True
+
+    ventana, mascara = _por_nombre(zonas.mascaras(conjunto, META))["borde"]
+
+    assert ventana[0] == 0 and ventana[2] == 0
+    np.testing.assert_array_equal(_en_rejilla(ventana, mascara), esperada)
+
+
+def test_zona_fuera_de_la_rejilla(tmp_path):
+    conjunto = _conjunto(tmp_path, {
+        "dentro": _poligono(_cuadrado(0.0, 0.0, 0.5, 0.5)),
+        "fuera": _poligono(_cuadrado(2.0, 2.0, 3.0, 3.0)),
+    })
+
+    assert set(_por_nombre(zonas.mascaras(conjunto, META))) == {"dentro"}
+
+
+# ===============================
+# CACHÉ Y CARGA
+# ===============================
+def test_mascaras_cacheadas_por_rejilla(tmp_path):
+    conjunto = _conjunto(tmp_path, {"a": _poligono(_cuadrado(0.2, 0.2, 0.6, 0.6))})
+
+    primera = zonas.mascaras(conjunto, META)
+    assert zonas.mascaras(conjunto, dict(META)) is primera
+
+    # Otra rejilla (otro compuesto): otras ventanas
+    fina = {"transformada": [0.05, 0, 0.0, 0, -0.05, 1.0], "filas": 20, "columnas": 20}
+    otra = zonas.mascaras(conjunto, fina)
+    assert otra is not primera
+    assert _en_rejilla(*_por_nombre(otra)["a"], meta=fina).sum() == 8 * 8
+
+
+def test_nombres_repetidos(tmp_path):
+    ruta = tmp_path / "zonas.geojson"
+    feature = {"type": "Feature", "properties": {"nombre": "a"},
+               "geometry": _poligono(_cuadrado(0.0, 0.0, 0.5, 0.5))}
+    ruta.write_text(json.dumps({"type": "FeatureCollection", "features": [feature, feature]}))
+
+    with pytest.raises(ValueError):
+        zonas.cargar_zonas(str(ruta))